@@ -0,0 +1,9 @@
+"""
+Scheduler benchmarks.
+
+    python -m benchmarks.run --output baseline.json
+    python -m benchmarks.run --compare baseline.json
+
+Every run builds a seeded synthetic institution (see `benchmarks.synthetic`)
+in an in-memory database, so results do not depend on instance/timetable.db.
+"""
@@ -0,0 +1,170 @@
+"""
+Runs the scheduler against synthetic institutions of several sizes.
+
+Each scale is generated once per seed into a fresh in-memory database and
+solved with the result cache disabled. Results can be written to a JSON
+baseline and later compared against it; the comparison exits with status 1
+when a scale got slower, heavier or less successful than the tolerance allows.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from flask import Flask
+from models import db
+from scheduler import Scheduler
+from problem import session_count
+from solver import SOLVERS, HEURISTICS
+from benchmarks.synthetic import generate_institution
+
+SCALES = {
+    'small': {'departments': 4, 'sections': 1},
+    'medium': {'departments': 10, 'sections': 2},
+    'large': {'departments': 20, 'sections': 2},
+}
+
+# Timings below this many seconds are too noisy to call a regression.
+MIN_SIGNIFICANT_SECONDS = 0.01
+
+
+def _make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def run_once(scale, solver, seed, density=0.8, trace_memory=False):
+    """Generates and solves one institution; returns a result dict."""
+    app = _make_app()
+    with app.app_context():
+        db.create_all()
+        summary = generate_institution(seed=seed, density=density, **SCALES[scale])
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        scheduler = Scheduler(solver=solver, seed=seed, use_cache=False)
+        success = scheduler.generate_timetable()
+        total = time.perf_counter() - started
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        save_seconds = scheduler.save_stats['seconds'] if scheduler.save_stats else 0.0
+        db.session.remove()
+        db.drop_all()
+    return {
+        'success': bool(success),
+        'solve_seconds': total - save_seconds,
+        'save_seconds': save_seconds,
+        'requirements': session_count(scheduler.requirements),
+        'peak_memory_mb': peak / 2 ** 20 if peak is not None else None,
+        'institution': summary,
+        'stats': scheduler.stats.to_dict(),
+    }
+
+
+def run_scale(scale, solver, repeat, density):
+    runs = [run_once(scale, solver, seed, density) for seed in range(repeat)]
+    # Memory is traced in a separate run so tracemalloc does not skew timings.
+    memory = run_once(scale, solver, 0, density, trace_memory=True)['peak_memory_mb']
+    solved = [r for r in runs if r['success']]
+    phases = sorted({name for r in runs for name in r['stats']['phases']})
+    return {
+        'requirements': runs[0]['requirements'],
+        'institution': runs[0]['institution'],
+        'runs': repeat,
+        'success_rate': len(solved) / repeat,
+        'solve_seconds_median': statistics.median(r['solve_seconds'] for r in runs),
+        'solve_seconds_max': max(r['solve_seconds'] for r in runs),
+        'save_seconds_median': statistics.median(r['save_seconds'] for r in solved) if solved else None,
+        'peak_memory_mb': memory,
+        'phase_seconds_median': {name: statistics.median(r['stats']['phases'].get(name, 0.0) for r in runs)
+                                 for name in phases},
+        'tried_median': statistics.median(r['stats']['tried'] for r in runs),
+        'failures': [r['stats']['failure'] for r in runs if r['stats']['failure']],
+    }
+
+
+def compare(baseline, current, tolerance):
+    """Returns a list of human-readable regressions of `current` against `baseline`."""
+    regressions = []
+    for key, result in current['results'].items():
+        before = baseline.get('results', {}).get(key)
+        if before is None:
+            continue
+        if result['success_rate'] < before['success_rate']:
+            regressions.append(f"{key}: success rate {before['success_rate']:.0%} -> {result['success_rate']:.0%}")
+        for metric in ('solve_seconds_median', 'save_seconds_median', 'peak_memory_mb'):
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if metric.endswith('seconds_median') and max(old, new) < MIN_SIGNIFICANT_SECONDS:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append(f"{key}: {metric} {old:.3f} -> {new:.3f} (+{(new / old - 1) if old else 1:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the timetable scheduler.")
+    parser.add_argument('--scales', default='small,medium', help=f"comma-separated, from {', '.join(SCALES)}")
+    parser.add_argument('--solver', choices=SOLVERS, action='append', dest='solvers',
+                        help="solver to run (repeatable, default: the heuristics)")
+    parser.add_argument('--repeat', type=int, default=3, help="seeds per scale")
+    parser.add_argument('--density', type=float, default=0.8, help="fraction of each section's week to fill")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    scales = [s.strip() for s in args.scales.split(',') if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        parser.error(f"unknown scale(s): {', '.join(unknown)}")
+
+    results = {}
+    for scale in scales:
+        for solver in args.solvers or HEURISTICS:
+            key = f'{scale}/{solver}'
+            result = run_scale(scale, solver, args.repeat, args.density)
+            results[key] = result
+            save = result['save_seconds_median']
+            print(f"{key:<22} {result['requirements']:>5} reqs  "
+                  f"success {result['success_rate']:>4.0%}  "
+                  f"solve {result['solve_seconds_median']:.3f}s  "
+                  f"save {save if save is not None else float('nan'):.3f}s  "
+                  f"peak {result['peak_memory_mb']:.1f} MB")
+
+    report = {
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'density': args.density,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print(f"No regressions against {args.compare}.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
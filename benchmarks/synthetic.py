@@ -0,0 +1,109 @@
+"""
+Seeded synthetic institutions.
+
+`generate_institution` fills the current database session with departments
+(one row per section), teachers, courses, allocations and rooms. The same
+arguments and seed always produce the same data, so benchmark runs are
+comparable across commits.
+"""
+import math
+import random
+from models import db, Department, Teacher, Course, Classroom, Allocation, DAYS, TIMESLOTS
+
+WEEK_PERIODS = len(DAYS) * len(TIMESLOTS)
+LAB_DURATION = 3
+
+
+def generate_institution(departments=10, sections=2, density=0.8, labs_per_section=2,
+                         teacher_load=18, shared_teachers=0.1, lab_rooms=None, theory_rooms=None,
+                         seed=0):
+    """
+    Creates `departments` x `sections` timetabled groups and returns a summary.
+
+    Each section gets `labs_per_section` practicals, one activity period and
+    theory courses of 3-4 hours until its week is `density` full (the same
+    periods-per-week ratio check_density.py reports). Teachers are sized so
+    each carries about `teacher_load` periods. A `shared_teachers` fraction of
+    theory courses goes to a teacher from another department. Room counts
+    default to what a full week of every section needs.
+    """
+    rng = random.Random(seed)
+    target = max(1, round(WEEK_PERIODS * density))
+    groups = departments * sections
+
+    if lab_rooms is None:
+        lab_rooms = max(1, math.ceil(groups * labs_per_section / 8))
+    if theory_rooms is None:
+        theory_rooms = groups
+    for i in range(lab_rooms):
+        db.session.add(Classroom(name=f'Lab {i + 1}', capacity=30, type='Lab'))
+    for i in range(theory_rooms):
+        db.session.add(Classroom(name=f'Room {i + 1}', capacity=60, type='Classroom'))
+
+    plans = []
+    for d in range(departments):
+        code = f'D{d + 1:02d}'
+        courses = []
+        section_ids = []
+        for s in range(sections):
+            section = chr(ord('A') + s)
+            dept = Department(name=f'Department {d + 1}', code=code, section=section, semester='Semester 1')
+            db.session.add(dept)
+            db.session.flush()
+            section_ids.append(dept.id)
+
+            hours = 0
+            section_courses = []
+            for k in range(labs_per_section):
+                section_courses.append(Course(name=f'Lab {k + 1}', code=f'{code}{section}L{k + 1}',
+                                              dept_id=dept.id, type='Practical', hours_per_week=1))
+                hours += LAB_DURATION
+            section_courses.append(Course(name='Activity', code=f'{code}{section}X', dept_id=dept.id,
+                                          type='Activity Class', hours_per_week=1))
+            hours += 1
+            k = 0
+            while hours < target:
+                weekly = min(rng.choice((3, 4)), target - hours)
+                k += 1
+                section_courses.append(Course(name=f'Theory {k}', code=f'{code}{section}T{k}',
+                                              dept_id=dept.id, type='Theory', hours_per_week=weekly))
+                hours += weekly
+            db.session.add_all(section_courses)
+            courses.extend(section_courses)
+        db.session.flush()
+        load = sum(c.hours_per_week * (LAB_DURATION if c.type == 'Practical' else 1)
+                   for c in courses if c.type != 'Activity Class')
+        teacher_count = max(1, math.ceil(load / teacher_load))
+        teachers = [Teacher(name=f'{code} Teacher {t + 1}', dept_id=section_ids[t % sections],
+                            workload_limit=teacher_load + 2)
+                    for t in range(teacher_count)]
+        db.session.add_all(teachers)
+        db.session.flush()
+        plans.append((courses, teachers))
+
+    shared = 0
+    loads = {}
+    for d, (courses, teachers) in enumerate(plans):
+        # Spread courses over the department's teachers, heaviest first.
+        for course in sorted(courses, key=lambda c: c.hours_per_week, reverse=True):
+            if course.type == 'Activity Class':
+                continue
+            periods = course.hours_per_week * (LAB_DURATION if course.type == 'Practical' else 1)
+            pool = teachers
+            if course.type == 'Theory' and len(plans) > 1 and rng.random() < shared_teachers:
+                pool = plans[(d + rng.randrange(1, len(plans))) % len(plans)][1]
+                shared += 1
+            teacher = min(pool, key=lambda t: (loads.get(t.id, 0), t.id))
+            loads[teacher.id] = loads.get(teacher.id, 0) + periods
+            db.session.add(Allocation(course_id=course.id, teacher_id=teacher.id))
+    db.session.commit()
+
+    return {
+        'departments': groups,
+        'teachers': sum(len(teachers) for _, teachers in plans),
+        'courses': sum(len(courses) for courses, _ in plans),
+        'shared_courses': shared,
+        'lab_rooms': lab_rooms,
+        'theory_rooms': theory_rooms,
+        'density': target / WEEK_PERIODS,
+    }
@@ -0,0 +1,116 @@
+"""
+What each transaction writes to the timetable, for the in-memory caches.
+
+One set of session listeners records, per session:
+ - ORM inserts, updates and deletes of `TimetableEntry`, with the entry's
+   values before the transaction and after it,
+ - ORM writes of departments, courses, teachers and rooms,
+ - bulk statements on any of those tables, which may have changed anything.
+Subscribers get the recorded `Changes` once the transaction commits, or with
+`rolled_back` set once it rolls back, since a cache filled inside the
+transaction may have seen its flushed rows. `pending(session)` shows what an
+open transaction has recorded so far.
+"""
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from models import TimetableEntry, Department, Course, Teacher, Classroom
+
+KINDS = {Department: 'dept', Course: 'course', Teacher: 'teacher', Classroom: 'room'}
+ENTRY_TABLE = TimetableEntry.__tablename__
+TABLES = {model.__tablename__ for model in (TimetableEntry,) + tuple(KINDS)}
+# Entry values as (day, timeslot, dept_id, teacher_id, room_id).
+_ENTRY_ATTRS = ('day', 'timeslot', 'dept_id', 'teacher_id', 'classroom_id')
+_KEY = 'timetable_changes'
+
+_subscribers = []
+
+
+class Changes:
+    """The timetable writes of one transaction."""
+
+    def __init__(self):
+        self.entries = {}           # entry id -> (values before, values after); None when absent
+        self.resources = set()      # (kind, id) of written departments, courses, teachers, rooms
+        self.new_resources = set()  # the ones among them the transaction created
+        self.bulk = set()           # tables hit by bulk statements
+        self.rolled_back = False
+
+    def __bool__(self):
+        return bool(self.entries or self.resources or self.bulk)
+
+
+def subscribe(callback):
+    """Calls `callback(changes)` after each commit or rollback that recorded any."""
+    _subscribers.append(callback)
+    return callback
+
+
+def unsubscribe(callback):
+    _subscribers.remove(callback)
+
+
+def pending(session):
+    return session.info.get(_KEY) or Changes()
+
+
+def _recorded(session):
+    changes = session.info.get(_KEY)
+    if changes is None:
+        changes = session.info[_KEY] = Changes()
+    return changes
+
+
+def _before(entry, state):
+    values = []
+    for attr in _ENTRY_ATTRS:
+        deleted = state.attrs[attr].history.deleted
+        values.append(deleted[0] if deleted else getattr(entry, attr))
+    return tuple(values)
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_flush(session, flush_context):
+    changes = None
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, TimetableEntry):
+            changes = changes or _recorded(session)
+            after = None if obj in session.deleted else tuple(getattr(obj, attr) for attr in _ENTRY_ATTRS)
+            if obj.id in changes.entries:
+                changes.entries[obj.id] = (changes.entries[obj.id][0], after)
+            else:
+                before = None if obj in session.new else _before(obj, inspect(obj))
+                changes.entries[obj.id] = (before, after)
+        elif type(obj) in KINDS:
+            changes = changes or _recorded(session)
+            ref = (KINDS[type(obj)], obj.id)
+            changes.resources.add(ref)
+            if obj in session.new:
+                changes.new_resources.add(ref)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _record_bulk(state):
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    table = getattr(state.statement, 'table', None)
+    if getattr(table, 'name', None) in TABLES:
+        _recorded(state.session).bulk.add(table.name)
+
+
+def _publish(changes):
+    if changes:
+        for callback in _subscribers:
+            callback(changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _committed(session):
+    _publish(session.info.pop(_KEY, None))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _rolled_back(session):
+    changes = session.info.pop(_KEY, None)
+    if changes is not None:
+        changes.rolled_back = True
+    _publish(changes)
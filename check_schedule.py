@@ -1,16 +1,16 @@
 from app import app
-from models import Department, Course, TimetableEntry
+from snapshot import load_snapshot
 
 with app.app_context():
-    depts = Department.query.all()
+    snapshot = load_snapshot(with_entries=True)
     print("--- Scheduled vs Allocated Hours ---")
     
-    for dept in depts:
+    for dept in snapshot.departments:
         allocated_hours = 0
-        for course in dept.courses:
-            if course.allocations:
+        for course in snapshot.courses_by_dept[dept.id]:
+            if course.teacher_id is not None:
                 allocated_hours += course.hours_per_week
-        scheduled_slots = TimetableEntry.query.filter_by(dept_id=dept.id).count()
+        scheduled_slots = snapshot.entry_counts['dept'].get(dept.id, 0)
         
         print(f"Dept: {dept.code}")
         print(f"  - Allocated Hours (Request): {allocated_hours}")
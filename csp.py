@@ -0,0 +1,323 @@
+"""
+Backtracking search for the main (non-activity) timetable requirements.
+
+Each requirement is a variable whose domain is the set of (day_idx, start_idx)
+pairs it may start at. The search picks the most constrained variable first
+(MRV), prunes the domains of teacher/department peers after every placement
+(forward checking) and, on a dead end, jumps straight back to the deepest
+placement that actually caused it (conflict-directed backjumping).
+"""
+import heapq
+import random
+import time
+from models import DAYS, TIMESLOTS
+from occupancy import Occupancy, RoomIndex, block_mask
+
+LAB_START_INDICES = (1, 4)
+MAX_COURSE_SESSIONS_PER_DAY = 2
+LAST_PERIOD = len(TIMESLOTS) - 1
+
+
+class BacktrackingSolver:
+    def __init__(self, requirements, lab_room_ids, theory_room_ids, occupancy=None,
+                 reserved_last_periods=None, rng=None, max_backtracks=5000, on_progress=None, stats=None,
+                 deadline=None):
+        self.reqs = requirements
+        self.on_progress = on_progress
+        self.stats = stats
+        self.failed = None
+        self.rooms = {'lab': list(lab_room_ids), 'theory': list(theory_room_ids)}
+        if occupancy is None:
+            occupancy = Occupancy(RoomIndex(self.rooms))
+        self.occ = occupancy
+        # A caller-supplied occupancy may come without a 'lab'/'theory' index.
+        self.room_index = occupancy.room_index
+        self.rng = rng or random
+        self.max_backtracks = max_backtracks
+        self.backtracks = 0
+        # time.monotonic() value after which the search gives up.
+        self.deadline = deadline
+        self.timed_out = False
+
+        n = len(requirements)
+        self.practical = [req.course_type == 'Practical' for req in requirements]
+        tables = {}
+        for req in requirements:
+            if req.duration not in tables:
+                tables[req.duration] = [[block_mask(d, s, req.duration) if s + req.duration <= len(TIMESLOTS) else 0
+                                            for s in range(len(TIMESLOTS))] for d in range(len(DAYS))]
+        self.masks = [tables[req.duration] for req in requirements]
+        self.assignment = [None] * n
+        self.lab_blocks = {}
+        self.course_day_count = {}
+        # i -> (room group, mask) of each placement, for room culprits.
+        self.room_use = {}
+        # Activity classes go in the last period afterwards, so keep enough of
+        # those cells free per department.
+        self.last_period_limit = {dept_id: len(DAYS) - reserved
+                                  for dept_id, reserved in (reserved_last_periods or {}).items()}
+        self.last_period_used = {}
+
+        by_teacher = {}
+        by_dept = {}
+        for i, req in enumerate(requirements):
+            by_teacher.setdefault(req.teacher_id, []).append(i)
+            by_dept.setdefault(req.dept_id, []).append(i)
+        self.peers = []
+        for i, req in enumerate(requirements):
+            peers = set(by_teacher[req.teacher_id]) | set(by_dept[req.dept_id])
+            peers.discard(i)
+            self.peers.append(list(peers))
+
+        self.domain = [[set() for _ in DAYS] for _ in range(n)]
+        self.size = [0] * n
+        for i in range(n):
+            for day_idx in range(len(DAYS)):
+                for start_idx in self._starts(i):
+                    reason = self._rejection(i, day_idx, start_idx)
+                    if reason is None:
+                        self.domain[i][day_idx].add(start_idx)
+                        self.size[i] += 1
+                    elif stats is not None:
+                        stats.reject(reason)
+
+        self.trail = [[] for _ in range(n)]
+        self.past_fc = [[] for _ in range(n)]
+        self.conf = [set() for _ in range(n)]
+        self.candidates = [[] for _ in range(n)]
+
+    def _starts(self, i):
+        if self.practical[i]:
+            return LAB_START_INDICES
+        return range(len(TIMESLOTS) - self.reqs[i].duration + 1)
+
+    def _rejection(self, i, day_idx, start_idx):
+        """
+        The rule a start breaks, or None. Room availability is checked at
+        assignment instead.
+        """
+        req = self.reqs[i]
+        practical = self.practical[i]
+        mask = self.masks[i][day_idx][start_idx]
+        if not self.occ.teacher_free(req.teacher_id, mask):
+            return 'teacher'
+        if not self.occ.dept_free(req.dept_id, mask, parallel=practical):
+            return 'department'
+        if practical:
+            block = self.lab_blocks.get((day_idx, req.dept_id))
+            return None if block is None or block[0] == start_idx else 'lab_block'
+        if start_idx == LAST_PERIOD and req.dept_id in self.last_period_limit:
+            if self.last_period_used.get(req.dept_id, 0) >= self.last_period_limit[req.dept_id]:
+                return 'last_period'
+        key = (day_idx, req.dept_id, req.course_id)
+        return None if self.course_day_count.get(key, 0) < MAX_COURSE_SESSIONS_PER_DAY else 'daily_cap'
+
+    def explain(self, i):
+        """Counts, per reason, why each start of requirement `i` is unusable right now."""
+        reasons = {}
+        for day_idx in range(len(DAYS)):
+            for start_idx in self._starts(i):
+                reason = self._rejection(i, day_idx, start_idx)
+                if reason is None:
+                    room_id, _ = self._find_room(i, self.masks[i][day_idx][start_idx])
+                    reason = 'room' if room_id is None else 'lookahead'
+                reasons[reason] = reasons.get(reason, 0) + 1
+        return reasons
+
+    def _ordered_values(self, i):
+        values = [(d, s) for d in range(len(DAYS)) for s in self.domain[i][d]]
+        self.rng.shuffle(values)
+        # Same preference as the greedy pass: the last period is a fallback.
+        values.sort(key=lambda v: v[1] == LAST_PERIOD, reverse=True)
+        return values
+
+    def _push(self, j):
+        heapq.heappush(self.queue, (self.size[j], -self.reqs[j].duration, -len(self.peers[j]), j))
+
+    def _select(self, unassigned):
+        # Lazy heap: entries go stale whenever a domain shrinks or grows back.
+        while True:
+            size, _, _, i = heapq.heappop(self.queue)
+            if i in unassigned and size == self.size[i]:
+                return i
+
+    def _find_room(self, i, mask):
+        """Returns (room_id, culprits); culprits are the placements holding every candidate room."""
+        group = 'lab' if self.practical[i] else 'theory'
+        room_ids = self.rooms[group]
+        if self.room_index is not None:
+            room_id = self.room_index.pick(group, mask, self.rng)
+        else:
+            if room_ids:
+                # A random rotation spreads rooms as well as a shuffle, at O(1).
+                offset = self.rng.randrange(len(room_ids))
+                room_ids = room_ids[offset:] + room_ids[:offset]
+            room_id = self.occ.first_free_room(room_ids, mask)
+        if room_id is not None:
+            return room_id, None
+        culprits = {k for k, (used, held) in self.room_use.items() if used == group and held & mask}
+        return None, culprits
+
+    def _assign(self, i, day_idx, start_idx, room_id):
+        req = self.reqs[i]
+        mask = self.masks[i][day_idx][start_idx]
+        self.occ.add(req.dept_id, req.teacher_id, room_id, mask)
+        self.room_use[i] = ('lab' if self.practical[i] else 'theory', mask)
+        if self.practical[i]:
+            block = self.lab_blocks.setdefault((day_idx, req.dept_id), [start_idx, 0])
+            block[1] += 1
+        elif start_idx == LAST_PERIOD:
+            self.last_period_used[req.dept_id] = self.last_period_used.get(req.dept_id, 0) + 1
+        key = (day_idx, req.dept_id, req.course_id)
+        self.course_day_count[key] = self.course_day_count.get(key, 0) + req.duration
+        self.assignment[i] = (day_idx, start_idx, room_id)
+
+    def _unassign(self, i):
+        touched = set()
+        for j, day_idx, start_idx in reversed(self.trail[i]):
+            self.domain[j][day_idx].add(start_idx)
+            self.size[j] += 1
+            touched.add(j)
+            if self.past_fc[j] and self.past_fc[j][-1] == i:
+                self.past_fc[j].pop()
+        self.trail[i] = []
+        for j in touched:
+            self._push(j)
+
+        day_idx, start_idx, room_id = self.assignment[i]
+        req = self.reqs[i]
+        mask = self.masks[i][day_idx][start_idx]
+        self.occ.remove(req.dept_id, req.teacher_id, room_id, mask)
+        del self.room_use[i]
+        if self.practical[i]:
+            block = self.lab_blocks[(day_idx, req.dept_id)]
+            block[1] -= 1
+            if not block[1]:
+                del self.lab_blocks[(day_idx, req.dept_id)]
+        elif start_idx == LAST_PERIOD:
+            self.last_period_used[req.dept_id] -= 1
+        key = (day_idx, req.dept_id, req.course_id)
+        self.course_day_count[key] -= req.duration
+        self.assignment[i] = None
+
+    def _forward_check(self, i):
+        """Prunes peers on the placement's day; returns a wiped-out peer or None."""
+        day_idx, start_idx = self.assignment[i][:2]
+        placed = self.masks[i][day_idx][start_idx]
+        req = self.reqs[i]
+        quota = start_idx == LAST_PERIOD and not self.practical[i]
+        for j in self.peers[i]:
+            if self.assignment[j] is not None:
+                continue
+            peer = self.reqs[j]
+            same_dept = peer.dept_id == req.dept_id
+            # Lab-start and per-course caps constrain the whole day, everything
+            # else only the cells that overlap the new placement.
+            whole_day = same_dept and ((self.practical[i] and self.practical[j])
+                                       or peer.course_id == req.course_id)
+            # Overlapping a placement is fatal unless both are lab batches of
+            # the same department, which may run two in parallel.
+            batch = same_dept and self.practical[i] and self.practical[j]
+            dept_quota = quota and same_dept
+            pruned = False
+            for d in range(len(DAYS)):
+                if d != day_idx and not dept_quota:
+                    continue
+                masks = self.masks[j][d]
+                for s in list(self.domain[j][d]):
+                    overlap = d == day_idx and masks[s] & placed
+                    if not overlap and not whole_day and not dept_quota:
+                        continue
+                    if overlap and not batch:
+                        reason = 'teacher' if peer.teacher_id == req.teacher_id else 'department'
+                    else:
+                        reason = self._rejection(j, d, s)
+                        if reason is None:
+                            continue
+                    if self.stats is not None:
+                        self.stats.reject(reason)
+                    self.domain[j][d].discard(s)
+                    self.size[j] -= 1
+                    self.trail[i].append((j, d, s))
+                    pruned = True
+            if pruned:
+                self._push(j)
+                if not self.past_fc[j] or self.past_fc[j][-1] != i:
+                    self.past_fc[j].append(i)
+            if not self.size[j]:
+                return j
+        return None
+
+    def _try_values(self, i):
+        while self.candidates[i]:
+            day_idx, start_idx = self.candidates[i].pop()
+            if start_idx not in self.domain[i][day_idx]:
+                continue
+            mask = self.masks[i][day_idx][start_idx]
+            if self.stats is not None:
+                self.stats.tried += 1
+            room_id, culprits = self._find_room(i, mask)
+            if room_id is None:
+                self.conf[i] |= culprits
+                if self.stats is not None:
+                    self.stats.reject('room')
+                continue
+            self._assign(i, day_idx, start_idx, room_id)
+            wiped = self._forward_check(i)
+            if wiped is None:
+                return True
+            if self.stats is not None:
+                self.stats.reject('lookahead')
+            self.conf[i].update(k for k in self.past_fc[wiped] if k != i)
+            self._unassign(i)
+        return False
+
+    def solve(self):
+        """
+        Returns a list of (req, day_idx, start_idx, room_id) placements, or None
+        when the requirements are infeasible or the backtrack budget runs out;
+        `failed` is then the index of the requirement that ran out of values.
+        """
+        for i, size in enumerate(self.size):
+            if not size:
+                self.failed = i
+                return None
+
+        unassigned = set(range(len(self.reqs)))
+        self.queue = []
+        for i in unassigned:
+            self._push(i)
+        stack = []
+        position = {}
+        while unassigned:
+            i = self._select(unassigned)
+            unassigned.discard(i)
+            position[i] = len(stack)
+            stack.append(i)
+            self.conf[i] = set()
+            self.candidates[i] = self._ordered_values(i)
+            if self.on_progress:
+                self.on_progress(len(stack), self.backtracks)
+
+            while not self._try_values(i):
+                self.backtracks += 1
+                culprits = self.conf[i] | set(self.past_fc[i])
+                if self.deadline is not None and time.monotonic() > self.deadline:
+                    self.timed_out = True
+                if not culprits or self.backtracks > self.max_backtracks or self.timed_out:
+                    self.failed = i
+                    return None
+                target = max(culprits, key=position.__getitem__)
+                while stack[-1] != target:
+                    k = stack.pop()
+                    del position[k]
+                    if self.assignment[k] is not None:
+                        self._unassign(k)
+                    self.conf[k] = set()
+                    unassigned.add(k)
+                    self._push(k)
+                self.conf[target] |= culprits - {target}
+                self._unassign(target)
+                i = target
+
+        return [(self.reqs[i],) + self.assignment[i] for i in range(len(self.reqs))]
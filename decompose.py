@@ -0,0 +1,148 @@
+"""
+Department-decomposed solving.
+
+Departments only interact through teachers they share and through the room
+pool. Departments linked by a teacher are merged into one cluster and each
+cluster is solved on its own, in parallel when there are several. Rooms of
+the same type are interchangeable, so they are reconciled afterwards: every
+day's sessions are re-packed into concrete rooms, and only a cluster whose
+demand still does not fit is re-solved around the others.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from occupancy import block_mask
+from solver import create_solver
+
+
+def find_clusters(problem):
+    """Groups department ids that share a teacher, largest cluster first."""
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(a, b):
+        parent[find(a)] = find(b)
+
+    teacher_home = {}
+    for dept_id, teacher_ids in problem['dept_teachers'].items():
+        for teacher_id in teacher_ids:
+            teacher_home[teacher_id] = dept_id
+    for req in problem['requirements']:
+        find(req.dept_id)
+        teacher_id = req.teacher_id
+        if teacher_id is None:
+            continue
+        # A teacher links every department they teach, and their home
+        # department too since activity periods may borrow them.
+        if teacher_id in teacher_home:
+            union(req.dept_id, teacher_home[teacher_id])
+        union(req.dept_id, ('teacher', teacher_id))
+
+    clusters = {}
+    for dept_id in {req.dept_id for req in problem['requirements']}:
+        clusters.setdefault(find(dept_id), set()).add(dept_id)
+    return sorted(clusters.values(), key=len, reverse=True)
+
+
+def split_problem(problem, dept_ids):
+    sub = dict(problem)
+    sub['requirements'] = [r for r in problem['requirements'] if r.dept_id in dept_ids]
+    sub['dept_teachers'] = {d: t for d, t in problem['dept_teachers'].items() if d in dept_ids}
+    return sub
+
+
+def _sessions(schedule):
+    """Groups consecutive periods of one class in one room into runs (lists of periods)."""
+    groups = {}
+    for period in sorted(schedule, key=lambda p: (p[0], p[2], p[3], p[4], p[5], p[1])):
+        day_idx, slot_idx, dept_id, course_id, teacher_id, room_id = period
+        key = (day_idx, dept_id, course_id, teacher_id, room_id)
+        runs = groups.setdefault(key, [])
+        if runs and runs[-1][-1][1] == slot_idx - 1:
+            runs[-1].append(period)
+        else:
+            runs.append([period])
+    return [run for runs in groups.values() for run in runs]
+
+
+def reconcile_rooms(schedule, problem):
+    """
+    Reassigns rooms within each room type so no room is double-booked.
+
+    Sessions are packed in start order (interval partitioning), which needs
+    exactly as many rooms as the peak overlap. Returns (schedule, overflow)
+    where overflow lists the sessions that found no free room.
+    """
+    lab_rooms = set(problem['lab_room_ids'])
+    pools = {True: list(problem['lab_room_ids']), False: list(problem['theory_room_ids'])}
+    room_busy = {}
+    for day_idx, slot_idx, _, _, _, room_id in problem.get('fixed', ()):
+        room_busy[room_id] = room_busy.get(room_id, 0) | block_mask(day_idx, slot_idx)
+
+    result = []
+    overflow = []
+    for run in sorted(_sessions(schedule), key=lambda r: (r[0][0], r[0][1], -len(r))):
+        day_idx, start_idx = run[0][0], run[0][1]
+        mask = block_mask(day_idx, start_idx, len(run))
+        chosen = None
+        for room_id in pools[run[0][5] in lab_rooms]:
+            if not room_busy.get(room_id, 0) & mask:
+                chosen = room_id
+                break
+        if chosen is None:
+            overflow.append(run)
+            continue
+        room_busy[chosen] = room_busy.get(chosen, 0) | mask
+        result.extend(p[:5] + (chosen,) for p in run)
+    return result, overflow
+
+
+def _solve_cluster(args):
+    problem, solver, seed, options = args
+    return create_solver(problem, solver, seed, **options).solve()
+
+
+def solve_decomposed(problem, solver='greedy', seed=0, workers=None, options=None):
+    """Solves each teacher-linked cluster separately; returns a schedule or None."""
+    clusters = find_clusters(problem)
+    subproblems = [split_problem(problem, depts) for depts in clusters]
+    options = options or {}
+    jobs = [(sub, solver, seed + i, options) for i, sub in enumerate(subproblems)]
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_solve_cluster, jobs))
+    else:
+        results = [_solve_cluster(job) for job in jobs]
+    if any(result is None for result in results):
+        return None
+
+    cluster_of = {}
+    for i, depts in enumerate(clusters):
+        for dept_id in depts:
+            cluster_of[dept_id] = i
+    merged = [p for result in results for p in result]
+    schedule, overflow = reconcile_rooms(merged, problem)
+    if not overflow:
+        return schedule
+
+    # Pull out the clusters that did not fit, smallest first, and re-solve
+    # them one by one against everything already placed.
+    pending = set()
+    while overflow:
+        pending |= {cluster_of[run[0][2]] for run in overflow}
+        kept = [p for p in merged if cluster_of[p[2]] not in pending]
+        schedule, overflow = reconcile_rooms(kept, problem)
+    for i in sorted(pending, key=lambda i: len(clusters[i])):
+        sub = dict(subproblems[i])
+        sub['fixed'] = list(problem.get('fixed', ())) + schedule
+        placed = create_solver(sub, solver, seed + len(clusters) + i, **options).solve()
+        if placed is None:
+            return None
+        schedule.extend(placed)
+    return schedule
@@ -1,5 +1,6 @@
 import webview
 import sys
+import multiprocessing
 import threading
 import time
 from app import app
@@ -9,6 +10,9 @@ def run_app():
     app.run(port=5000, threaded=True, debug=False)
 
 if __name__ == '__main__':
+    # Parallel generation spawns worker processes from the frozen executable
+    multiprocessing.freeze_support()
+
     # Start Flask in a background thread
     t = threading.Thread(target=run_app)
     t.daemon = True
@@ -0,0 +1,133 @@
+"""
+Process-wide occupancy index of the stored timetable.
+
+Manual edits check a proposed (day, timeslot) against every teacher, room and
+department already booked there. `index` keeps those bookings in memory, keyed
+by integer cell (``day_idx * 7 + slot_idx``), so a check is a few dict
+lookups and runs no SQL.
+
+`change_tracking` keeps it in step with commits: entry edits are applied one
+by one, while bulk statements on the table (generation saves, repairs,
+clearing) and rollbacks of entry writes mark it stale for a reload.
+
+All reads, loads and updates take one lock, so threads of the threaded
+server see either the state before a commit or after it.
+"""
+import threading
+import weakref
+import change_tracking
+from models import db, TimetableEntry
+from occupancy import Occupancy, DAY_INDEX, SLOT_INDEX, cell_index
+
+
+def _cell(day, timeslot):
+    if day not in DAY_INDEX or timeslot not in SLOT_INDEX:
+        return None
+    return cell_index(DAY_INDEX[day], SLOT_INDEX[timeslot])
+
+
+class EntryIndex:
+    """Entry ids per (teacher, cell), (room, cell) and (department, cell)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engine = None
+        self._fresh = False
+        self.loads = 0
+        self._clear()
+
+    def _clear(self):
+        self.entries = {}       # entry id -> (cell, dept_id, teacher_id, room_id)
+        self.teacher = {}
+        self.room = {}
+        self.dept = {}
+
+    def _add(self, entry_id, cell, dept_id, teacher_id, room_id):
+        if cell is None:
+            return
+        self.entries[entry_id] = (cell, dept_id, teacher_id, room_id)
+        self.teacher.setdefault((teacher_id, cell), set()).add(entry_id)
+        self.room.setdefault((room_id, cell), set()).add(entry_id)
+        self.dept.setdefault((dept_id, cell), set()).add(entry_id)
+
+    def _discard(self, entry_id):
+        found = self.entries.pop(entry_id, None)
+        if found is None:
+            return
+        cell, dept_id, teacher_id, room_id = found
+        for bucket, key in ((self.teacher, (teacher_id, cell)), (self.room, (room_id, cell)),
+                            (self.dept, (dept_id, cell))):
+            ids = bucket.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del bucket[key]
+
+    def _ensure_loaded(self):
+        """Reloads when stale or bound to another database; caller holds the lock."""
+        engine = db.engine
+        if self._fresh and self._engine is not None and self._engine() is engine:
+            return
+        with db.session.no_autoflush:
+            rows = db.session.query(
+                TimetableEntry.id, TimetableEntry.day, TimetableEntry.timeslot, TimetableEntry.dept_id,
+                TimetableEntry.teacher_id, TimetableEntry.classroom_id
+            ).all()
+        self._clear()
+        for entry_id, day, timeslot, dept_id, teacher_id, room_id in rows:
+            self._add(entry_id, _cell(day, timeslot), dept_id, teacher_id, room_id)
+        self._engine = weakref.ref(engine)
+        self._fresh = True
+        self.loads += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._fresh = False
+
+    def apply(self, changes):
+        """Applies committed {entry_id: (day, timeslot, dept, teacher, room) or None}."""
+        with self._lock:
+            if not self._fresh:
+                return
+            for entry_id, values in changes.items():
+                self._discard(entry_id)
+                if values is not None:
+                    day, timeslot, dept_id, teacher_id, room_id = values
+                    self._add(entry_id, _cell(day, timeslot), dept_id, teacher_id, room_id)
+
+    def busy(self, day, timeslot, teacher_id=None, classroom_id=None, dept_id=None, ignore_entry_id=None):
+        """
+        Entry ids booked at (day, timeslot) as {'teacher': [...], 'room': [...],
+        'dept': [...]}, leaving out `ignore_entry_id`. Off-grid slots are free.
+        """
+        cell = _cell(day, timeslot)
+        with self._lock:
+            self._ensure_loaded()
+            if cell is None:
+                return {'teacher': [], 'room': [], 'dept': []}
+            return {
+                'teacher': sorted(self.teacher.get((teacher_id, cell), set()) - {ignore_entry_id}),
+                'room': sorted(self.room.get((classroom_id, cell), set()) - {ignore_entry_id}),
+                'dept': sorted(self.dept.get((dept_id, cell), set()) - {ignore_entry_id}),
+            }
+
+    def occupancy(self, room_index=None, ignore_entry_id=None):
+        """The indexed bookings as an `Occupancy`, leaving out `ignore_entry_id`."""
+        occupancy = Occupancy(room_index)
+        with self._lock:
+            self._ensure_loaded()
+            for entry_id, (cell, dept_id, teacher_id, room_id) in self.entries.items():
+                if entry_id != ignore_entry_id:
+                    occupancy.add(dept_id, teacher_id, room_id, 1 << cell)
+        return occupancy
+
+
+index = EntryIndex()
+
+
+@change_tracking.subscribe
+def _follow(changes):
+    if change_tracking.ENTRY_TABLE in changes.bulk or (changes.rolled_back and changes.entries):
+        index.invalidate()
+    elif changes.entries:
+        index.apply({entry_id: after for entry_id, (_, after) in changes.entries.items()})
@@ -0,0 +1,235 @@
+"""
+Exact solving with OR-Tools CP-SAT.
+
+The model enforces the same rules as the heuristic solvers:
+ - practicals start at P2 or P5 and keep their lab room for the whole block,
+ - a department holds one theory class or up to two parallel practicals per
+   period, and all of a day's practicals share one block,
+ - at most two sessions of a course per day,
+ - activities go in the last period, taught by the department's P6 teacher,
+   or by any free teacher of the department when P6 is empty,
+ - teachers and rooms are never double-booked, fixed placements included.
+
+Sessions of one course are interchangeable, so the model picks a set of start
+cells per course rather than a cell per session. Rooms of a group are
+interchangeable too: the model only bounds how many classes a cell (or a lab
+block) holds, and concrete rooms are taken from the `RoomIndex` afterwards.
+
+OR-Tools is optional. It is imported when a solve starts and a missing install
+is reported with the command that fixes it.
+"""
+import os
+import importlib.util
+from models import DAYS, TIMESLOTS
+from occupancy import Occupancy, block_mask, cell_index
+from csp import LAB_START_INDICES, MAX_COURSE_SESSIONS_PER_DAY, LAST_PERIOD
+from stats import GenerationStats
+from problem import session_count
+
+DEFAULT_TIME_LIMIT = 60.0
+# Practicals are booked as 3-period lab blocks.
+LAB_PERIODS = 3
+
+
+def cpsat_available():
+    """True when OR-Tools can be imported, so the 'cpsat' backend can run."""
+    return importlib.util.find_spec('ortools') is not None
+
+
+def _import_cp_model():
+    try:
+        from ortools.sat.python import cp_model
+    except ImportError:
+        raise RuntimeError("The 'cpsat' solver needs OR-Tools. Install it with `pip install ortools`.") from None
+    return cp_model
+
+
+class CpSatSolver:
+    def __init__(self, problem, seed=None, on_progress=None, stats=None, time_limit=None, workers=None):
+        self.problem = problem
+        self.seed = seed or 0
+        self.on_progress = on_progress
+        self.stats = stats if stats is not None else GenerationStats()
+        self.time_limit = time_limit or DEFAULT_TIME_LIMIT
+        # Parallel search workers inside one CP-SAT solve.
+        self.workers = workers or os.cpu_count() or 1
+
+    def solve(self):
+        """
+        Returns a schedule, or None when the model is infeasible or the time
+        limit ran out first; `stats.outcome` tells the two apart.
+        """
+        cp_model = _import_cp_model()
+        occupancy = Occupancy.from_problem(self.problem)
+        with self.stats.phase('model'):
+            model = cp_model.CpModel()
+            starts, teachers = self._build(model, occupancy)
+
+        solver = cp_model.CpSolver()
+        solver.parameters.max_time_in_seconds = float(self.time_limit)
+        solver.parameters.num_workers = self.workers
+        solver.parameters.random_seed = self.seed % 2 ** 31
+        with self.stats.phase('main'):
+            status = solver.Solve(model)
+        self.stats.outcome = {
+            cp_model.OPTIMAL: 'optimal',
+            cp_model.FEASIBLE: 'feasible',
+            cp_model.INFEASIBLE: 'infeasible',
+        }.get(status, 'unknown')
+        print(f"CP-SAT: {self.stats.outcome} after {solver.WallTime():.2f}s "
+              f"({len(starts) + len(teachers)} placement variables, {self.workers} workers)")
+        if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            return None
+
+        with self.stats.phase('rooms'):
+            schedule = self._extract(solver, starts, teachers, occupancy)
+        if schedule is not None and self.on_progress:
+            total = session_count(self.problem['requirements'])
+            self.on_progress(total, total, 0)
+        return schedule
+
+    def _build(self, model, occupancy):
+        """
+        Adds the variables and rules to `model`. Returns ``starts``, mapping
+        (req, day_idx, start_idx) to a bool per main-course start, and
+        ``teachers``, mapping (req, day_idx, teacher_id) to a bool per activity
+        period and the teacher taking it.
+        """
+        rooms = occupancy.room_index
+        requirements = self.problem['requirements']
+        main = [r for r in requirements if r.course_type != 'Activity Class']
+        activities = [r for r in requirements if r.course_type == 'Activity Class']
+
+        starts = {}
+        teacher_cells = {}      # (teacher_id, cell) -> vars
+        single_cells = {}       # (dept_id, cell) -> theory/activity vars
+        lab_cells = {}          # (dept_id, cell) -> practical vars
+        room_cells = {}         # cell -> theory/activity vars
+        lab_blocks = {}         # (day_idx, start_idx) -> practical vars
+        p6 = {}                 # (dept_id, day_idx) -> [(teacher_id, var)]
+
+        for req in main:
+            is_practical = req.course_type == 'Practical'
+            slots = LAB_START_INDICES if is_practical else range(len(TIMESLOTS))
+            by_day = {}
+            for day_idx in range(len(DAYS)):
+                for start_idx in slots:
+                    if start_idx + req.duration > len(TIMESLOTS):
+                        continue
+                    mask = block_mask(day_idx, start_idx, req.duration)
+                    if (not occupancy.teacher_free(req.teacher_id, mask)
+                            or not occupancy.dept_free(req.dept_id, mask, parallel=is_practical)
+                            or rooms.pick('lab' if is_practical else 'theory', mask) is None):
+                        continue
+                    var = model.NewBoolVar(f'c{req.course_id}_d{day_idx}_s{start_idx}')
+                    starts[(req, day_idx, start_idx)] = var
+                    by_day.setdefault(day_idx, []).append(var)
+                    for slot_idx in range(start_idx, start_idx + req.duration):
+                        cell = cell_index(day_idx, slot_idx)
+                        if req.teacher_id is not None:
+                            teacher_cells.setdefault((req.teacher_id, cell), []).append(var)
+                        if is_practical:
+                            lab_cells.setdefault((req.dept_id, cell), []).append(var)
+                        else:
+                            single_cells.setdefault((req.dept_id, cell), []).append(var)
+                            room_cells.setdefault(cell, []).append(var)
+                        if slot_idx == LAST_PERIOD - 1:
+                            p6.setdefault((req.dept_id, day_idx), []).append((req.teacher_id, var))
+                    if is_practical:
+                        lab_blocks.setdefault((day_idx, start_idx), []).append(var)
+            model.Add(sum(var for day in by_day.values() for var in day) == req.count)
+            if not is_practical:
+                for day in by_day.values():
+                    model.Add(sum(day) <= MAX_COURSE_SESSIONS_PER_DAY)
+
+        teachers = {}
+        for req in activities:
+            home = set(self.problem['dept_teachers'].get(req.dept_id, ()))
+            visiting = {r.teacher_id for r in main if r.dept_id == req.dept_id and r.teacher_id is not None}
+            placed = []
+            for day_idx in range(len(DAYS)):
+                mask = block_mask(day_idx, LAST_PERIOD)
+                cell = cell_index(day_idx, LAST_PERIOD)
+                if not occupancy.dept_free(req.dept_id, mask) or rooms.pick('theory', mask) is None:
+                    continue
+                day = model.NewBoolVar(f'a{req.course_id}_d{day_idx}')
+                placed.append(day)
+                single_cells.setdefault((req.dept_id, cell), []).append(day)
+                room_cells.setdefault(cell, []).append(day)
+
+                taught_p6 = p6.get((req.dept_id, day_idx), [])
+                p6_busy = model.NewBoolVar(f'p6_{req.dept_id}_d{day_idx}')
+                if taught_p6:
+                    model.AddMaxEquality(p6_busy, [var for _, var in taught_p6])
+                else:
+                    model.Add(p6_busy == 0)
+                choices = []
+                for teacher_id in sorted(home | visiting):
+                    if not occupancy.teacher_free(teacher_id, mask):
+                        continue
+                    choice = model.NewBoolVar(f'a{req.course_id}_d{day_idx}_t{teacher_id}')
+                    teachers[(req, day_idx, teacher_id)] = choice
+                    choices.append(choice)
+                    teacher_cells.setdefault((teacher_id, cell), []).append(choice)
+                    # Only the P6 teacher may stay on; a home teacher may
+                    # also step in when P6 is empty.
+                    taught = sum(var for t, var in taught_p6 if t == teacher_id)
+                    if teacher_id in home:
+                        model.Add(choice <= taught + 1 - p6_busy)
+                    else:
+                        model.Add(choice <= taught)
+                model.Add(sum(choices) == day)
+            model.Add(sum(placed) == req.count)
+
+        for cells in teacher_cells.values():
+            if len(cells) > 1:
+                model.Add(sum(cells) <= 1)
+        for key in set(single_cells) | set(lab_cells):
+            dept_id, cell = key
+            mask = 1 << cell
+            spare = 2 if occupancy.dept_free(dept_id, mask) else 1 if occupancy.dept_free(dept_id, mask, True) else 0
+            model.Add(2 * sum(single_cells.get(key, [])) + sum(lab_cells.get(key, [])) <= spare)
+        for cell, cells in room_cells.items():
+            model.Add(sum(cells) <= len(rooms.free_rooms('theory', 1 << cell)))
+        for (day_idx, start_idx), cells in lab_blocks.items():
+            model.Add(sum(cells) <= len(rooms.free_rooms('lab', block_mask(day_idx, start_idx, LAB_PERIODS))))
+
+        # All of a department's practicals on a day share one block.
+        first_block = {}
+        for (req, day_idx, start_idx), var in starts.items():
+            if req.course_type == 'Practical':
+                first_block.setdefault((req.dept_id, day_idx), {}).setdefault(start_idx, []).append(var)
+        for (dept_id, day_idx), blocks in first_block.items():
+            if len(blocks) > 1:
+                early = model.NewBoolVar(f'lab_{dept_id}_d{day_idx}')
+                model.Add(sum(blocks.get(LAB_START_INDICES[0], [])) <= 2 * early)
+                model.Add(sum(blocks.get(LAB_START_INDICES[1], [])) <= 2 * (1 - early))
+        return starts, teachers
+
+    def _extract(self, solver, starts, teachers, occupancy):
+        rooms = occupancy.room_index
+        schedule = []
+        # Lab blocks first; they need one room for three periods.
+        chosen = sorted((key for key, var in starts.items() if solver.Value(var)),
+                        key=lambda key: (key[0].course_type != 'Practical', key[1], key[2]))
+        for req, day_idx, start_idx in chosen:
+            is_practical = req.course_type == 'Practical'
+            mask = block_mask(day_idx, start_idx, req.duration)
+            room_id = rooms.pick('lab' if is_practical else 'theory', mask)
+            if room_id is None:
+                print(f"CP-SAT: no room left for course {req.course_id}, day {day_idx}, slot {start_idx}")
+                return None
+            occupancy.add(req.dept_id, req.teacher_id, room_id, mask)
+            for idx in range(start_idx, start_idx + req.duration):
+                schedule.append((day_idx, idx, req.dept_id, req.course_id, req.teacher_id, room_id))
+        for (req, day_idx, teacher_id), var in teachers.items():
+            if not solver.Value(var):
+                continue
+            mask = block_mask(day_idx, LAST_PERIOD)
+            room_id = rooms.pick('theory', mask)
+            if room_id is None:
+                print(f"CP-SAT: no room left for activity {req.course_id}, day {day_idx}")
+                return None
+            occupancy.add(req.dept_id, teacher_id, room_id, mask)
+            schedule.append((day_idx, LAST_PERIOD, req.dept_id, req.course_id, teacher_id, room_id))
+        return schedule
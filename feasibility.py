@@ -0,0 +1,223 @@
+"""
+Pre-solve feasibility analysis.
+
+`find_bottlenecks(problem)` applies necessary conditions that take
+milliseconds to check. If any of them fails, no solver can succeed, and the
+bottleneck is reported by name without starting a search:
+
+ - a department needs more periods than its week has,
+ - a department needs more lab batches or activity periods than the rules allow,
+ - a teacher is booked for more periods, or lab blocks, than the week has,
+ - there are more lab sessions than lab rooms x lab blocks,
+ - there are more single periods than theory room periods in the week,
+ - the theory room periods do not fit. This is a max-flow bound: each
+   department can use a room at most once per cell, activities must go in
+   the last period, and every cell holds at most one class per theory room.
+
+Passing the check does not guarantee a timetable exists.
+"""
+from collections import deque
+from models import DAYS, TIMESLOTS
+from csp import LAB_START_INDICES
+from problem import expand
+
+WEEK_PERIODS = len(DAYS) * len(TIMESLOTS)
+LAB_BLOCKS = len(DAYS) * len(LAB_START_INDICES)
+# A department's lab batches share one block per day, two batches at most.
+MAX_PARALLEL_BATCHES = 2
+LAST_SLOT = len(TIMESLOTS) - 1
+
+
+def find_bottlenecks(problem, names=None):
+    """
+    Returns a list of human-readable bottlenecks, most fundamental first; an
+    empty list means the inputs passed every check. `names` may map 'dept'
+    and 'teacher' ids to labels for the messages.
+    """
+    names = names or {}
+    dept_name = lambda d: names.get('dept', {}).get(d, f'Department #{d}')
+    teacher_name = lambda t: names.get('teacher', {}).get(t, f'Teacher #{t}')
+
+    theory = {}      # dept -> single periods (theory and activity)
+    activity = {}    # dept -> activity periods
+    labs = {}        # dept -> lab sessions
+    teacher_periods = {}
+    teacher_labs = {}
+    for req in expand(problem['requirements']):
+        if req.course_type == 'Practical':
+            labs[req.dept_id] = labs.get(req.dept_id, 0) + 1
+            if req.teacher_id is not None:
+                teacher_labs[req.teacher_id] = teacher_labs.get(req.teacher_id, 0) + 1
+        else:
+            theory[req.dept_id] = theory.get(req.dept_id, 0) + req.duration
+            if req.course_type == 'Activity Class':
+                activity[req.dept_id] = activity.get(req.dept_id, 0) + 1
+        # The solver hands activities to the P6 or a home teacher, not the allocated one.
+        if req.teacher_id is not None and req.course_type != 'Activity Class':
+            teacher_periods[req.teacher_id] = teacher_periods.get(req.teacher_id, 0) + req.duration
+
+    lab_room_ids = set(problem['lab_room_ids'])
+    fixed_teacher = {}
+    fixed_lab_blocks = set()
+    fixed_theory = {True: 0, False: 0}  # last period?
+    for day_idx, slot_idx, _, _, teacher_id, room_id in problem.get('fixed', ()):
+        fixed_teacher[teacher_id] = fixed_teacher.get(teacher_id, 0) + 1
+        if room_id in lab_room_ids:
+            # Any overlap makes the room's block on that side of the day unusable.
+            if slot_idx >= LAB_START_INDICES[0]:
+                fixed_lab_blocks.add((room_id, day_idx, slot_idx >= LAB_START_INDICES[1]))
+        else:
+            fixed_theory[slot_idx == LAST_SLOT] += 1
+
+    issues = []
+    for dept_id in sorted(set(theory) | set(labs)):
+        lab_periods = -(-labs.get(dept_id, 0) // MAX_PARALLEL_BATCHES) * 3
+        need = theory.get(dept_id, 0) + lab_periods
+        if need > WEEK_PERIODS:
+            issues.append(f"{dept_name(dept_id)} needs {need} periods a week "
+                          f"({theory.get(dept_id, 0)} single + {lab_periods} lab) but a week has {WEEK_PERIODS}.")
+        if labs.get(dept_id, 0) > len(DAYS) * MAX_PARALLEL_BATCHES:
+            issues.append(f"{dept_name(dept_id)} has {labs[dept_id]} lab sessions but at most "
+                          f"{len(DAYS) * MAX_PARALLEL_BATCHES} fit ({MAX_PARALLEL_BATCHES} parallel batches a day).")
+        if activity.get(dept_id, 0) > len(DAYS):
+            issues.append(f"{dept_name(dept_id)} has {activity[dept_id]} activity periods but only "
+                          f"{len(DAYS)} last periods a week.")
+
+    for teacher_id in sorted(teacher_periods):
+        available = WEEK_PERIODS - fixed_teacher.get(teacher_id, 0)
+        if teacher_periods[teacher_id] > available:
+            issues.append(f"{teacher_name(teacher_id)} is allocated {teacher_periods[teacher_id]} periods "
+                          f"but only {available} are free.")
+        if teacher_labs.get(teacher_id, 0) > LAB_BLOCKS:
+            issues.append(f"{teacher_name(teacher_id)} teaches {teacher_labs[teacher_id]} lab sessions "
+                          f"but a week has {LAB_BLOCKS} lab blocks.")
+
+    total_labs = sum(labs.values())
+    lab_capacity = len(lab_room_ids) * LAB_BLOCKS - len(fixed_lab_blocks)
+    if total_labs > lab_capacity:
+        issues.append(f"{total_labs} lab sessions need a lab room but {len(lab_room_ids)} lab room(s) "
+                      f"offer only {lab_capacity} free lab blocks.")
+
+    issues.extend(_theory_room_bottlenecks(problem, theory, activity, labs, fixed_theory, dept_name))
+    return issues
+
+
+def _theory_room_bottlenecks(problem, theory, activity, labs, fixed_theory, dept_name):
+    """
+    Max-flow of single periods into theory room capacity.
+
+    source -> dept (its single periods) -> dept's last-period cells (at most
+    6, and only those cells can take activities) or its other cells -> the
+    room capacity of last / other periods -> sink. If the flow falls short,
+    the saturated edges of the minimum cut name the bottleneck.
+    """
+    rooms = len(problem['theory_room_ids'])
+    depts = sorted(d for d in theory if theory[d])
+    if not depts:
+        return []
+    graph = _FlowGraph()
+    last_cap = rooms * len(DAYS) - fixed_theory[True]
+    other_cap = rooms * (WEEK_PERIODS - len(DAYS)) - fixed_theory[False]
+    graph.add('last', 'sink', max(0, last_cap), ('rooms', 'last'))
+    graph.add('other', 'sink', max(0, other_cap), ('rooms', 'other'))
+    for d in depts:
+        acts = activity.get(d, 0)
+        # A lab block takes at least two of the department's non-last cells,
+        # whichever start it gets.
+        lab_blocks = -(-labs.get(d, 0) // MAX_PARALLEL_BATCHES)
+        graph.add('source', ('acts', d), acts, None)
+        graph.add('source', ('single', d), theory[d] - acts, None)
+        graph.add(('acts', d), ('last', d), acts, None)
+        graph.add(('single', d), ('last', d), theory[d] - acts, None)
+        graph.add(('single', d), ('other', d), theory[d] - acts, None)
+        graph.add(('last', d), 'last', len(DAYS), ('dept_last', d))
+        graph.add(('other', d), 'other', max(0, WEEK_PERIODS - len(DAYS) - 2 * lab_blocks), ('dept_other', d))
+
+    need = sum(theory[d] for d in depts)
+    total_cap = max(0, last_cap) + max(0, other_cap)
+    if need > total_cap:
+        # Too few rooms overall; the last period is then never the real constraint.
+        return [f"Theory rooms: {need} single periods need rooms but {rooms} theory room(s) "
+                f"offer only {total_cap} free room periods."]
+    flow = graph.max_flow('source', 'sink')
+    if flow >= need:
+        return []
+
+    issues = []
+    for tag in graph.min_cut_tags('source'):
+        if tag == ('rooms', 'last'):
+            issues.append(f"Last-period rooms: {sum(activity.values())} activity periods and other last-period "
+                          f"classes need more than the {max(0, last_cap)} free room slots in the last period.")
+        elif tag == ('rooms', 'other'):
+            issues.append(f"Theory rooms: single periods outside the last period need more than the "
+                          f"{max(0, other_cap)} free room slots there.")
+        elif tag[0] == 'dept_last':
+            issues.append(f"{dept_name(tag[1])} cannot fit its {activity.get(tag[1], 0)} activity periods "
+                          f"into its free last periods.")
+        elif tag[0] == 'dept_other':
+            issues.append(f"{dept_name(tag[1])} has more single periods than cells left around its labs.")
+    if not issues:
+        issues.append(f"Theory rooms: only {flow} of {need} single periods can be given a room.")
+    return issues
+
+
+class _FlowGraph:
+    """Edmonds-Karp on a handful of nodes; edges carry an optional tag for reporting."""
+
+    def __init__(self):
+        self.capacity = {}
+        self.adjacent = {}
+        self.tags = {}
+
+    def add(self, u, v, capacity, tag):
+        self.capacity[(u, v)] = self.capacity.get((u, v), 0) + capacity
+        self.capacity.setdefault((v, u), 0)
+        self.adjacent.setdefault(u, set()).add(v)
+        self.adjacent.setdefault(v, set()).add(u)
+        if tag is not None:
+            self.tags[(u, v)] = tag
+
+    def _path(self, source, sink):
+        parent = {source: None}
+        queue = deque([source])
+        while queue:
+            u = queue.popleft()
+            for v in self.adjacent.get(u, ()):
+                if v not in parent and self.capacity[(u, v)] > 0:
+                    parent[v] = u
+                    if v == sink:
+                        return parent
+                    queue.append(v)
+        return None
+
+    def max_flow(self, source, sink):
+        total = 0
+        while True:
+            parent = self._path(source, sink)
+            if parent is None:
+                return total
+            bottleneck = None
+            v = sink
+            while parent[v] is not None:
+                c = self.capacity[(parent[v], v)]
+                bottleneck = c if bottleneck is None else min(bottleneck, c)
+                v = parent[v]
+            v = sink
+            while parent[v] is not None:
+                u = parent[v]
+                self.capacity[(u, v)] -= bottleneck
+                self.capacity[(v, u)] += bottleneck
+                v = u
+            total += bottleneck
+
+    def min_cut_tags(self, source):
+        """Tags of the edges leaving the part of the residual graph reachable from `source`."""
+        reachable = {source}
+        queue = deque([source])
+        while queue:
+            u = queue.popleft()
+            for v in self.adjacent.get(u, ()):
+                if v not in reachable and self.capacity[(u, v)] > 0:
+                    reachable.add(v)
+                    queue.append(v)
+        return [tag for (u, v), tag in self.tags.items() if u in reachable and v not in reachable]
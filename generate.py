@@ -0,0 +1,54 @@
+import argparse
+from app import app
+from scheduler import Scheduler, SOLVERS, PARTIAL_CONFLICT_MESSAGE
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the timetable from the command line.")
+    parser.add_argument('--solver', choices=SOLVERS, default='greedy')
+    parser.add_argument('--attempts', type=int, default=1, help="seeded attempts to run in parallel")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--dept', type=int, action='append', dest='dept_ids',
+                        help="only regenerate this department id (repeatable)")
+    parser.add_argument('--semester', default=None, help="only regenerate departments in this semester")
+    parser.add_argument('--section', default=None, help="only regenerate departments in this section")
+    parser.add_argument('--decompose', action='store_true', help="solve independent department clusters separately")
+    parser.add_argument('--optimize', type=float, default=0, metavar='SECONDS',
+                        help="spend this long reducing teacher gaps and same-day repeats")
+    parser.add_argument('--time-limit', type=float, default=None, metavar='SECONDS',
+                        help="stop solving after this long (cpsat uses --workers search threads)")
+    parser.add_argument('--partial', action='store_true',
+                        help="if no full timetable is found in time, save the best partial one")
+    parser.add_argument('--two-phase', action='store_true',
+                        help="assign times against room counts, then match rooms per slot")
+    parser.add_argument('--no-cache', action='store_true', help="always solve, even if the inputs are unchanged")
+    args = parser.parse_args()
+    if args.partial and (args.attempts > 1 or args.decompose):
+        parser.error(PARTIAL_CONFLICT_MESSAGE)
+
+    with app.app_context():
+        scheduler = Scheduler(solver=args.solver, seed=args.seed, attempts=args.attempts, workers=args.workers,
+                              decompose=args.decompose, dept_ids=args.dept_ids,
+                              semester=args.semester, section=args.section, use_cache=not args.no_cache,
+                              optimize_seconds=args.optimize, time_limit=args.time_limit,
+                              two_phase=args.two_phase, partial=args.partial)
+        if scheduler.empty_scope:
+            print("No departments match --dept, --semester and --section. Nothing to generate.")
+            return 1
+        if not scheduler.requirements:
+            print("No subjects have teachers assigned. Nothing to generate.")
+            return 1
+        if scheduler.generate_timetable():
+            print(f"Timetable generated successfully (seed {scheduler.seed}).")
+            return 0
+        if scheduler.partial_saved:
+            print("Saved a partial timetable. Not placed:")
+            for entry in scheduler.stats.unplaced:
+                print(f"  - course {entry['course_id']} ({entry['course_type']}): "
+                      f"{entry['sessions']} session(s), {entry['reason']}")
+            return 2
+        print("Failed to generate timetable.")
+        return 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,184 @@
+"""
+Materialized week grids for the timetable page.
+
+A grid is what the template walks: ``{day: [cell, ...]}`` where each cell
+holds its entries plus the colspan/skip flags of merged practical blocks.
+Entries are `GridEntry` tuples that carry the course, teacher, room and
+department rows they show, so rendering never goes back to the database.
+
+`grids` keeps one grid per department and per teacher, built on first use
+with a single query. Writes drop only the grids they can change:
+ - timetable entries added, moved or deleted through the ORM (manual edits,
+   cascades of deleted resources) drop the grids of their department and
+   teacher, before and after the change,
+ - edits of a department, course, teacher or room drop the grids that show it,
+ - bulk statements (generation saves, repairs, clearing) drop everything.
+The writes come from `change_tracking` when a transaction commits or rolls
+back, and a lock keeps the threads of the threaded server consistent.
+"""
+import threading
+import weakref
+from collections import namedtuple
+import change_tracking
+from models import db, TimetableEntry, Department, Course, Teacher, Classroom, DAYS, TIMESLOTS
+from snapshot import DepartmentRow, CourseRow, TeacherRow, ClassroomRow
+
+GridEntry = namedtuple('GridEntry', 'id course_id teacher_id course teacher classroom department')
+
+_SLOT_INDEX = {slot: i for i, slot in enumerate(TIMESLOTS)}
+
+
+def _empty_week():
+    return {day: [{'entries': [], 'colspan': 1, 'skip': False} for _ in TIMESLOTS] for day in DAYS}
+
+
+def _merge_practicals(week, same_block):
+    """Spans a practical over the following cells that `same_block` accepts."""
+    for slots in week.values():
+        i = 0
+        while i < len(TIMESLOTS):
+            cell = slots[i]
+            primary = cell['entries'][0] if cell['entries'] else None
+            if cell['skip'] or primary is None or primary.course.type != 'Practical':
+                i += 1
+                continue
+            duration = 1
+            for j in range(i + 1, len(TIMESLOTS)):
+                if slots[j]['entries'] and same_block(cell['entries'], slots[j]['entries']):
+                    duration += 1
+                else:
+                    break
+            if duration > 1:
+                cell['colspan'] = duration
+                for k in range(1, duration):
+                    slots[i + k]['skip'] = True
+            i += duration
+
+
+def _same_courses(first, other):
+    return sorted(e.course_id for e in first) == sorted(e.course_id for e in other)
+
+
+def _same_course(first, other):
+    return other[0].course_id == first[0].course_id
+
+
+def _query_entries(condition):
+    """(day, timeslot, GridEntry) for entries matching `condition`, in one query."""
+    rows = db.session.query(
+        TimetableEntry.id, TimetableEntry.day, TimetableEntry.timeslot,
+        Course.id, Course.name, Course.code, Course.dept_id, Course.type, Course.hours_per_week,
+        Teacher.id, Teacher.name, Teacher.dept_id, Teacher.workload_limit,
+        Classroom.id, Classroom.name, Classroom.capacity, Classroom.type,
+        Department.id, Department.name, Department.code, Department.section, Department.semester,
+    ).join(Course, Course.id == TimetableEntry.course_id) \
+     .join(Department, Department.id == TimetableEntry.dept_id) \
+     .outerjoin(Teacher, Teacher.id == TimetableEntry.teacher_id) \
+     .outerjoin(Classroom, Classroom.id == TimetableEntry.classroom_id) \
+     .filter(condition).order_by(TimetableEntry.id).all()
+    for row in rows:
+        teacher = TeacherRow(*row[9:13]) if row[9] is not None else None
+        classroom = ClassroomRow(*row[13:17]) if row[13] is not None else None
+        yield row[1], row[2], GridEntry(row[0], row[3], row[9],
+                                        CourseRow(*row[3:9], None), teacher, classroom,
+                                        DepartmentRow(*row[17:22]))
+
+
+class GridCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engine = None
+        self._grids = {}        # ('dept'|'teacher', id) -> week
+        self._refs = {}         # (kind, id) -> grid keys showing it
+        self._departments = None
+        self.builds = 0
+
+    def _check_engine(self):
+        """Drops everything when bound to another database; caller holds the lock."""
+        engine = db.engine
+        if self._engine is None or self._engine() is not engine:
+            self._grids, self._refs, self._departments = {}, {}, None
+            self._engine = weakref.ref(engine)
+
+    def _store(self, key, week):
+        self._grids[key] = week
+        for slots in week.values():
+            for cell in slots:
+                for entry in cell['entries']:
+                    for ref in (('dept', entry.department.id), ('course', entry.course_id),
+                                ('teacher', entry.teacher_id), ('room', entry.classroom.id if entry.classroom else None)):
+                        self._refs.setdefault(ref, set()).add(key)
+        self.builds += 1
+
+    def departments(self):
+        """All departments as `DepartmentRow`s, in id order."""
+        with self._lock:
+            self._check_engine()
+            if self._departments is None:
+                self._departments = [DepartmentRow(*row) for row in db.session.query(
+                    Department.id, Department.name, Department.code, Department.section, Department.semester
+                ).order_by(Department.id)]
+            return self._departments
+
+    def department_grids(self, dept_ids):
+        """{dept_id: week} for `dept_ids`; missing grids are built in one query."""
+        with self._lock:
+            self._check_engine()
+            missing = [d for d in dept_ids if ('dept', d) not in self._grids]
+            if missing:
+                weeks = {d: _empty_week() for d in missing}
+                for day, timeslot, entry in _query_entries(TimetableEntry.dept_id.in_(missing)):
+                    if day in weeks[entry.department.id] and timeslot in _SLOT_INDEX:
+                        weeks[entry.department.id][day][_SLOT_INDEX[timeslot]]['entries'].append(entry)
+                for dept_id, week in weeks.items():
+                    _merge_practicals(week, _same_courses)
+                    self._store(('dept', dept_id), week)
+            return {d: self._grids[('dept', d)] for d in dept_ids}
+
+    def teacher_grid(self, teacher_id):
+        with self._lock:
+            self._check_engine()
+            key = ('teacher', teacher_id)
+            if key not in self._grids:
+                week = _empty_week()
+                for day, timeslot, entry in _query_entries(TimetableEntry.teacher_id == teacher_id):
+                    if day in week and timeslot in _SLOT_INDEX:
+                        week[day][_SLOT_INDEX[timeslot]]['entries'].append(entry)
+                _merge_practicals(week, _same_course)
+                self._store(key, week)
+            return self._grids[key]
+
+    def invalidate(self, keys=(), refs=None):
+        """
+        Drops the grids under `keys` and those showing any of `refs`; drops
+        every grid when both are left out.
+        """
+        with self._lock:
+            if not keys and refs is None:
+                self._grids, self._refs, self._departments = {}, {}, None
+                return
+            for key in keys:
+                self._grids.pop(key, None)
+            for ref in refs or ():
+                if ref[0] == 'dept':
+                    self._departments = None
+                for key in self._refs.pop(ref, ()):
+                    self._grids.pop(key, None)
+
+
+grids = GridCache()
+
+
+@change_tracking.subscribe
+def _follow(changes):
+    # After a rollback too: a grid built inside the transaction may have seen its flushed rows.
+    if changes.bulk:
+        grids.invalidate()
+        return
+    keys = set()
+    for values in changes.entries.values():
+        for value in values:
+            if value is not None:
+                keys.update((('dept', value[2]), ('teacher', value[3])))
+    if keys or changes.resources:
+        grids.invalidate(keys, changes.resources)
@@ -0,0 +1,161 @@
+"""
+Background timetable generation.
+
+Only one generation runs at a time. `start_generation` hands back the live job
+when one is already running instead of starting a second one, so two admins
+clicking Generate together cannot interleave delete-and-insert. Progress is
+written to the `GenerationJob` row and read back by the status endpoint.
+"""
+import json
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from models import db, GenerationJob
+from scheduler import Scheduler
+from problem import session_count
+
+PROGRESS_INTERVAL = 0.5  # seconds between progress commits
+
+_lock = threading.Lock()
+_running = {'job_id': None, 'thread': None}
+
+FAILED_MESSAGE = ('Failed to generate timetable. Check if you have enough classrooms '
+                  'or if teachers have exceeded their workload.')
+NO_REQUIREMENTS_MESSAGE = ('Failed: No subjects have teachers assigned. Please go to '
+                           'Allocations to link teachers with subjects.')
+EMPTY_SCOPE_MESSAGE = ('Failed: No departments match the selected departments, semester '
+                       'and section, so there was nothing to generate.')
+
+
+def active_job():
+    """The job currently generating in this process, or None."""
+    with _lock:
+        thread = _running['thread']
+        if thread is None or not thread.is_alive():
+            return None
+        job_id = _running['job_id']
+    return GenerationJob.query.get(job_id)
+
+
+def start_generation(options, user_id=None, background=True):
+    """
+    Starts a generation job with Scheduler keyword `options`.
+
+    Returns (job, created); created is False when an already running job was
+    returned instead. With background=False the job runs to completion before
+    returning.
+    """
+    with _lock:
+        thread = _running['thread']
+        if thread is not None and thread.is_alive():
+            return GenerationJob.query.get(_running['job_id']), False
+
+        # Rows left queued/running by a previous process will never finish.
+        GenerationJob.query.filter(GenerationJob.status.in_(('queued', 'running'))).update(
+            {'status': 'failed', 'message': 'Interrupted by a server restart.',
+             'finished_at': datetime.utcnow()}, synchronize_session=False)
+        job = GenerationJob(status='queued', options=json.dumps(options), created_by=user_id)
+        db.session.add(job)
+        db.session.commit()
+
+        if not background:
+            _run(job.id, options)
+            db.session.refresh(job)
+            return job, True
+
+        app = current_app._get_current_object()
+        thread = threading.Thread(target=_run_in_app, args=(app, job.id, options), daemon=True)
+        _running['job_id'] = job.id
+        _running['thread'] = thread
+        thread.start()
+    return job, True
+
+
+def _run_in_app(app, job_id, options):
+    with app.app_context():
+        try:
+            _run(job_id, options)
+        finally:
+            db.session.remove()
+
+
+def _run(job_id, options):
+    job = GenerationJob.query.get(job_id)
+    job.status = 'running'
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    last_commit = [0.0]
+
+    def progress(placed, total, backtracks):
+        job.placed, job.total, job.backtracks = placed, total, backtracks
+        now = time.monotonic()
+        if now - last_commit[0] >= PROGRESS_INTERVAL:
+            last_commit[0] = now
+            db.session.commit()
+
+    scheduler = None
+    try:
+        scheduler = Scheduler(**options)
+        job.total = session_count(scheduler.requirements)
+        db.session.commit()
+        if scheduler.empty_scope:
+            success, message = False, EMPTY_SCOPE_MESSAGE
+        elif not scheduler.requirements:
+            success, message = False, NO_REQUIREMENTS_MESSAGE
+        else:
+            success = scheduler.generate_timetable(progress=progress)
+            if success and scheduler.scoped:
+                names = ', '.join(f'{d.code} ({d.section})' for d in scheduler.departments)
+                message = f'Timetable regenerated for {names}. Other departments were kept as they were.'
+            elif success:
+                message = 'Timetable generated successfully!'
+            elif scheduler.partial_saved:
+                missing = sum(entry['sessions'] for entry in scheduler.stats.unplaced)
+                message = (f'Saved a partial timetable: {missing} session(s) could not be placed. '
+                           'They are listed below; place them by editing the timetable.')
+            elif scheduler.stats.bottlenecks:
+                message = f'Cannot generate a timetable: {scheduler.stats.bottlenecks[0]}'
+            elif scheduler.stats.outcome == 'infeasible':
+                message = 'No timetable satisfies every rule with the current allocations and rooms (proven by the exact solver).'
+            elif scheduler.stats.outcome == 'unknown':
+                message = 'The exact solver reached its time limit without an answer. Try a longer limit.'
+            else:
+                message = FAILED_MESSAGE
+            if success and scheduler.cache_hit:
+                message += ' Nothing changed since an earlier run, so its result was reused.'
+    except Exception as e:
+        db.session.rollback()
+        print(f"Generation job {job_id} crashed: {e}")
+        success, message = False, f'Generation failed: {e}'
+
+    job = GenerationJob.query.get(job_id)
+    if success:
+        job.status = 'succeeded'
+    elif scheduler is not None and scheduler.partial_saved:
+        job.status = 'partial'
+    else:
+        job.status = 'failed'
+    if success:
+        job.placed = job.total
+    job.message = message[:300]
+    if scheduler is not None:
+        job.stats = json.dumps(scheduler.stats.to_dict())
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def job_to_dict(job):
+    end = job.finished_at or datetime.utcnow()
+    elapsed = (end - job.started_at).total_seconds() if job.started_at else 0.0
+    return {
+        'id': job.id,
+        'status': job.status,
+        'placed': job.placed or 0,
+        'total': job.total or 0,
+        'backtracks': job.backtracks or 0,
+        'elapsed': round(elapsed, 2),
+        'message': job.message,
+        'stats': json.loads(job.stats) if job.stats else None,
+    }
@@ -0,0 +1,136 @@
+"""
+Room assignment after the times are fixed.
+
+A schedule solved against `occupancy.RoomCounts` carries the room group
+('lab' or 'theory') in place of a room id. `match_rooms` replaces it with real
+rooms one slot at a time: a lab block, or a single period for theory. The
+sessions of a slot and the rooms free for all of its cells form a bipartite
+graph, and Hopcroft-Karp finds a maximum matching. Rooms are offered smallest
+capacity first, so a session takes the smallest room that keeps the matching
+perfect and the large rooms stay free as long as possible.
+
+Slots never share a room with another slot, so every day is matched on its
+own and days can be spread over worker processes.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from occupancy import Occupancy, block_mask
+
+
+def hopcroft_karp(adjacent):
+    """
+    Maximum matching of a bipartite graph given as {left: [right, ...]}.
+    Returns {left: right} for every matched left vertex.
+    """
+    match_left = {}
+    match_right = {}
+    infinity = float('inf')
+
+    def bfs():
+        layer = {}
+        queue = deque()
+        for u in adjacent:
+            if u not in match_left:
+                layer[u] = 0
+                queue.append(u)
+        found = False
+        while queue:
+            u = queue.popleft()
+            for v in adjacent[u]:
+                w = match_right.get(v)
+                if w is None:
+                    found = True
+                elif w not in layer:
+                    layer[w] = layer[u] + 1
+                    queue.append(w)
+        return layer if found else None
+
+    def dfs(u, layer):
+        for v in adjacent[u]:
+            w = match_right.get(v)
+            if w is None or (layer.get(w, infinity) == layer[u] + 1 and dfs(w, layer)):
+                match_left[u] = v
+                match_right[v] = u
+                return True
+        layer[u] = infinity
+        return False
+
+    while True:
+        layer = bfs()
+        if layer is None:
+            return match_left
+        for u in adjacent:
+            if u not in match_left:
+                dfs(u, layer)
+
+
+def _match_day(args):
+    """Matches one day's sessions; returns (periods, unmatched sessions)."""
+    sessions, free = args
+    slots = {}
+    for run in sessions:
+        day_idx, start_idx = run[0][0], run[0][1]
+        slots.setdefault((run[0][5], block_mask(day_idx, start_idx, len(run))), []).append(run)
+
+    periods = []
+    unmatched = []
+    for (group, mask), runs in slots.items():
+        rooms = free[(group, mask)]
+        matching = hopcroft_karp({k: rooms for k in range(len(runs))})
+        for k, run in enumerate(runs):
+            room_id = matching.get(k)
+            if room_id is None:
+                unmatched.append(run)
+            else:
+                periods.extend(p[:5] + (room_id,) for p in run)
+    return periods, unmatched
+
+
+def match_rooms(schedule, problem, workers=None):
+    """
+    Replaces the room groups in `schedule` with rooms free around
+    ``problem['fixed']``. Returns the new schedule, or None when some slot
+    holds more sessions than it has rooms.
+    """
+    occupancy = Occupancy.from_problem(problem)
+    index = occupancy.room_index
+    by_day = {}
+    lab_runs = {}
+    for period in sorted(schedule, key=lambda p: (p[0], p[2], p[3], p[4], p[1])):
+        day_idx, slot_idx, dept_id, course_id, teacher_id, group = period
+        if group == 'theory':
+            # Theory rooms are matched period by period.
+            by_day.setdefault(day_idx, []).append([period])
+            continue
+        runs = lab_runs.setdefault((day_idx, dept_id, course_id, teacher_id), [])
+        if runs and runs[-1][-1][1] == slot_idx - 1:
+            runs[-1].append(period)
+        else:
+            runs.append([period])
+            by_day.setdefault(day_idx, []).append(runs[-1])
+
+    jobs = []
+    for day_idx, sessions in sorted(by_day.items()):
+        free = {}
+        for run in sessions:
+            key = (run[0][5], block_mask(day_idx, run[0][1], len(run)))
+            if key not in free:
+                free[key] = index.free_rooms(*key)
+        jobs.append((sessions, free))
+
+    workers = min(workers or 1, len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_match_day, jobs))
+    else:
+        results = [_match_day(job) for job in jobs]
+
+    matched = []
+    for periods, unmatched in results:
+        for run in unmatched:
+            day_idx, start_idx, _, course_id = run[0][:4]
+            print(f"No room left for course {course_id} on day {day_idx}, period {start_idx + 1}")
+        if unmatched:
+            return None
+        matched.extend(periods)
+    return matched
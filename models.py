@@ -69,6 +69,45 @@ class TimetableEntry(db.Model):
     teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable=False)
     classroom_id = db.Column(db.Integer, db.ForeignKey('classroom.id'), nullable=False)
 
+class GenerationJob(db.Model):
+    """
+    A background timetable generation run and its progress.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued, running, succeeded, partial, failed
+    options = db.Column(db.Text, nullable=True) # JSON keyword arguments for Scheduler
+    placed = db.Column(db.Integer, default=0)
+    total = db.Column(db.Integer, default=0)
+    backtracks = db.Column(db.Integer, default=0)
+    message = db.Column(db.String(300), nullable=True)
+    stats = db.Column(db.Text, nullable=True) # JSON GenerationStats.to_dict()
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class CachedSchedule(db.Model):
+    """
+    A solved schedule keyed by the fingerprint of the inputs that produced it.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint = db.Column(db.String(64), unique=True, nullable=False)
+    seed = db.Column(db.Integer, nullable=True)
+    schedule = db.Column(db.Text, nullable=False) # JSON list of solver tuples
+    hits = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TimetableChange(db.Model):
+    """
+    One step of the timetable revision counter; the id is the revision. A row
+    names the entry that was added, moved or deleted, or has no entry when
+    the whole timetable may have changed (generation, clearing, resource edits).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
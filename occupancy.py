@@ -0,0 +1,214 @@
+"""
+Bitset occupancy for the weekly grid.
+
+The week is 6 days x 7 periods = 42 cells, numbered ``day_idx * 7 + slot_idx``.
+Every teacher, room and department owns one integer with a bit per cell, so
+"is this 3-hour block free" is a single AND instead of a set lookup per hour.
+"""
+from models import DAYS, TIMESLOTS
+
+SLOTS_PER_DAY = len(TIMESLOTS)
+NUM_CELLS = len(DAYS) * SLOTS_PER_DAY
+DAY_INDEX = {day: i for i, day in enumerate(DAYS)}
+SLOT_INDEX = {slot: i for i, slot in enumerate(TIMESLOTS)}
+
+
+def cell_index(day_idx, slot_idx):
+    return day_idx * SLOTS_PER_DAY + slot_idx
+
+
+def block_mask(day_idx, start_idx, duration=1):
+    """Mask covering `duration` consecutive periods starting at `start_idx`."""
+    return ((1 << duration) - 1) << cell_index(day_idx, start_idx)
+
+
+def entry_mask(day, timeslot):
+    """Mask for a single stored (day, timeslot) pair, or 0 if it is off-grid."""
+    if day not in DAY_INDEX or timeslot not in SLOT_INDEX:
+        return 0
+    return block_mask(DAY_INDEX[day], SLOT_INDEX[timeslot])
+
+
+class RoomIndex:
+    """
+    Free rooms per cell, as a bitset over each group's rooms.
+
+    Groups (room types, or the solver's 'lab'/'theory' split) list their room
+    ids in preference order, normally smallest capacity first. Bit k of
+    ``free[group][cell]`` is set while the group's k-th room is free in that
+    cell, so the rooms free for a whole block are the AND of its cells.
+    """
+
+    def __init__(self, groups):
+        self.groups = {name: list(room_ids) for name, room_ids in groups.items()}
+        self.position = {}
+        self.free = {}
+        for name, room_ids in self.groups.items():
+            for k, room_id in enumerate(room_ids):
+                self.position[room_id] = (name, 1 << k)
+            self.free[name] = [(1 << len(room_ids)) - 1] * NUM_CELLS
+
+    @classmethod
+    def by_type(cls, classrooms):
+        """Groups rooms by `Classroom.type`, each sorted by capacity."""
+        groups = {}
+        for room in sorted(classrooms, key=lambda r: (r.capacity, r.id)):
+            groups.setdefault(room.type, []).append(room.id)
+        return cls(groups)
+
+    def free_bits(self, group, mask):
+        free = self.free[group]
+        bits = (1 << len(self.groups[group])) - 1
+        while mask and bits:
+            low = mask & -mask
+            bits &= free[low.bit_length() - 1]
+            mask ^= low
+        return bits
+
+    def pick(self, group, mask, rng=None):
+        """
+        A room of `group` free for every cell of `mask`, or None. Without `rng`
+        the first (smallest) room wins; with it the search starts at a random
+        room, which spreads use like a shuffle would.
+        """
+        bits = self.free_bits(group, mask)
+        if not bits:
+            return None
+        room_ids = self.groups[group]
+        if rng is None:
+            return room_ids[(bits & -bits).bit_length() - 1]
+        n = len(room_ids)
+        offset = rng.randrange(n)
+        rotated = ((bits >> offset) | (bits << (n - offset))) & ((1 << n) - 1)
+        return room_ids[((rotated & -rotated).bit_length() - 1 + offset) % n]
+
+    def free_rooms(self, group, mask):
+        """All rooms of `group` free for `mask`, in preference order."""
+        bits = self.free_bits(group, mask)
+        return [room_id for k, room_id in enumerate(self.groups[group]) if bits >> k & 1]
+
+    def _update(self, room_id, mask, busy):
+        found = self.position.get(room_id)
+        if found is None:
+            return
+        name, bit = found
+        free = self.free[name]
+        while mask:
+            low = mask & -mask
+            cell = low.bit_length() - 1
+            free[cell] = free[cell] & ~bit if busy else free[cell] | bit
+            mask ^= low
+
+    def occupy(self, room_id, mask):
+        self._update(room_id, mask, True)
+
+    def release(self, room_id, mask):
+        self._update(room_id, mask, False)
+
+
+class RoomCounts:
+    """
+    Free rooms per group as counts, for placing times before rooms.
+
+    Drop-in for a `RoomIndex` in an `Occupancy`: `pick` hands out the group
+    name as a stand-in room while enough rooms of the group are free for the
+    mask, and `matching.match_rooms` swaps in real rooms afterwards. Counts
+    are kept per mask. That is exact here because, within a group, sessions
+    either cover the same cells or none in common: labs use the fixed lab
+    blocks and theory classes single periods.
+    """
+
+    def __init__(self, index):
+        # Room availability before any session is placed (fixed entries only).
+        self.index = index
+        self.used = {}
+
+    def pick(self, group, mask, rng=None):
+        free = bin(self.index.free_bits(group, mask)).count('1')
+        return group if free > self.used.get((group, mask), 0) else None
+
+    def occupy(self, room_id, mask):
+        self.used[(room_id, mask)] = self.used.get((room_id, mask), 0) + 1
+
+    def release(self, room_id, mask):
+        self.used[(room_id, mask)] -= 1
+
+
+class Occupancy:
+    """
+    Busy masks per teacher, room and department.
+
+    Departments may run two practical batches in parallel, so they keep two
+    masks: `dept` marks cells with at least one session and `dept_full` marks
+    cells that already hold two. An optional `RoomIndex` is kept in step with
+    the room masks.
+    """
+
+    def __init__(self, room_index=None):
+        self.teacher = {}
+        self.room = {}
+        self.dept = {}
+        self.dept_full = {}
+        self.room_index = room_index
+
+    def teacher_free(self, teacher_id, mask):
+        return not self.teacher.get(teacher_id, 0) & mask
+
+    def room_free(self, room_id, mask):
+        return not self.room.get(room_id, 0) & mask
+
+    def dept_free(self, dept_id, mask, parallel=False):
+        """Theory needs an empty cell; practicals only need a spare batch."""
+        busy = self.dept_full if parallel else self.dept
+        return not busy.get(dept_id, 0) & mask
+
+    def first_free_room(self, room_ids, mask):
+        room = self.room
+        for room_id in room_ids:
+            if not room.get(room_id, 0) & mask:
+                return room_id
+        return None
+
+    def add(self, dept_id, teacher_id, room_id, mask):
+        self.teacher[teacher_id] = self.teacher.get(teacher_id, 0) | mask
+        self.room[room_id] = self.room.get(room_id, 0) | mask
+        if self.room_index is not None:
+            self.room_index.occupy(room_id, mask)
+        current = self.dept.get(dept_id, 0)
+        overlap = current & mask
+        if overlap:
+            self.dept_full[dept_id] = self.dept_full.get(dept_id, 0) | overlap
+        self.dept[dept_id] = current | mask
+
+    def remove(self, dept_id, teacher_id, room_id, mask):
+        self.teacher[teacher_id] = self.teacher.get(teacher_id, 0) & ~mask
+        self.room[room_id] = self.room.get(room_id, 0) & ~mask
+        if self.room_index is not None:
+            self.room_index.release(room_id, mask)
+        full = self.dept_full.get(dept_id, 0)
+        self.dept_full[dept_id] = full & ~mask
+        # Cells that held two sessions keep the remaining one.
+        self.dept[dept_id] = self.dept.get(dept_id, 0) & ~(mask & ~full)
+
+    @classmethod
+    def from_problem(cls, problem, rooms_later=False):
+        """
+        Occupancy of a solver problem's fixed placements, with a `RoomIndex`
+        over its 'lab' and 'theory' rooms, or `RoomCounts` when rooms are
+        assigned after the times.
+        """
+        occupancy = cls(RoomIndex({'lab': problem['lab_room_ids'], 'theory': problem['theory_room_ids']}))
+        for day_idx, slot_idx, dept_id, _, teacher_id, room_id in problem.get('fixed', ()):
+            occupancy.add(dept_id, teacher_id, room_id, block_mask(day_idx, slot_idx))
+        if rooms_later:
+            occupancy.room_index = RoomCounts(occupancy.room_index)
+        return occupancy
+
+    @classmethod
+    def from_entries(cls, entries):
+        occupancy = cls()
+        for entry in entries:
+            mask = entry_mask(entry.day, entry.timeslot)
+            if mask:
+                occupancy.add(entry.dept_id, entry.teacher_id, entry.classroom_id, mask)
+        return occupancy
@@ -0,0 +1,239 @@
+"""
+Soft-constraint optimisation of a feasible schedule.
+
+The solvers stop at the first timetable that satisfies the hard rules. This
+pass then improves it by simulated annealing over single theory periods:
+moving one to a free cell of its department, or swapping two of the same
+department. Every move keeps the hard rules intact.
+
+The objective is a weighted sum of
+ - teacher idle gaps: empty periods between a teacher's first and last class
+   of a day,
+ - course clustering: extra sessions of one theory course on the same day,
+ - overload: periods beyond a teacher's daily share of `workload_limit`.
+
+All three are sums over (teacher, day) or (dept, course, day) keys, so a move
+is scored by re-evaluating only the keys it touches.
+"""
+import math
+import random
+import time
+from models import DAYS
+from occupancy import Occupancy, RoomIndex, SLOTS_PER_DAY, block_mask
+
+DEFAULT_WEIGHTS = {'gaps': 1.0, 'clustering': 2.0, 'overload': 3.0}
+DEFAULT_TIME_BUDGET = 2.0
+DAY_BITS = (1 << SLOTS_PER_DAY) - 1
+P6_INDEX = SLOTS_PER_DAY - 2
+P7_INDEX = SLOTS_PER_DAY - 1
+
+
+def _gaps(day_bits):
+    if not day_bits:
+        return 0
+    low = (day_bits & -day_bits).bit_length() - 1
+    high = day_bits.bit_length() - 1
+    return high - low + 1 - bin(day_bits).count('1')
+
+
+class LocalSearchOptimizer:
+    def __init__(self, problem, schedule, rng=None, weights=None, time_budget=DEFAULT_TIME_BUDGET,
+                 start_temperature=2.0, end_temperature=0.05):
+        self.problem = problem
+        self.rng = rng or random.Random()
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.time_budget = time_budget
+        self.start_temperature = start_temperature
+        self.end_temperature = end_temperature
+        # workload_limit is weekly; spread it evenly over the teaching days.
+        self.daily_cap = {teacher_id: math.ceil(limit / len(DAYS))
+                          for teacher_id, limit in problem.get('teacher_limits', {}).items() if limit}
+        self.stats = {'moves': 0, 'accepted': 0, 'initial_score': None, 'final_score': None}
+
+        course_type = {r.course_id: r.course_type for r in problem['requirements']}
+        self.occupancy = Occupancy(RoomIndex({'theory': problem['theory_room_ids']}))
+        for day_idx, slot_idx, dept_id, _, teacher_id, room_id in problem.get('fixed', ()):
+            self.occupancy.add(dept_id, teacher_id, room_id, block_mask(day_idx, slot_idx))
+
+        # An activity in P7 takes the teacher of P6, so those cells stay put.
+        frozen = {(day_idx, dept_id) for day_idx, slot_idx, dept_id, course_id, _, _ in schedule
+                  if slot_idx == P7_INDEX and course_type.get(course_id) == 'Activity Class'}
+
+        self.fixed = []
+        self.movable = []  # [day_idx, slot_idx, dept_id, course_id, teacher_id, room_id]
+        self.course_day = {}
+        for period in schedule:
+            day_idx, slot_idx, dept_id, course_id, teacher_id, room_id = period
+            self.occupancy.add(dept_id, teacher_id, room_id, block_mask(day_idx, slot_idx))
+            kind = course_type.get(course_id)
+            if kind not in ('Practical', 'Activity Class'):
+                key = (dept_id, course_id, day_idx)
+                self.course_day[key] = self.course_day.get(key, 0) + 1
+            if kind in ('Practical', 'Activity Class') or (
+                    slot_idx == P6_INDEX and (day_idx, dept_id) in frozen):
+                self.fixed.append(period)
+            else:
+                self.movable.append(list(period))
+        self.frozen = frozen
+
+        self.by_dept = {}
+        for i, period in enumerate(self.movable):
+            self.by_dept.setdefault(period[2], []).append(i)
+
+    # -- scoring -----------------------------------------------------------
+
+    def _teacher_day_cost(self, teacher_id, day_idx):
+        bits = (self.occupancy.teacher.get(teacher_id, 0) >> (day_idx * SLOTS_PER_DAY)) & DAY_BITS
+        cost = self.weights['gaps'] * _gaps(bits)
+        cap = self.daily_cap.get(teacher_id)
+        if cap is not None:
+            cost += self.weights['overload'] * max(0, bin(bits).count('1') - cap)
+        return cost
+
+    def _course_day_cost(self, dept_id, course_id, day_idx):
+        return self.weights['clustering'] * max(0, self.course_day.get((dept_id, course_id, day_idx), 0) - 1)
+
+    def score(self):
+        """Full objective; used for reporting, moves are scored by delta."""
+        teachers = set(self.occupancy.teacher)
+        total = sum(self._teacher_day_cost(t, d) for t in teachers for d in range(len(DAYS)))
+        total += sum(self._course_day_cost(*key) for key in self.course_day)
+        return total
+
+    def _local_cost(self, teachers, courses):
+        return (sum(self._teacher_day_cost(t, d) for t, d in teachers)
+                + sum(self._course_day_cost(*key) for key in courses))
+
+    # -- moves -------------------------------------------------------------
+
+    def _allowed_cell(self, dept_id, day_idx, slot_idx):
+        return not (slot_idx == P6_INDEX and (day_idx, dept_id) in self.frozen)
+
+    def _shift_course(self, dept_id, course_id, old_day, new_day):
+        self.course_day[(dept_id, course_id, old_day)] -= 1
+        key = (dept_id, course_id, new_day)
+        self.course_day[key] = self.course_day.get(key, 0) + 1
+
+    def _try_relocate(self, i, temperature):
+        """Moves one period to a random cell; returns the applied delta or None."""
+        period = self.movable[i]
+        day_idx, slot_idx, dept_id, course_id, teacher_id, room_id = period
+        new_day = self.rng.randrange(len(DAYS))
+        new_slot = self.rng.randrange(SLOTS_PER_DAY)
+        if (new_day, new_slot) == (day_idx, slot_idx) or not self._allowed_cell(dept_id, new_day, new_slot):
+            return None
+        occ = self.occupancy
+        new_mask = block_mask(new_day, new_slot)
+        if not occ.dept_free(dept_id, new_mask) or not occ.teacher_free(teacher_id, new_mask):
+            return None
+        if new_day != day_idx and self.course_day.get((dept_id, course_id, new_day), 0) >= 2:
+            return None
+        new_room = room_id if occ.room_free(room_id, new_mask) else occ.room_index.pick('theory', new_mask)
+        if new_room is None:
+            return None
+
+        teachers = {(teacher_id, day_idx), (teacher_id, new_day)}
+        courses = {(dept_id, course_id, day_idx), (dept_id, course_id, new_day)}
+        before = self._local_cost(teachers, courses)
+        old_mask = block_mask(day_idx, slot_idx)
+        occ.remove(dept_id, teacher_id, room_id, old_mask)
+        occ.add(dept_id, teacher_id, new_room, new_mask)
+        self._shift_course(dept_id, course_id, day_idx, new_day)
+        delta = self._local_cost(teachers, courses) - before
+        if self._accept(delta, temperature):
+            period[0], period[1], period[5] = new_day, new_slot, new_room
+            return delta
+        occ.remove(dept_id, teacher_id, new_room, new_mask)
+        occ.add(dept_id, teacher_id, room_id, old_mask)
+        self._shift_course(dept_id, course_id, new_day, day_idx)
+        return None
+
+    def _try_swap(self, i, j, temperature):
+        """Exchanges the cells of two periods; returns the applied delta or None."""
+        a, b = self.movable[i], self.movable[j]
+        if a[3] == b[3] and a[4] == b[4]:
+            return None
+        day_a, slot_a, dept_id, course_a, teacher_a, room_a = a
+        day_b, slot_b, _, course_b, teacher_b, room_b = b
+        if day_a != day_b:
+            if course_a != course_b and (self.course_day.get((dept_id, course_a, day_b), 0) >= 2
+                                         or self.course_day.get((dept_id, course_b, day_a), 0) >= 2):
+                return None
+        occ = self.occupancy
+        mask_a, mask_b = block_mask(day_a, slot_a), block_mask(day_b, slot_b)
+        # The department keeps both cells and the rooms stay with their cells,
+        # so only the teachers need checking.
+        if teacher_a != teacher_b and (occ.teacher.get(teacher_a, 0) & mask_b
+                                       or occ.teacher.get(teacher_b, 0) & mask_a):
+            return None
+
+        teachers = {(teacher_a, day_a), (teacher_a, day_b), (teacher_b, day_a), (teacher_b, day_b)}
+        courses = {(dept_id, course_a, day_a), (dept_id, course_a, day_b),
+                   (dept_id, course_b, day_a), (dept_id, course_b, day_b)}
+        before = self._local_cost(teachers, courses)
+        self._swap_teachers(teacher_a, teacher_b, mask_a, mask_b)
+        self._shift_course(dept_id, course_a, day_a, day_b)
+        self._shift_course(dept_id, course_b, day_b, day_a)
+        delta = self._local_cost(teachers, courses) - before
+        if self._accept(delta, temperature):
+            a[0], a[1], a[5], b[0], b[1], b[5] = day_b, slot_b, room_b, day_a, slot_a, room_a
+            return delta
+        self._swap_teachers(teacher_a, teacher_b, mask_b, mask_a)
+        self._shift_course(dept_id, course_a, day_b, day_a)
+        self._shift_course(dept_id, course_b, day_a, day_b)
+        return None
+
+    def _swap_teachers(self, teacher_a, teacher_b, mask_a, mask_b):
+        """Moves teacher_a from mask_a to mask_b and teacher_b the other way."""
+        if teacher_a == teacher_b:
+            return
+        teacher = self.occupancy.teacher
+        teacher[teacher_a] = (teacher[teacher_a] & ~mask_a) | mask_b
+        teacher[teacher_b] = (teacher[teacher_b] & ~mask_b) | mask_a
+
+    def _accept(self, delta, temperature):
+        if delta <= 0:
+            return True
+        return self.rng.random() < math.exp(-delta / temperature)
+
+    # -- driver ------------------------------------------------------------
+
+    def optimize(self):
+        """Runs until the time budget is spent; returns the improved schedule."""
+        self.stats['initial_score'] = current = self.score()
+        best_score, best = current, [list(p) for p in self.movable]
+        depts = [d for d, idx in self.by_dept.items() if len(idx) > 1]
+        if not depts or self.time_budget <= 0:
+            self.stats['final_score'] = current
+            return self.schedule()
+
+        started = time.perf_counter()
+        deadline = started + self.time_budget
+        ratio = self.end_temperature / self.start_temperature
+        rng = self.rng
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            temperature = self.start_temperature * ratio ** ((now - started) / self.time_budget)
+            # Check the clock every batch rather than every move.
+            for _ in range(200):
+                self.stats['moves'] += 1
+                indices = self.by_dept[rng.choice(depts)]
+                i = rng.choice(indices)
+                if rng.random() < 0.5:
+                    delta = self._try_relocate(i, temperature)
+                else:
+                    delta = self._try_swap(i, rng.choice(indices), temperature)
+                if delta is not None:
+                    self.stats['accepted'] += 1
+                    current += delta
+            if current < best_score - 1e-9:
+                best_score, best = current, [list(p) for p in self.movable]
+
+        self.movable = best
+        self.stats['final_score'] = best_score
+        return self.schedule()
+
+    def schedule(self):
+        return self.fixed + [tuple(p) for p in self.movable]
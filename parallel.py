@@ -0,0 +1,50 @@
+"""
+Multi-start generation across a process pool.
+
+The problem is pickled once and handed to each worker through the pool
+initializer, so individual attempts only ship a seed. Workers never import the
+Flask app or open a database session, so the pool can be terminated mid-solve
+once a winner is known.
+"""
+import os
+import pickle
+import random
+from multiprocessing import Pool
+from solver import create_solver
+
+MAX_ATTEMPTS = 64
+
+_worker_problem = None
+
+
+def _init_worker(payload):
+    global _worker_problem
+    _worker_problem = pickle.loads(payload)
+
+
+def _attempt(args):
+    solver, seed, options = args
+    return seed, create_solver(_worker_problem, solver, seed, **options).solve()
+
+
+def solve_multistart(problem, solver='greedy', attempts=8, workers=None, base_seed=None, options=None):
+    """
+    Runs `attempts` differently seeded solves and returns (seed, schedule) for
+    the first one that succeeds, or (None, None) if none do. Attempts still
+    pending or running are stopped as soon as a winner is known.
+    """
+    if base_seed is None:
+        base_seed = random.randrange(2 ** 31)
+    workers = min(workers or os.cpu_count() or 1, attempts)
+    payload = pickle.dumps(problem, protocol=pickle.HIGHEST_PROTOCOL)
+
+    pool = Pool(workers, initializer=_init_worker, initargs=(payload,))
+    try:
+        jobs = [(solver, base_seed + i, options or {}) for i in range(attempts)]
+        for seed, schedule in pool.imap_unordered(_attempt, jobs):
+            if schedule is not None:
+                return seed, schedule
+        return None, None
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,42 @@
+"""
+Compact solver input records.
+
+A course becomes a single `Requirement` carrying how many sessions it needs
+per week, instead of one dict per teaching hour. The solvers work on
+`expand(requirements)`, where every session of a course is the same record
+object, so a 40-hour course costs one record and 40 list slots. Records use
+__slots__ and plain ints/strings, so they pickle cheaply to worker processes
+and can be built in tests without a database.
+"""
+
+
+class Requirement:
+    __slots__ = ('dept_id', 'course_id', 'teacher_id', 'course_type', 'duration', 'count')
+
+    def __init__(self, dept_id, course_id, teacher_id, course_type, duration=1, count=1):
+        self.dept_id = dept_id
+        self.course_id = course_id
+        self.teacher_id = teacher_id
+        self.course_type = course_type
+        self.duration = duration
+        self.count = count
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return (f"Requirement(dept={self.dept_id}, course={self.course_id}, teacher={self.teacher_id}, "
+                f"{self.course_type}, {self.count}x{self.duration})")
+
+
+def expand(requirements):
+    """One entry per session; the sessions of a course share its record."""
+    return [req for req in requirements for _ in range(req.count)]
+
+
+def session_count(requirements):
+    return sum(req.count for req in requirements)
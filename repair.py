@@ -0,0 +1,336 @@
+"""
+Minimal-perturbation repair of the stored timetable.
+
+Deleting a room, teacher or course cascades to its timetable entries and
+leaves holes in the week. `repair_timetable()` is given the periods the
+deletion removed and places those sessions again, as far as their courses
+still need them, trying in order:
+ 1. the period a session had before, in any free room,
+ 2. any other valid start,
+ 3. a start that becomes valid once up to `MAX_MOVES` theory classes or lab
+    blocks in the way are moved elsewhere, fewest moves first.
+Sessions the timetable was already missing (new courses, or what a partial
+or scoped run left out) are not touched; that takes a regeneration.
+Every other entry stays where it is, and the changes are written in one
+transaction.
+"""
+import time
+from models import db, TimetableEntry, Course, DAYS, TIMESLOTS
+from occupancy import Occupancy, DAY_INDEX, SLOT_INDEX, block_mask
+from csp import LAB_START_INDICES, MAX_COURSE_SESSIONS_PER_DAY, LAST_PERIOD
+from scheduler import Scheduler
+
+MAX_MOVES = 3
+P6 = LAST_PERIOD - 1
+
+
+class Repair:
+    """
+    The stored timetable as occupancy plus the per-day rules, so sessions can
+    be added, moved and taken back without a solver run.
+    """
+
+    def __init__(self, problem, entries):
+        # entries: [id, day_idx, slot_idx, dept_id, course_id, teacher_id, room_id, course_type]
+        self.problem = problem
+        self.occ = Occupancy.from_problem(problem)
+        self.rooms = self.occ.room_index
+        self.rows = {}
+        self.lab_periods = {}       # (day_idx, dept_id, block start) -> periods
+        self.course_day = {}        # (day_idx, course_id) -> theory periods
+        self.p6_teachers = {}       # (day_idx, dept_id) -> teachers in P6
+        self.activity_teachers = {}  # (day_idx, dept_id) -> teachers of P7 activities
+        for row in entries:
+            self._occupy(list(row))
+
+    def _update(self, row, step):
+        _, day_idx, slot_idx, dept_id, course_id, teacher_id, _, course_type = row
+        if course_type == 'Practical':
+            key = (day_idx, dept_id, _lab_block(slot_idx))
+            self.lab_periods[key] = self.lab_periods.get(key, 0) + step
+        elif course_type == 'Activity Class':
+            if slot_idx == LAST_PERIOD:
+                teachers = self.activity_teachers.setdefault((day_idx, dept_id), [])
+                if step > 0:
+                    teachers.append(teacher_id)
+                else:
+                    teachers.remove(teacher_id)
+        else:
+            key = (day_idx, course_id)
+            self.course_day[key] = self.course_day.get(key, 0) + step
+        if slot_idx == P6:
+            teachers = self.p6_teachers.setdefault((day_idx, dept_id), [])
+            if step > 0:
+                teachers.append(teacher_id)
+            else:
+                teachers.remove(teacher_id)
+
+    def _occupy(self, row):
+        self.occ.add(row[3], row[5], row[6], block_mask(row[1], row[2]))
+        self._update(row, 1)
+        self.rows[id(row)] = row
+
+    def _vacate(self, row):
+        self.occ.remove(row[3], row[5], row[6], block_mask(row[1], row[2]))
+        self._update(row, -1)
+        del self.rows[id(row)]
+
+    def _starts(self, course_type, duration):
+        if course_type == 'Practical':
+            return LAB_START_INDICES
+        if course_type == 'Activity Class':
+            return (LAST_PERIOD,)
+        return range(len(TIMESLOTS) - duration + 1)
+
+    def _fit(self, req, day_idx, start_idx):
+        """(teacher_id, room_id) for starting `req` there, or None."""
+        mask = block_mask(day_idx, start_idx, req.duration)
+        if req.course_type == 'Practical':
+            other = LAB_START_INDICES[0] if start_idx == LAB_START_INDICES[1] else LAB_START_INDICES[1]
+            if self.lab_periods.get((day_idx, req.dept_id, other)):
+                return None
+            # A second batch may join a lab block, but never a theory class.
+            shared = bool(self.lab_periods.get((day_idx, req.dept_id, start_idx)))
+            if not self.occ.dept_free(req.dept_id, mask, parallel=shared):
+                return None
+            teacher_id = req.teacher_id
+        elif req.course_type == 'Activity Class':
+            if not self.occ.dept_free(req.dept_id, mask):
+                return None
+            # The P6 teacher stays on; with P6 empty any free home teacher will do.
+            candidates = (self.p6_teachers.get((day_idx, req.dept_id))
+                          or self.problem['dept_teachers'].get(req.dept_id, []))
+            teacher_id = next((t for t in candidates if self.occ.teacher_free(t, mask)), None)
+            if teacher_id is None:
+                return None
+        else:
+            if self.course_day.get((day_idx, req.course_id), 0) >= MAX_COURSE_SESSIONS_PER_DAY:
+                return None
+            if not self.occ.dept_free(req.dept_id, mask):
+                return None
+            teacher_id = req.teacher_id
+        if not self.occ.teacher_free(teacher_id, mask):
+            return None
+        # P6 feeds the P7 activity, so its teacher has to stay the activity's.
+        if start_idx <= P6 < start_idx + req.duration and not self._keeps_activity(day_idx, req.dept_id,
+                                                                                   teacher_id):
+            return None
+        room_id = self.rooms.pick('lab' if req.course_type == 'Practical' else 'theory', mask)
+        if room_id is None:
+            return None
+        return teacher_id, room_id
+
+    def _keeps_activity(self, day_idx, dept_id, teacher_id):
+        """
+        Whether a class of `teacher_id` in P6 keeps the P7 activity with a P6
+        teacher; an empty P6 only takes the activity's own teacher.
+        """
+        activity = self.activity_teachers.get((day_idx, dept_id))
+        if not activity or teacher_id in activity:
+            return True
+        return any(t in activity for t in self.p6_teachers.get((day_idx, dept_id), ()))
+
+    def _candidates(self, req, hints):
+        cells = [(d, s) for d in range(len(DAYS)) for s in self._starts(req.course_type, req.duration)]
+        # Former periods first, then the last period only as a fallback.
+        return sorted(cells, key=lambda c: (c not in hints, c[1] == LAST_PERIOD and req.course_type == 'Theory'))
+
+    def _put(self, req, day_idx, start_idx, teacher_id, room_id):
+        rows = []
+        for slot_idx in range(start_idx, start_idx + req.duration):
+            row = [None, day_idx, slot_idx, req.dept_id, req.course_id, teacher_id, room_id, req.course_type]
+            self._occupy(row)
+            rows.append(row)
+        return rows
+
+    def place(self, req, hints=()):
+        """Places one session of `req` directly; returns its rows or None."""
+        for day_idx, start_idx in self._candidates(req, hints):
+            fit = self._fit(req, day_idx, start_idx)
+            if fit is not None:
+                return self._put(req, day_idx, start_idx, *fit)
+        return None
+
+    def _unit(self, row):
+        """
+        The rows that have to move together with `row`, or None if it stays.
+        A theory period moves alone; a practical moves with every batch of its
+        department's lab block that day, so the block stays whole and shared.
+        Activities and the P6 classes or lab block they depend on stay put.
+        """
+        if row[0] is None:
+            return None
+        in_p6 = row[2] == P6 or (row[7] == 'Practical' and _lab_block(row[2]) == _lab_block(P6))
+        if in_p6 and self.activity_teachers.get((row[1], row[3])):
+            return None
+        if row[7] == 'Theory':
+            return [row]
+        if row[7] == 'Practical':
+            block = _lab_block(row[2])
+            rows = [r for r in self.rows.values()
+                    if r[7] == 'Practical' and r[1] == row[1] and r[3] == row[3] and _lab_block(r[2]) == block]
+            if all(r[0] is not None for r in rows):
+                return rows
+        return None
+
+    def _replace(self, unit):
+        """
+        Places the sessions of a vacated unit elsewhere. Returns the (old, new)
+        row pairs, or None after undoing its own placements.
+        """
+        sessions = {}
+        for row in sorted(unit, key=lambda r: r[2]):
+            sessions.setdefault((row[4], row[5], row[6]), []).append(row)
+        moved = []
+        for rows in sessions.values():
+            again = self.place(_Session(rows[0], len(rows)))
+            if again is None:
+                for _, new in moved:
+                    self._vacate(new)
+                return None
+            for old, new in zip(rows, again):
+                new[0] = old[0]
+                moved.append((old, new))
+        return moved
+
+    def place_with_moves(self, req, hints=()):
+        """
+        Places `req` by moving the fewest theory classes or lab blocks out of
+        its way, at most `MAX_MOVES` of them. Returns (rows, [(old row, new
+        row), ...]) or None; nothing changes on failure.
+        """
+        options = []
+        for day_idx, start_idx in self._candidates(req, hints):
+            mask = block_mask(day_idx, start_idx, req.duration)
+            units = {}
+            for row in list(self.rows.values()):
+                if not (block_mask(row[1], row[2]) & mask):
+                    continue
+                if row[3] != req.dept_id and (req.teacher_id is None or row[5] != req.teacher_id):
+                    continue
+                unit = self._unit(row)
+                if unit is None:
+                    break
+                units[frozenset(id(r) for r in unit)] = unit
+            else:
+                if units and len(units) <= MAX_MOVES:
+                    options.append((len(units), day_idx, start_idx, list(units.values())))
+        options.sort(key=lambda option: option[0])
+
+        for _, day_idx, start_idx, units in options:
+            for unit in units:
+                for row in unit:
+                    self._vacate(row)
+            fit = self._fit(req, day_idx, start_idx)
+            if fit is not None:
+                rows = self._put(req, day_idx, start_idx, *fit)
+                moved = []
+                for unit in units:
+                    pairs = self._replace(unit)
+                    if pairs is None:
+                        break
+                    moved.extend(pairs)
+                else:
+                    return rows, moved
+                for _, new in moved:
+                    self._vacate(new)
+                for row in rows:
+                    self._vacate(row)
+            for unit in units:
+                for row in unit:
+                    self._occupy(row)
+        return None
+
+
+def _lab_block(slot_idx):
+    return LAB_START_INDICES[1] if slot_idx >= LAB_START_INDICES[1] else LAB_START_INDICES[0]
+
+
+class _Session:
+    """A stored session (a theory period or a lab block) seen as a one-session requirement."""
+
+    def __init__(self, row, duration=1):
+        self.dept_id, self.course_id, self.teacher_id, self.course_type = row[3], row[4], row[5], row[7]
+        self.duration = duration
+
+
+def removed_periods(condition):
+    """
+    {course_id: [(day_idx, slot_idx), ...]} for the entries matching
+    `condition`, read before they are deleted. A course's list holds one
+    cell per period the delete takes away.
+    """
+    removed = {}
+    for course_id, day, slot in db.session.query(TimetableEntry.course_id, TimetableEntry.day,
+                                                 TimetableEntry.timeslot).filter(condition):
+        if day in DAY_INDEX and slot in SLOT_INDEX:
+            removed.setdefault(course_id, []).append((DAY_INDEX[day], SLOT_INDEX[slot]))
+    return removed
+
+
+def repair_timetable(removed):
+    """
+    Re-places the sessions a deletion took out of the stored timetable.
+    `removed` maps course ids to the (day_idx, slot_idx) cells of their
+    deleted periods. Returns a summary dict with 'placed', 'moved',
+    'unplaced' (course id -> sessions) and 'seconds'.
+    """
+    started = time.perf_counter()
+    scheduler = Scheduler(use_cache=False)
+    problem = scheduler.export_problem()
+    rows = db.session.query(
+        TimetableEntry.id, TimetableEntry.day, TimetableEntry.timeslot, TimetableEntry.dept_id,
+        TimetableEntry.course_id, TimetableEntry.teacher_id, TimetableEntry.classroom_id, Course.type
+    ).join(Course, Course.id == TimetableEntry.course_id).all()
+    entries = [(entry_id, DAY_INDEX[day], SLOT_INDEX[slot], dept_id, course_id, teacher_id, room_id, course_type)
+               for entry_id, day, slot, dept_id, course_id, teacher_id, room_id, course_type in rows
+               if day in DAY_INDEX and slot in SLOT_INDEX]
+    state = Repair(problem, entries)
+
+    stored = {}
+    for entry in entries:
+        stored[entry[4]] = stored.get(entry[4], 0) + 1
+    summary = {'placed': 0, 'moved': 0, 'unplaced': {}}
+    missing = []
+    for req in scheduler.requirements:
+        if req.course_id not in removed:
+            continue
+        # Never more than the deletion removed, nor than the course still lacks.
+        count = min(len(removed[req.course_id]) // req.duration,
+                    req.count - stored.get(req.course_id, 0) // req.duration)
+        missing.extend([req] * max(0, count))
+    # Lab blocks are the hardest to fit, so they go first.
+    missing.sort(key=lambda req: -req.duration)
+
+    new_rows = []
+    moves = {}
+    for req in missing:
+        course_hints = set(removed[req.course_id])
+        rows = state.place(req, course_hints)
+        if rows is None:
+            result = state.place_with_moves(req, course_hints)
+            if result is not None:
+                rows, moved = result
+                for old, new in moved:
+                    moves[old[0]] = new
+        if rows is None:
+            summary['unplaced'][req.course_id] = summary['unplaced'].get(req.course_id, 0) + 1
+            continue
+        new_rows.extend(rows)
+        summary['placed'] += 1
+    summary['moved'] = len(moves)
+
+    if new_rows or moves:
+        table = TimetableEntry.__table__
+        for entry_id, row in moves.items():
+            db.session.execute(table.update().where(table.c.id == entry_id).values(
+                day=DAYS[row[1]], timeslot=TIMESLOTS[row[2]], classroom_id=row[6]))
+        if new_rows:
+            db.session.execute(table.insert(), [
+                {'day': DAYS[row[1]], 'timeslot': TIMESLOTS[row[2]], 'dept_id': row[3], 'course_id': row[4],
+                 'teacher_id': row[5], 'classroom_id': row[6]} for row in new_rows])
+        db.session.commit()
+    summary['seconds'] = time.perf_counter() - started
+    print(f"Repaired timetable: {summary['placed']} session(s) placed, {summary['moved']} moved, "
+          f"{sum(summary['unplaced'].values())} left unplaced in {summary['seconds']:.3f}s")
+    return summary
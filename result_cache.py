@@ -0,0 +1,69 @@
+"""
+Result cache for timetable generation.
+
+A solve is a pure function of the exported problem and the solver options, so
+its result can be reused whenever those are unchanged. The fingerprint is a
+SHA-256 of a canonical JSON dump of both; the cache keeps the
+`CACHE_SIZE` most recently used schedules in the `CachedSchedule` table.
+"""
+import hashlib
+import json
+from datetime import datetime
+from models import db, CachedSchedule
+
+CACHE_SIZE = 20
+
+
+def fingerprint(problem, options):
+    """Hex digest identifying `problem` solved with `options`."""
+    canonical = {
+        'requirements': [[r.dept_id, r.course_id, r.teacher_id, r.course_type, r.duration, r.count]
+                         for r in problem['requirements']],
+        'lab_room_ids': sorted(problem['lab_room_ids']),
+        'theory_room_ids': sorted(problem['theory_room_ids']),
+        'dept_teachers': sorted([dept_id, sorted(teacher_ids)]
+                                for dept_id, teacher_ids in problem['dept_teachers'].items()),
+        'teacher_limits': sorted([teacher_id, limit] for teacher_id, limit
+                                 in problem.get('teacher_limits', {}).items()),
+        'fixed': sorted(list(p) for p in problem.get('fixed', ())),
+        'options': options,
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def lookup(key):
+    """Returns (seed, schedule) for a cached fingerprint, or None."""
+    row = CachedSchedule.query.filter_by(fingerprint=key).first()
+    if row is None:
+        return None
+    row.hits = (row.hits or 0) + 1
+    row.last_used_at = datetime.utcnow()
+    db.session.commit()
+    return row.seed, [tuple(p) for p in json.loads(row.schedule)]
+
+
+def store(key, seed, schedule):
+    """Caches a schedule, evicting the least recently used ones beyond CACHE_SIZE."""
+    try:
+        row = CachedSchedule.query.filter_by(fingerprint=key).first()
+        if row is None:
+            row = CachedSchedule(fingerprint=key)
+            db.session.add(row)
+        row.seed = seed
+        row.schedule = json.dumps(schedule, separators=(',', ':'))
+        row.last_used_at = datetime.utcnow()
+        db.session.flush()
+        stale = CachedSchedule.query.order_by(CachedSchedule.last_used_at.desc(),
+                                              CachedSchedule.id.desc()).offset(CACHE_SIZE).all()
+        for old in stale:
+            db.session.delete(old)
+        db.session.commit()
+    except Exception as e:
+        print(f"Cache store error: {e}")
+        db.session.rollback()
+
+
+def clear():
+    CachedSchedule.query.delete()
+    db.session.commit()
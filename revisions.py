@@ -0,0 +1,55 @@
+"""
+Timetable revision counter.
+
+Every commit that changes the timetable adds `TimetableChange` rows, so the
+highest row id is the current revision:
+ - ORM inserts, updates and deletes of `TimetableEntry` (manual edits,
+   cascades, repairs through the ORM) add one row per entry,
+ - bulk statements on the timetable (generation saves, repairs, clearing)
+   and edits of departments, courses, teachers or rooms add one row without
+   an entry, meaning "anything may have changed". Older rows are pruned then,
+   since no delta can reach past it anyway.
+The rows are written from what `change_tracking` recorded, in the same
+transaction just before it commits, so the counter never runs ahead of or
+behind the data.
+"""
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+import change_tracking
+from models import db, TimetableChange
+
+
+def current_revision():
+    return db.session.query(func.max(TimetableChange.id)).scalar() or 0
+
+
+def changes_since(since):
+    """
+    Ids of the entries changed after revision `since`, or None when a delta
+    cannot be given and the client needs the full timetable.
+    """
+    if since is None or since <= 0:
+        return None
+    rows = db.session.query(TimetableChange.id, TimetableChange.entry_id) \
+        .filter(TimetableChange.id > since).all()
+    if since > current_revision():
+        return None
+    entry_ids = set()
+    for _, entry_id in rows:
+        if entry_id is None:
+            return None
+        entry_ids.add(entry_id)
+    return entry_ids
+
+
+@event.listens_for(Session, 'before_commit')
+def _write_revision(session):
+    # Commit flushes after this hook; flush now so those changes count too.
+    session.flush()
+    changes = change_tracking.pending(session)
+    table = TimetableChange.__table__
+    if changes.bulk or changes.resources - changes.new_resources:
+        revision = session.execute(table.insert().values(entry_id=None)).inserted_primary_key[0]
+        session.execute(table.delete().where(table.c.id < revision))
+    elif changes.entries:
+        session.execute(table.insert(), [{'entry_id': entry_id} for entry_id in sorted(changes.entries)])
@@ -1,7 +1,20 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from functools import wraps
-from models import db, Department, Course, Teacher, Classroom, Allocation, TimetableEntry, User, DAYS, TIMESLOTS, LeaveRequest, Substitution, Message
-from scheduler import Scheduler
+from models import db, Department, Course, Teacher, Classroom, Allocation, TimetableEntry, GenerationJob, User, DAYS, TIMESLOTS, LeaveRequest, Substitution, Message
+from scheduler import SOLVERS, PARTIAL_CONFLICT_MESSAGE
+from solver import DEFAULT_DEADLINE
+from jobs import start_generation, active_job, job_to_dict, NO_REQUIREMENTS_MESSAGE
+from parallel import MAX_ATTEMPTS
+from optimizer import DEFAULT_TIME_BUDGET
+from stats import REASONS
+from snapshot import load_snapshot
+from exact import cpsat_available
+from repair import repair_timetable, removed_periods
+from entry_index import index as entry_index
+from suggestions import find_alternatives
+from grid_cache import grids
+from revisions import current_revision
+from timetable_api import encode_timetable, etag as timetable_etag, SCOPES as API_SCOPES
 from flask_login import login_user, logout_user, login_required, current_user
 import csv
 import io
@@ -10,6 +23,9 @@ from datetime import datetime, date
 
 main = Blueprint('main', __name__)
 
+# Department timetables per lazy-loaded page of the timetable view.
+DEPARTMENTS_PER_PAGE = 4
+
 def admin_required(f):
     from functools import wraps
     @wraps(f)
@@ -462,14 +478,34 @@ def edit_teacher(id):
     depts = Department.query.all()
     return render_template('resources/edit_teacher.html', teacher=teacher, departments=depts)
 
+def _repair_after_delete(removed):
+    """
+    Re-places the sessions a deletion took out of the timetable, unless a
+    generation job is about to replace it anyway or `?repair=0` was given.
+    """
+    if not removed or request.args.get('repair') == '0' or active_job() is not None:
+        return
+    summary = repair_timetable(removed)
+    left = sum(summary['unplaced'].values())
+    if not summary['placed'] and not left:
+        return
+    message = (f"Timetable repaired: {summary['placed']} session(s) re-placed, "
+               f"{summary['moved']} other class(es) moved")
+    if left:
+        flash(f"{message}; {left} session(s) could not be placed. Regenerate to fit them.", 'warning')
+    else:
+        flash(f"{message}.", 'success')
+
 @main.route('/teachers/delete/<int:id>')
 @login_required
 @admin_required
 def delete_teacher(id):
     teacher = Teacher.query.get_or_404(id)
+    removed = removed_periods(TimetableEntry.teacher_id == id)
     db.session.delete(teacher)
     db.session.commit()
     flash('Teacher deleted!', 'warning')
+    _repair_after_delete(removed)
     return redirect(url_for('main.teachers'))
 
 @main.route('/classrooms/edit/<int:id>', methods=['GET', 'POST'])
@@ -491,9 +527,11 @@ def edit_classroom(id):
 @admin_required
 def delete_classroom(id):
     room = Classroom.query.get_or_404(id)
+    removed = removed_periods(TimetableEntry.classroom_id == id)
     db.session.delete(room)
     db.session.commit()
     flash('Classroom deleted!', 'warning')
+    _repair_after_delete(removed)
     return redirect(url_for('main.classrooms'))
 
 @main.route('/courses/edit/<int:id>', methods=['GET', 'POST'])
@@ -518,9 +556,11 @@ def edit_course(id):
 @admin_required
 def delete_course(id):
     course = Course.query.get_or_404(id)
+    removed = removed_periods(TimetableEntry.course_id == id)
     db.session.delete(course)
     db.session.commit()
     flash('Course deleted!', 'warning')
+    _repair_after_delete(removed)
     return redirect(url_for('main.courses'))
 
 @main.route('/allocations/delete/<int:id>')
@@ -537,22 +577,57 @@ def delete_allocation(id):
 @login_required
 @admin_required
 def generate():
-    scheduler = Scheduler()
-    if not scheduler.requirements:
-        flash('Failed: No subjects have teachers assigned. Please go to Allocations to link teachers with subjects.', 'danger')
-        return redirect(url_for('main.allocations'))
-        
-    success = scheduler.generate_timetable()
-    if success:
-        flash('Timetable generated successfully!', 'success')
+    solver = request.form.get('solver', 'greedy')
+    if solver not in SOLVERS:
+        solver = 'greedy'
+    options = {
+        'solver': solver,
+        'attempts': max(1, min(request.form.get('attempts', 1, type=int) or 1, MAX_ATTEMPTS)),
+        'decompose': request.form.get('decompose') == 'on',
+        'dept_ids': request.form.getlist('dept_ids', type=int) or None,
+        'semester': request.form.get('semester') or None,
+        'section': request.form.get('section') or None,
+        'optimize_seconds': DEFAULT_TIME_BUDGET if request.form.get('optimize') == 'on' else 0,
+        'two_phase': request.form.get('two_phase') == 'on',
+    }
+    if request.form.get('partial') == 'on':
+        if options['attempts'] > 1 or options['decompose']:
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify({'error': PARTIAL_CONFLICT_MESSAGE}), 400
+            flash(PARTIAL_CONFLICT_MESSAGE, 'danger')
+            return redirect(url_for('main.timetable'))
+        options['partial'] = True
+        options['time_limit'] = DEFAULT_DEADLINE
+    job, created = start_generation(options, user_id=current_user.id,
+                                    background=not current_app.config.get('TESTING'))
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job_to_dict(job)), 202
+
+    if job.status in ('succeeded', 'partial', 'failed'):
+        if job.message == NO_REQUIREMENTS_MESSAGE:
+            flash(job.message, 'danger')
+            return redirect(url_for('main.allocations'))
+        return redirect(url_for('main.timetable', job=job.id))
+    elif created:
+        flash('Timetable generation started. This page will refresh when it finishes.', 'info')
     else:
-        flash('Failed to generate timetable. Check if you have enough classrooms or if teachers have exceeded their workload.', 'danger')
+        flash('A timetable generation is already running; showing its progress instead.', 'warning')
     return redirect(url_for('main.timetable'))
 
+@main.route('/generate/status/<int:job_id>')
+@login_required
+@admin_required
+def generation_status(job_id):
+    job = GenerationJob.query.get_or_404(job_id)
+    return jsonify(job_to_dict(job))
+
 @main.route('/clear_timetable', methods=['POST'])
 @login_required
 @admin_required
 def clear_timetable():
+    if active_job():
+        flash('A timetable generation is running. Wait for it to finish before clearing.', 'warning')
+        return redirect(url_for('main.timetable'))
     try:
         num_deleted = TimetableEntry.query.delete()
         db.session.commit()
@@ -565,90 +640,34 @@ def clear_timetable():
 def check_conflict(day, timeslot, teacher_id, classroom_id, dept_id, ignore_entry_id=None):
     """
     Checks for conflicts and returns (conflict_found: bool, reason: str).
+    Bookings come from the in-memory `entry_index`; the database is only read
+    to name the entry in the way.
     """
-    teacher_busy = TimetableEntry.query.filter(
-        TimetableEntry.day == day,
-        TimetableEntry.timeslot == timeslot,
-        TimetableEntry.teacher_id == teacher_id,
-        TimetableEntry.id != ignore_entry_id
-    ).first()
-    if teacher_busy:
+    busy = entry_index.busy(day, timeslot, teacher_id, classroom_id, dept_id, ignore_entry_id)
+
+    if busy['teacher']:
+        teacher_busy = db.session.get(TimetableEntry, busy['teacher'][0])
         return True, f"Teacher {teacher_busy.teacher.name} is already teaching {teacher_busy.course.name} in Room {teacher_busy.classroom.name}."
 
-    room_busy = TimetableEntry.query.filter(
-        TimetableEntry.day == day,
-        TimetableEntry.timeslot == timeslot,
-        TimetableEntry.classroom_id == classroom_id,
-        TimetableEntry.id != ignore_entry_id
-    ).first()
-    if room_busy:
+    if busy['room']:
+        room_busy = db.session.get(TimetableEntry, busy['room'][0])
         return True, f"Classroom {room_busy.classroom.name} is already occupied by {room_busy.course.name} ({room_busy.teacher.name})."
 
-    dept_sessions = TimetableEntry.query.filter(
-        TimetableEntry.day == day,
-        TimetableEntry.timeslot == timeslot,
-        TimetableEntry.dept_id == dept_id,
-        TimetableEntry.id != ignore_entry_id
-    ).all()
-    
-    if len(dept_sessions) >= 2:
+    if len(busy['dept']) >= 2:
         return True, "Department already has 2 concurrent sessions (Practical/Batch limit reached)."
     
     
     return False, None
 
-def get_suggestions(entry, limit=5):
+def dept_sessions_at(day, timeslot, dept_id, ignore_entry_id=None):
+    """Number of the department's sessions booked at (day, timeslot)."""
+    return len(entry_index.busy(day, timeslot, dept_id=dept_id, ignore_entry_id=ignore_entry_id)['dept'])
+
+def get_suggestions(entry, classrooms, limit=5):
     """
-    Finds alternative valid slots for the given entry.
+    Finds alternative valid slots for the given entry, nearest first.
     """
-    suggestions = []
-    classrooms = Classroom.query.all()
-    
-    all_days = list(DAYS)
-    all_slots = list(TIMESLOTS)
-    random.shuffle(all_days)
-    random.shuffle(all_slots)
-    preferred_room_type = entry.classroom.type
-
-    for day in all_days:
-        for slot in all_slots:
-            if day == entry.day and slot == entry.timeslot:
-                continue
-                
-            valid_room = None
-            
-            sorted_rooms = sorted(classrooms, key=lambda r: 0 if r.type == preferred_room_type else 1)
-            
-            for room in sorted_rooms:
-                conflict, _ = check_conflict(day, slot, entry.teacher_id, room.id, entry.dept_id, entry.id)
-                if not conflict:
-                    dept_sessions_count = TimetableEntry.query.filter(
-                        TimetableEntry.day == day,
-                        TimetableEntry.timeslot == slot,
-                        TimetableEntry.dept_id == entry.dept_id,
-                        TimetableEntry.id != entry.id
-                    ).count()
-                    
-                    is_practical = entry.course.type == 'Practical'
-                    if is_practical:
-                        if dept_sessions_count >= 2: continue
-                    else:
-                        if dept_sessions_count >= 1: continue
-
-                    valid_room = room
-                    break
-            
-            if valid_room:
-                suggestions.append({
-                    'day': day,
-                    'timeslot': slot,
-                    'classroom': valid_room
-                })
-                
-            if len(suggestions) >= limit:
-                return suggestions
-                
-    return suggestions
+    return find_alternatives(entry, classrooms, limit)
 
 @main.route('/timetable/edit/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -661,6 +680,7 @@ def edit_timetable_entry(id):
         
     suggestions = []
     conflict_reason = None
+    classrooms = Classroom.query.all()
     
     if request.method == 'POST':
         new_day = request.form.get('day')
@@ -671,27 +691,22 @@ def edit_timetable_entry(id):
         conflict, reason = check_conflict(new_day, new_timeslot, new_teacher_id, new_classroom_id, entry.dept_id, entry.id)
         
         if not conflict:
-            dept_sessions = TimetableEntry.query.filter(
-                TimetableEntry.day == new_day,
-                TimetableEntry.timeslot == new_timeslot,
-                TimetableEntry.dept_id == entry.dept_id,
-                TimetableEntry.id != entry.id
-            ).all()
+            dept_sessions = dept_sessions_at(new_day, new_timeslot, entry.dept_id, entry.id)
             
             is_practical = entry.course.type == 'Practical'
             if is_practical:
-                if len(dept_sessions) >= 2:
+                if dept_sessions >= 2:
                     conflict = True
                     reason = "Department limit reached (max 2 parallel practical sessions)."
             else:
-                if len(dept_sessions) >= 1:
+                if dept_sessions >= 1:
                     conflict = True
                     reason = "Department limit reached (Theory classes cannot run parallel to other classes)."
 
         if conflict:
             flash(f'Conflict Detected: {reason}', 'danger')
             conflict_reason = reason
-            suggestions = get_suggestions(entry)
+            suggestions = get_suggestions(entry, classrooms)
         else:
             entry.day = new_day
             entry.timeslot = new_timeslot
@@ -706,7 +721,6 @@ def edit_timetable_entry(id):
                 db.session.rollback()
                 flash(f'Error updating entry: {e}', 'danger')
             
-    classrooms = Classroom.query.all()
     teachers = Teacher.query.all()
     
     return render_template('edit_timetable_entry.html', 
@@ -718,13 +732,8 @@ def edit_timetable_entry(id):
                            suggestions=suggestions,
                            conflict_reason=conflict_reason)
 
-@main.route('/timetable')
-@login_required
-def timetable():
-    slot_map = { t: i for i, t in enumerate(TIMESLOTS) }
-    teacher_schedule = None
-    teacher_profile = None
-    
+def _todays_substitutions():
+    """Today's weekday name (None on Sunday) and {entry_id: substitute name}."""
     today = date.today()
     day_index = today.weekday()
     today_name = DAYS[day_index] if day_index < 6 else None
@@ -737,97 +746,120 @@ def timetable():
         ).all()
         
         todays_substitutions = { sub.timetable_entry_id: sub.substitute_teacher.name for sub in subs }
+    return today_name, todays_substitutions
+
+@main.route('/timetable')
+@login_required
+def timetable():
+    finished_job_id = request.args.get('job', type=int)
+    generation_stats = None
+    if finished_job_id and current_user.role == 'admin':
+        finished_job = GenerationJob.query.get(finished_job_id)
+        if finished_job and finished_job.message:
+            category = {'succeeded': 'success', 'partial': 'warning'}.get(finished_job.status, 'danger')
+            flash(finished_job.message, category)
+        if finished_job and finished_job.stats:
+            generation_stats = job_to_dict(finished_job)['stats']
+            described = list(generation_stats.get('unplaced') or [])
+            if generation_stats.get('failure'):
+                described.append(generation_stats['failure'])
+            for entry in described:
+                course = Course.query.get(entry['course_id'])
+                teacher = Teacher.query.get(entry['teacher_id']) if entry['teacher_id'] else None
+                entry['course'] = f'{course.code} - {course.name}' if course else f"Course #{entry['course_id']}"
+                entry['teacher'] = teacher.name if teacher else 'no teacher'
+
+    teacher_schedule = None
+    teacher_profile = None
+    
+    today_name, todays_substitutions = _todays_substitutions()
     
     if current_user.role == 'teacher' and current_user.teacher_id:
         teacher_profile = Teacher.query.get(current_user.teacher_id)
-        teacher_entries = TimetableEntry.query.filter_by(teacher_id=current_user.teacher_id).all()
-        
-        teacher_schedule = { day: [{'entries': [], 'colspan': 1, 'skip': False} for _ in range(len(TIMESLOTS))] for day in DAYS }
-        
-        for entry in teacher_entries:
-            if entry.day in DAYS and entry.timeslot in slot_map:
-                idx = slot_map[entry.timeslot]
-                teacher_schedule[entry.day][idx]['entries'].append(entry)
-        
-        for day in DAYS:
-            slots = teacher_schedule[day]
-            i = 0
-            while i < len(TIMESLOTS):
-                cell = slots[i]
-                if cell['skip']: 
-                    i += 1
-                    continue
-                primary_entry = cell['entries'][0] if cell['entries'] else None
-                if primary_entry and primary_entry.course.type == 'Practical':
-                    duration = 1
-                    for j in range(i + 1, len(TIMESLOTS)):
-                        next_cell = slots[j]
-                        if next_cell['entries'] and next_cell['entries'][0].course_id == primary_entry.course_id:
-                            duration += 1
-                        else:
-                            break
-                    if duration > 1:
-                        cell['colspan'] = duration
-                        for k in range(1, duration):
-                            slots[i+k]['skip'] = True
-                    i += duration
-                else:
-                    i += 1
+        teacher_schedule = grids.teacher_grid(current_user.teacher_id)
 
-    departments = Department.query.all()
-    entries = TimetableEntry.query.all()
-    
-    timetable_data = {}
-    for dept in departments:
-        dept_schedule = { day: [{'entries': [], 'colspan': 1, 'skip': False} for _ in range(len(TIMESLOTS))] for day in DAYS }
-        timetable_data[dept] = dept_schedule
-        
-    for entry in entries:
-        dept = next((d for d in departments if d.id == entry.dept_id), None)
-        if dept and entry.day in DAYS and entry.timeslot in slot_map:
-            idx = slot_map[entry.timeslot]
-            if 0 <= idx < 7:
-                 timetable_data[dept][entry.day][idx]['entries'].append(entry)
-                 
-    for dept in departments:
-        for day in DAYS:
-            slots = timetable_data[dept][day]
-            i = 0
-            while i < len(TIMESLOTS):
-                cell = slots[i]
-                if cell['skip']: 
-                    i += 1
-                    continue
-                primary_entry = cell['entries'][0] if cell['entries'] else None
-                if primary_entry and primary_entry.course.type == 'Practical':
-                    duration = 1
-                    course_ids = sorted([e.course_id for e in cell['entries']])
-                    
-                    for j in range(i + 1, len(TIMESLOTS)):
-                        next_cell = slots[j]
-                        next_course_ids = sorted([e.course_id for e in next_cell['entries']])
-                        if next_course_ids == course_ids and next_course_ids:
-                            duration += 1
-                        else:
-                            break
-                    
-                    if duration > 1:
-                        cell['colspan'] = duration
-                        for k in range(1, duration):
-                            slots[i+k]['skip'] = True
-                    i += duration
-                else:
-                    i += 1
+    # Only the user's own department is rendered here; the rest of the list
+    # comes a page at a time from timetable_departments.
+    departments = grids.departments()
+    own = [dept for dept in departments if dept.id == current_user.dept_id]
+    dept_weeks = grids.department_grids([dept.id for dept in own])
+    timetable_data = {dept: dept_weeks[dept.id] for dept in own}
 
     return render_template('timetable.html', 
                            timetable_data=timetable_data, 
+                           department_list_url=url_for('main.timetable_departments', exclude=[d.id for d in own]),
+                           semesters=sorted({d.semester for d in departments if d.semester}),
+                           sections=sorted({d.section for d in departments if d.section}),
                            teacher_schedule=teacher_schedule,
                            teacher_profile=teacher_profile,
                            days=DAYS, 
                            time_slots=TIMESLOTS, 
                            Department=Department,
                            todays_substitutions=todays_substitutions,
+                           today_name=today_name,
+                           generation_job=active_job() if current_user.role == 'admin' else None,
+                           generation_stats=generation_stats,
+                           rejection_reasons=REASONS,
+                           partial_deadline=DEFAULT_DEADLINE,
+                           cpsat_available=cpsat_available())
+
+@main.route('/timetable/departments')
+@login_required
+def timetable_departments():
+    """
+    A page of department timetables as an HTML fragment, filtered by
+    semester, section and a name search, for the lazy list on /timetable.
+    """
+    page = max(request.args.get('page', 1, type=int), 1)
+    semester = request.args.get('semester') or None
+    section = request.args.get('section') or None
+    term = (request.args.get('q') or '').strip().lower()
+    exclude = set(request.args.getlist('exclude', type=int))
+
+    matches = [dept for dept in grids.departments()
+               if dept.id not in exclude
+               and (semester is None or dept.semester == semester)
+               and (section is None or dept.section == section)
+               and term in f'{dept.name} {dept.code}'.lower()]
+    start = (page - 1) * DEPARTMENTS_PER_PAGE
+    departments = matches[start:start + DEPARTMENTS_PER_PAGE]
+    next_url = None
+    if start + DEPARTMENTS_PER_PAGE < len(matches):
+        next_url = url_for('main.timetable_departments', page=page + 1, semester=semester or '',
+                           section=section or '', q=term, exclude=sorted(exclude))
+    today_name, todays_substitutions = _todays_substitutions()
+    return render_template('timetable_departments.html',
+                           departments=departments,
+                           weeks=grids.department_grids([dept.id for dept in departments]),
+                           first_page=page == 1,
+                           next_url=next_url,
+                           days=DAYS,
+                           time_slots=TIMESLOTS,
+                           todays_substitutions=todays_substitutions,
                            today_name=today_name)
+
+@main.route('/api/v1/timetable/<scope>/<int:scope_id>')
+@login_required
+def timetable_api(scope, scope_id):
+    """
+    A department's, teacher's or room's timetable as compact JSON, with a
+    strong ETag per revision. Pass `?since=<revision>` for the entries changed
+    after it; a matching If-None-Match gets 304 without reading any entries.
+    """
+    if scope not in API_SCOPES:
+        return jsonify({'error': f"Unknown scope '{scope}', expected one of {', '.join(API_SCOPES)}"}), 404
+    since = request.args.get('since', type=int)
+    revision = current_revision()
+    tag = timetable_etag(scope, scope_id, revision, since)
+    if request.if_none_match.contains(tag):
+        response = current_app.response_class(status=304)
+    else:
+        API_SCOPES[scope][0].query.get_or_404(scope_id)
+        response = jsonify(encode_timetable(scope, scope_id, revision, since))
+    response.set_etag(tag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @main.route('/download/department/<int:dept_id>')
 def download_department_pdf(dept_id):
     return redirect(url_for('main.dashboard'))
@@ -1030,23 +1062,19 @@ def reject_leave(id):
 @main.route('/reports')
 @login_required
 def reports():
-    teachers = Teacher.query.all()
+    snapshot = load_snapshot(with_entries=True)
+    counts = snapshot.entry_counts
     teacher_data = {}
-    for t in teachers:
-        count = TimetableEntry.query.filter_by(teacher_id=t.id).count()
-        teacher_data[t.name] = count
+    for t in snapshot.teachers:
+        teacher_data[t.name] = counts['teacher'].get(t.id, 0)
     
-    departments = Department.query.all()
     dept_data = {}
-    for d in departments:
-        count = TimetableEntry.query.filter_by(dept_id=d.id).count()
-        dept_data[d.name] = count
+    for d in snapshot.departments:
+        dept_data[d.name] = counts['dept'].get(d.id, 0)
 
-    classrooms = Classroom.query.all()
     room_data = {}
-    for r in classrooms:
-        count = TimetableEntry.query.filter_by(classroom_id=r.id).count()
-        room_data[r.name] = count
+    for r in snapshot.classrooms:
+        room_data[r.name] = counts['room'].get(r.id, 0)
 
     return render_template('reports.html', 
                          teacher_data=teacher_data,
@@ -1,231 +1,242 @@
 import random
-from models import db, TimetableEntry, Course, Teacher, Classroom, Department, DAYS, TIMESLOTS
+import time
+from models import db, TimetableEntry, DAYS, TIMESLOTS
+from occupancy import DAY_INDEX, SLOT_INDEX
+from solver import create_solver, SOLVERS
+from parallel import solve_multistart
+from decompose import solve_decomposed
+from optimizer import LocalSearchOptimizer
+from stats import GenerationStats
+from problem import Requirement, session_count
+from feasibility import find_bottlenecks
+from snapshot import load_snapshot
+import result_cache
+
+# Partial saves come from a single in-process solve.
+PARTIAL_CONFLICT_MESSAGE = 'Partial mode works with a single attempt and cannot be combined with splitting by department.'
 
 class Scheduler:
-    def __init__(self):
-        self.departments = Department.query.all()
-        self.classrooms = Classroom.query.all()
-        self.teachers = Teacher.query.all()
-        self.requirements = self._fetch_requirements()
+    def __init__(self, solver='greedy', seed=None, attempts=1, workers=None, decompose=False,
+                 dept_ids=None, semester=None, section=None, use_cache=True, optimize_seconds=0,
+                 time_limit=None, two_phase=False, partial=False):
+        if solver not in SOLVERS:
+            raise ValueError(f"Unknown solver '{solver}', expected one of {', '.join(SOLVERS)}")
+        if partial and (attempts > 1 or decompose):
+            raise ValueError(PARTIAL_CONFLICT_MESSAGE)
+        self.solver = solver
+        # Always pin a seed so a successful run can be reproduced.
+        self.seed_given = seed is not None
+        self.seed = seed if seed is not None else random.randrange(2 ** 31)
+        self.use_cache = use_cache
+        self.cache_hit = False
+        # Time budget for the soft-constraint pass after a feasible solve; 0 skips it.
+        self.optimize_seconds = optimize_seconds
+        self.optimize_stats = None
+        self.attempts = attempts
+        # Wall-clock budget for the solve.
+        self.time_limit = time_limit
+        # Save the best incomplete timetable when a full one is not found in
+        # time; needs a single in-process solve.
+        self.partial = partial
+        self.partial_saved = False
+        # Assign times against room counts first and match concrete rooms after.
+        self.two_phase = two_phase
+        self.workers = workers
+        self.decompose = decompose
+        self.save_stats = None
+        # A scope (department ids and/or semester/section) limits generation to
+        # those departments; everyone else's entries stay as fixed occupancy.
+        self.scoped = dept_ids is not None or semester is not None or section is not None
+        self.stats = GenerationStats()
+        with self.stats.phase('fetch'):
+            self.snapshot = load_snapshot(dept_ids, semester, section)
+            self.departments = self.snapshot.departments
+            self.classrooms = self.snapshot.classrooms
+            self.teachers = self.snapshot.teachers
+            self.requirements = self._fetch_requirements()
         
+    @property
+    def empty_scope(self):
+        """True when a department/semester/section scope matched no department."""
+        return self.scoped and not self.departments
+
     def _fetch_requirements(self):
+        """One `Requirement` per course, counting its weekly sessions."""
         reqs = []
         for dept in self.departments:
-            for course in dept.courses:
-                allocations = course.allocations
-                if not allocations and course.type != 'Activity Class':
+            for course in self.snapshot.courses_by_dept[dept.id]:
+                if course.teacher_id is None and course.type != 'Activity Class':
                     continue
-                
-                teacher_id = None
-                if allocations:
-                    alloc = allocations[0]
-                    teacher_id = alloc.teacher_id
-                
-                if course.type == 'Practical':
-                    num_sessions = course.hours_per_week
-                    for _ in range(num_sessions):
-                        reqs.append({
-                            'dept_id': dept.id,
-                            'course_id': course.id,
-                            'teacher_id': teacher_id,
-                            'course_type': course.type,
-                            'duration': 3
-                        })
-                elif course.type == 'Activity Class':
-                    for _ in range(course.hours_per_week):
-                        reqs.append({
-                            'dept_id': dept.id,
-                            'course_id': course.id,
-                            'teacher_id': teacher_id,
-                            'course_type': 'Activity Class',
-                            'duration': 1
-                        })
-                else:
-                    for _ in range(course.hours_per_week):
-                        reqs.append({
-                            'dept_id': dept.id,
-                            'course_id': course.id,
-                            'teacher_id': teacher_id,
-                            'course_type': course.type,
-                            'duration': 1
-                        })
+                if course.hours_per_week <= 0:
+                    continue
+                # Practical hours_per_week counts 3-hour lab sessions.
+                duration = 3 if course.type == 'Practical' else 1
+                reqs.append(Requirement(dept.id, course.id, course.teacher_id, course.type,
+                                        duration, course.hours_per_week))
         return reqs
 
-    def generate_timetable(self):
+    def export_problem(self):
+        """Snapshot of the solver inputs as plain data, safe to pickle."""
+        rooms = sorted(self.classrooms, key=lambda r: (r.capacity, r.id))
+        dept_teachers = {}
+        for teacher in self.teachers:
+            dept_teachers.setdefault(teacher.dept_id, []).append(teacher.id)
+        return {
+            'requirements': self.requirements,
+            # Smallest rooms first, so a deterministic pick is also a best fit.
+            'lab_room_ids': [r.id for r in rooms if r.type == 'Lab'],
+            'theory_room_ids': [r.id for r in rooms if r.type != 'Lab'],
+            'dept_teachers': dept_teachers,
+            'teacher_limits': {t.id: t.workload_limit for t in self.teachers},
+            'fixed': self._fetch_fixed(),
+        }
+
+    def _fetch_fixed(self):
+        """Existing entries outside the scope, as solver tuples."""
+        if not self.scoped:
+            return []
+        dept_ids = [d.id for d in self.departments]
+        rows = db.session.query(
+            TimetableEntry.day, TimetableEntry.timeslot, TimetableEntry.dept_id, TimetableEntry.course_id,
+            TimetableEntry.teacher_id, TimetableEntry.classroom_id
+        ).filter(~TimetableEntry.dept_id.in_(dept_ids)).all()
+        return [(DAY_INDEX[day], SLOT_INDEX[slot], dept_id, course_id, teacher_id, room_id)
+                for day, slot, dept_id, course_id, teacher_id, room_id in rows
+                if day in DAY_INDEX and slot in SLOT_INDEX]
+
+    def generate_timetable(self, progress=None):
+        """
+        Solves and saves the timetable; returns True on success. Timings,
+        search counters and the cause of a failure are left on `self.stats`.
+        In partial mode an incomplete timetable may still be saved; the call
+        then returns False with `partial_saved` set and ``stats.unplaced``
+        listing what is missing.
+        """
+        if self.empty_scope:
+            print("The scope matched no departments or sections; nothing to schedule.")
+            return False
         if not self.requirements:
             print("No requirements found to schedule (check allocations).")
             return False
-            
-        schedule = []
-        main_reqs = [r for r in self.requirements if r['course_type'] != 'Activity Class']
-        activity_reqs = [r for r in self.requirements if r['course_type'] == 'Activity Class']
-        main_reqs.sort(key=lambda x: x['duration'], reverse=True)
 
-        teacher_busy = set()
-        room_busy = set()
-        dept_sessions = {}
-        dept_day_has_lab_block = set()
-        dept_course_day_count = {}
+        with self.stats.phase('fetch'):
+            problem = self.export_problem()
+        with self.stats.phase('cache'):
+            key = result_cache.fingerprint(problem, self._cache_options()) if self.use_cache else None
+            cached = result_cache.lookup(key) if key else None
+        if cached is not None:
+            seed, schedule = cached
+            if seed is not None:
+                self.seed = seed
+            self.cache_hit = True
+            print(f"Inputs unchanged, restoring cached timetable (seed {self.seed}).")
+            if progress:
+                total = session_count(self.requirements)
+                progress(total, total, 0)
+            return self._save(schedule)
 
-        LAB_START_INDICES = [1, 4]
-        for req in main_reqs:
-            assigned = False
-            duration = req['duration']
-            is_practical = req['course_type'] == 'Practical'
-            
-            domain = []
-            if is_practical:
-                lab_slots = []
-                for day in DAYS:
-                    for idx in LAB_START_INDICES:
-                        lab_slots.append((day, idx))
-                random.shuffle(lab_slots)
-                domain = lab_slots
-            else:
-                p1_p6 = []
-                for day in DAYS:
-                    for idx in range(len(TIMESLOTS)-1):
-                        p1_p6.append((day, idx))
-                random.shuffle(p1_p6)
-                
-                p7_slots = [(day, len(TIMESLOTS)-1) for day in DAYS]
-                random.shuffle(p7_slots)
-                
-                domain = p1_p6 + p7_slots
-            
-            for day, start_idx in domain:
-                if is_practical and (day, req['dept_id']) in dept_day_has_lab_block:
-                    existing_lab_start = None
-                    for entry in schedule:
-                        if entry.day == day and entry.dept_id == req['dept_id']:
-                            idx = TIMESLOTS.index(entry.timeslot)
-                            if idx in LAB_START_INDICES:
-                                existing_lab_start = idx
-                                break
-                    
-                    if existing_lab_start is not None and existing_lab_start != start_idx:
-                        continue
-                if not is_practical:
-                    current_day_count = dept_course_day_count.get((day, req['dept_id'], req['course_id']), 0)
-                    if current_day_count >= 2:
-                        continue
+        with self.stats.phase('precheck'):
+            names = {'dept': {d.id: f'{d.code} ({d.section})' for d in self.departments},
+                     'teacher': {t.id: t.name for t in self.teachers}}
+            self.stats.bottlenecks = find_bottlenecks(problem, names)
+        if self.stats.bottlenecks:
+            for bottleneck in self.stats.bottlenecks:
+                print(f"Infeasible: {bottleneck}")
+            if not self.partial:
+                return False
 
-                slots_indices = range(start_idx, start_idx + duration)
-                if max(slots_indices) >= len(TIMESLOTS): continue
-                
-                conflict = False
-                for idx in slots_indices:
-                    time = TIMESLOTS[idx]
-                    key = (day, time, req['dept_id'])
-                    if (day, time, req['teacher_id']) in teacher_busy:
-                        conflict = True; break
-                    current_count = dept_sessions.get(key, 0)
-                    if is_practical:
-                        if current_count >= 2: conflict = True; break
-                    else:
-                        if current_count >= 1: conflict = True; break
+        # Worker processes keep their own counters, so only the in-process
+        # solver reports per-phase placement stats; pooled runs time as a whole.
+        if self.decompose:
+            with self.stats.phase('solve'):
+                schedule = solve_decomposed(problem, self.solver, self.seed, workers=self.workers,
+                                            options=self._solver_options())
+        elif self.attempts > 1:
+            with self.stats.phase('solve'):
+                seed, schedule = solve_multistart(problem, self.solver, self.attempts,
+                                                  workers=self.workers, base_seed=self.seed,
+                                                  options=self._solver_options())
+            if schedule is not None:
+                self.seed = seed
+        else:
+            schedule = create_solver(problem, self.solver, self.seed, on_progress=progress, stats=self.stats,
+                                     workers=self.workers, partial=self.partial,
+                                     **self._solver_options()).solve()
+        if schedule is None:
+            return False
+        if self.optimize_seconds:
+            with self.stats.phase('optimize'):
+                optimizer = LocalSearchOptimizer(problem, schedule, rng=random.Random(self.seed),
+                                                 time_budget=self.optimize_seconds)
+                schedule = optimizer.optimize()
+            self.optimize_stats = optimizer.stats
+            print(f"Optimized timetable: score {optimizer.stats['initial_score']:.0f} -> "
+                  f"{optimizer.stats['final_score']:.0f} ({optimizer.stats['moves']} moves)")
+        if not self._save(schedule):
+            return False
+        if self.stats.unplaced:
+            self.partial_saved = True
+            missing = sum(entry['sessions'] for entry in self.stats.unplaced)
+            print(f"Saved a partial timetable; {missing} session(s) could not be placed.")
+            return False
+        if key:
+            with self.stats.phase('cache'):
+                result_cache.store(key, self.seed, schedule)
+        return True
 
-                if conflict: continue
+    def _solver_options(self):
+        """Backend options; each backend keeps the ones it understands."""
+        return {'time_limit': self.time_limit, 'two_phase': self.two_phase}
 
-                best_room = None
-                candidates = [r for r in self.classrooms 
-                               if (is_practical and r.type == 'Lab') or 
-                                  (not is_practical and r.type != 'Lab')]
-                random.shuffle(candidates)
+    def _cache_options(self):
+        """
+        Solver options that change the result. Without an explicit seed any
+        earlier solution of the same inputs is acceptable, so the random seed
+        is left out of the key.
+        """
+        return {
+            'solver': self.solver,
+            'attempts': self.attempts,
+            'decompose': self.decompose,
+            'optimize_seconds': self.optimize_seconds,
+            'time_limit': self.time_limit,
+            'two_phase': self.two_phase,
+            'seed': self.seed if self.seed_given else None,
+            'scope': sorted(d.id for d in self.departments) if self.scoped else None,
+        }
 
-                for room in candidates:
-                    room_conflict = False
-                    for idx in slots_indices:
-                        if (day, TIMESLOTS[idx], room.id) in room_busy:
-                            room_conflict = True; break
-                    if not room_conflict:
-                        best_room = room; break
-                
-                if best_room:
-                    for idx in slots_indices:
-                        time = TIMESLOTS[idx]
-                        entry = TimetableEntry(day=day, timeslot=time, dept_id=req['dept_id'],
-                                             course_id=req['course_id'], teacher_id=req['teacher_id'],
-                                             classroom_id=best_room.id)
-                        schedule.append(entry)
-                        teacher_busy.add((day, time, req['teacher_id']))
-                        room_busy.add((day, time, best_room.id))
-                        key = (day, time, req['dept_id'])
-                        dept_sessions[key] = dept_sessions.get(key, 0) + 1
-                        skey = (day, req['dept_id'], req['course_id'])
-                        dept_course_day_count[skey] = dept_course_day_count.get(skey, 0) + 1
-                    
-                    if is_practical:
-                        dept_day_has_lab_block.add((day, req['dept_id']))
-                    assigned = True
-                    break
-            
-            if not assigned:
-                print(f"Failed to assign {req['course_type']} requirement for Course ID {req['course_id']}")
-                return False 
-        for req in activity_reqs:
-            assigned = False
-            days_shuffled = list(DAYS)
-            random.shuffle(days_shuffled)
-            
-            p6_index = 5
-            p7_index = 6
-            p6_time = TIMESLOTS[p6_index]
-            p7_time = TIMESLOTS[p7_index]
-            
-            for day in days_shuffled:
-                p6_teacher_id = None
-                for entry in schedule:
-                    if entry.day == day and entry.timeslot == p6_time and entry.dept_id == req['dept_id']:
-                        p6_teacher_id = entry.teacher_id
-                        break
-                
-                target_teacher_id = p6_teacher_id
-                if not target_teacher_id:
-                    dept_teachers = [t for t in self.teachers if t.dept_id == req['dept_id']]
-                    random.shuffle(dept_teachers)
-                    for t in dept_teachers:
-                        if (day, p7_time, t.id) not in teacher_busy:
-                            target_teacher_id = t.id
-                            break
-                
-                if not target_teacher_id:
-                    continue 
-                
-                if (day, p7_time, target_teacher_id) in teacher_busy:
-                    continue
-                if dept_sessions.get((day, p7_time, req['dept_id']), 0) >= 1:
-                    continue
-                
-                best_room = None
-                candidates = [r for r in self.classrooms if r.type != 'Lab']
-                random.shuffle(candidates)
-                for room in candidates:
-                    if (day, p7_time, room.id) not in room_busy:
-                        best_room = room; break
-                
-                if best_room:
-                    entry = TimetableEntry(day=day, timeslot=p7_time, dept_id=req['dept_id'],
-                                         course_id=req['course_id'], teacher_id=target_teacher_id,
-                                         classroom_id=best_room.id)
-                    schedule.append(entry)
-                    teacher_busy.add((day, p7_time, target_teacher_id))
-                    room_busy.add((day, p7_time, best_room.id))
-                    dept_sessions[(day, p7_time, req['dept_id'])] = 1
-                    assigned = True
-                    break
-            
-            if not assigned:
-                print(f"FAILED: Could not assign Activity {req['course_id']} - no suitable P6 class found or constraints too tight.")
-                return False
+    def _save(self, schedule):
+        """
+        Replaces the stored timetable with `schedule` in one transaction.
 
+        Rows go through a single Core executemany insert, so no ORM objects or
+        identity-map bookkeeping are involved. Throughput is kept on
+        `self.save_stats`.
+        """
+        table = TimetableEntry.__table__
+        rows = [{'day': DAYS[day_idx], 'timeslot': TIMESLOTS[slot_idx], 'dept_id': dept_id,
+                 'course_id': course_id, 'teacher_id': teacher_id, 'classroom_id': room_id}
+                for day_idx, slot_idx, dept_id, course_id, teacher_id, room_id in schedule]
+        started = time.perf_counter()
         try:
-            TimetableEntry.query.delete()
-            for entry in schedule:
-                db.session.add(entry)
+            if self.scoped:
+                db.session.execute(table.delete().where(table.c.dept_id.in_([d.id for d in self.departments])))
+            else:
+                db.session.execute(table.delete())
+            if rows:
+                db.session.execute(table.insert(), rows)
             db.session.commit()
-            return True
         except Exception as e:
             print(f"Save error: {e}")
             db.session.rollback()
             return False
+        elapsed = time.perf_counter() - started
+        self.stats.phases['save'] = self.stats.phases.get('save', 0.0) + elapsed
+        self.save_stats = {
+            'rows': len(rows),
+            'seconds': elapsed,
+            'rows_per_second': len(rows) / elapsed if elapsed > 0 else float(len(rows)),
+        }
+        print(f"Saved {len(rows)} timetable entries in {elapsed:.3f}s "
+              f"({self.save_stats['rows_per_second']:.0f} rows/s)")
+        return True
@@ -0,0 +1,92 @@
+"""
+Read-only snapshot of the scheduling inputs.
+
+`load_snapshot()` reads departments, courses, allocations, teachers and
+classrooms with one column query each, so the number of round trips stays
+the same however many courses there are. Rows come back as namedtuples in
+id order and the snapshot refuses assignment, so it can be shared by the
+scheduler, the report page and the command-line checks without anyone
+mutating it or lazily loading relationships behind the caller's back.
+"""
+from collections import namedtuple
+from types import MappingProxyType
+from sqlalchemy import func
+from models import db, Department, Course, Teacher, Classroom, Allocation, TimetableEntry
+
+DepartmentRow = namedtuple('DepartmentRow', 'id name code section semester')
+# teacher_id is the course's first allocation, or None while unallocated.
+CourseRow = namedtuple('CourseRow', 'id name code dept_id type hours_per_week teacher_id')
+TeacherRow = namedtuple('TeacherRow', 'id name dept_id workload_limit')
+ClassroomRow = namedtuple('ClassroomRow', 'id name capacity type')
+
+
+class Snapshot:
+    """
+    Tuples of rows plus `courses_by_dept`. With entries loaded,
+    `entry_counts['dept' | 'teacher' | 'room']` maps ids to how many
+    timetable entries they hold; otherwise it is None.
+    """
+    __slots__ = ('departments', 'courses', 'teachers', 'classrooms', 'courses_by_dept', 'entry_counts')
+
+    def __init__(self, departments, courses, teachers, classrooms, entry_counts=None):
+        by_dept = {d.id: [] for d in departments}
+        for course in courses:
+            by_dept.setdefault(course.dept_id, []).append(course)
+        values = {
+            'departments': tuple(departments),
+            'courses': tuple(courses),
+            'teachers': tuple(teachers),
+            'classrooms': tuple(classrooms),
+            'courses_by_dept': MappingProxyType({d: tuple(c) for d, c in by_dept.items()}),
+            'entry_counts': None if entry_counts is None else MappingProxyType(
+                {kind: MappingProxyType(counts) for kind, counts in entry_counts.items()}),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshot is read-only")
+
+
+def load_snapshot(dept_ids=None, semester=None, section=None, with_entries=False):
+    """
+    Loads the departments matching the filters with their courses, and all
+    teachers and classrooms. `with_entries` adds one grouped count over the
+    stored timetable.
+    """
+    dept_query = db.session.query(Department.id)
+    if dept_ids is not None:
+        dept_query = dept_query.filter(Department.id.in_(dept_ids))
+    if semester is not None:
+        dept_query = dept_query.filter(Department.semester == semester)
+    if section is not None:
+        dept_query = dept_query.filter(Department.section == section)
+    scope = dept_query.scalar_subquery()
+
+    departments = [DepartmentRow(*row) for row in db.session.query(
+        Department.id, Department.name, Department.code, Department.section, Department.semester
+    ).filter(Department.id.in_(scope)).order_by(Department.id)]
+
+    first_teacher = {}
+    for course_id, teacher_id in db.session.query(Allocation.course_id, Allocation.teacher_id).join(
+            Course, Course.id == Allocation.course_id).filter(Course.dept_id.in_(scope)).order_by(Allocation.id):
+        first_teacher.setdefault(course_id, teacher_id)
+
+    courses = [CourseRow(*row, first_teacher.get(row[0])) for row in db.session.query(
+        Course.id, Course.name, Course.code, Course.dept_id, Course.type, Course.hours_per_week
+    ).filter(Course.dept_id.in_(scope)).order_by(Course.dept_id, Course.id)]
+
+    teachers = [TeacherRow(*row) for row in db.session.query(
+        Teacher.id, Teacher.name, Teacher.dept_id, Teacher.workload_limit).order_by(Teacher.id)]
+    classrooms = [ClassroomRow(*row) for row in db.session.query(
+        Classroom.id, Classroom.name, Classroom.capacity, Classroom.type).order_by(Classroom.id)]
+
+    entry_counts = None
+    if with_entries:
+        entry_counts = {'dept': {}, 'teacher': {}, 'room': {}}
+        for dept_id, teacher_id, room_id, count in db.session.query(
+                TimetableEntry.dept_id, TimetableEntry.teacher_id, TimetableEntry.classroom_id, func.count()
+        ).group_by(TimetableEntry.dept_id, TimetableEntry.teacher_id, TimetableEntry.classroom_id):
+            for kind, key in (('dept', dept_id), ('teacher', teacher_id), ('room', room_id)):
+                entry_counts[kind][key] = entry_counts[kind].get(key, 0) + count
+    return Snapshot(departments, courses, teachers, classrooms, entry_counts)
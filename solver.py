@@ -0,0 +1,339 @@
+"""
+Plain-data timetable solving.
+
+`TimetableSolver` never touches the database: it takes the problem produced by
+`Scheduler.export_problem()` (a dict of `problem.Requirement` records, lists
+and ints) and returns a list of ``(day_idx, slot_idx, dept_id, course_id,
+teacher_id, room_id)`` tuples, one per occupied period. That keeps it picklable for worker processes.
+
+An optional ``problem['fixed']`` list of the same tuples is treated as already
+occupied; those periods are not part of the returned schedule.
+
+With `partial`, a solve that fails or runs past `time_limit` still returns
+the best schedule it found, and the sessions it left out are listed in
+``stats.unplaced`` with the reason they did not fit.
+
+Solvers are looked up by name in `BACKENDS`. `create_solver()` builds one from
+a problem; the built-in heuristics are 'greedy' and 'backtracking', and
+'cpsat' runs the exact model in `exact.py` when OR-Tools is installed.
+"""
+import random
+import time
+from functools import partial
+from models import DAYS, TIMESLOTS
+from occupancy import Occupancy, block_mask
+from csp import BacktrackingSolver, LAB_START_INDICES
+from stats import GenerationStats
+from problem import expand
+from exact import CpSatSolver
+from matching import match_rooms
+
+HEURISTICS = ('greedy', 'backtracking')
+BACKTRACKING_RESTARTS = 3
+# Best-effort passes in a row without improvement before a partial result is kept.
+PARTIAL_PASSES = 5
+# Time limit for generation from the web UI when partial results are allowed.
+DEFAULT_DEADLINE = 30.0
+
+# name -> (factory, option names). A factory is called as
+# factory(problem, seed=..., on_progress=..., stats=..., **options) and returns
+# an object whose solve() gives a schedule or None.
+BACKENDS = {}
+
+
+def register_backend(name, factory, options=()):
+    BACKENDS[name] = (factory, tuple(options))
+
+
+def create_solver(problem, solver='greedy', seed=None, on_progress=None, stats=None, **options):
+    """
+    Builds the named backend. Options it does not take, or that are None, are
+    dropped, so callers can pass e.g. a time limit regardless of the backend.
+    """
+    if solver not in BACKENDS:
+        raise ValueError(f"Unknown solver '{solver}', expected one of {', '.join(BACKENDS)}")
+    factory, accepted = BACKENDS[solver]
+    options = {name: value for name, value in options.items() if name in accepted and value is not None}
+    return factory(problem, seed=seed, on_progress=on_progress, stats=stats, **options)
+
+
+class TimetableSolver:
+    def __init__(self, problem, solver='greedy', seed=None, on_progress=None, stats=None,
+                 two_phase=False, workers=None, time_limit=None, partial=False):
+        if solver not in HEURISTICS:
+            raise ValueError(f"Unknown solver '{solver}', expected one of {', '.join(HEURISTICS)}")
+        self.problem = problem
+        self.solver = solver
+        self.rng = random.Random(seed)
+        # Called as on_progress(placed, total, backtracks) while solving.
+        self.on_progress = on_progress
+        self.backtracks = 0
+        self.stats = stats if stats is not None else GenerationStats()
+        # One entry per session to place.
+        self.sessions = expand(problem['requirements'])
+        # Place times against room counts, then match rooms per slot, with
+        # `workers` processes for the room phase.
+        self.two_phase = two_phase
+        self.workers = workers
+        self.deadline = time.monotonic() + time_limit if time_limit else None
+        self.partial = partial
+
+    def _report(self, placed):
+        if self.on_progress:
+            self.on_progress(placed, len(self.sessions), self.backtracks)
+
+    def _expired(self):
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    def solve(self):
+        main_reqs = [r for r in self.sessions if r.course_type != 'Activity Class']
+        activity_reqs = [r for r in self.sessions if r.course_type == 'Activity Class']
+
+        # (unplaced, schedule) of the best partial result so far.
+        best = None
+        # The search is complete for the main phase, but the activity rule
+        # (P6 teacher takes P7) is only checked afterwards, so allow restarts.
+        attempts = BACKTRACKING_RESTARTS if self.solver == 'backtracking' else 1
+        for _ in range(attempts):
+            if self._expired():
+                break
+            occupancy = self._fixed_occupancy()
+            unplaced = [] if self.partial else None
+            with self.stats.phase('main'):
+                if self.solver == 'backtracking':
+                    schedule = self._place_backtracking(main_reqs, occupancy)
+                else:
+                    schedule = self._place_greedy(main_reqs, occupancy, unplaced)
+            if schedule is None:
+                break
+            with self.stats.phase('activities'):
+                placed = self._place_activities(activity_reqs, schedule, occupancy, unplaced)
+            if placed and not unplaced:
+                self.stats.failure = None
+                return self._finish(schedule)
+            if unplaced and (best is None or len(unplaced) < len(best[0])):
+                best = (unplaced, schedule)
+        if not self.partial:
+            return None
+
+        with self.stats.phase('partial'):
+            unplaced, schedule = self._best_effort(main_reqs, activity_reqs, best)
+        if not unplaced:
+            self.stats.failure = None
+        for req, phase, reason, rejected in unplaced:
+            self.stats.unplace(req, phase, reason, rejected)
+        return self._finish(schedule)
+
+    def _best_effort(self, main_reqs, activity_reqs, best):
+        """
+        Greedy passes that leave out whatever does not fit, until the deadline
+        or `PARTIAL_PASSES` passes in a row bring no improvement. Returns the
+        (unplaced, schedule) pair with the fewest sessions left out.
+        """
+        stale = 0
+        while best is None or (best[0] and stale < PARTIAL_PASSES and not self._expired()):
+            occupancy = self._fixed_occupancy()
+            unplaced = []
+            schedule = self._place_greedy(main_reqs, occupancy, unplaced)
+            self._place_activities(activity_reqs, schedule, occupancy, unplaced)
+            if best is None or len(unplaced) < len(best[0]):
+                best = (unplaced, schedule)
+                stale = 0
+            else:
+                stale += 1
+        return best
+
+    def _finish(self, schedule):
+        if self.two_phase:
+            with self.stats.phase('rooms'):
+                schedule = match_rooms(schedule, self.problem, self.workers)
+        return schedule
+
+    def _fixed_occupancy(self):
+        """Occupancy pre-filled with placements the solver must work around."""
+        return Occupancy.from_problem(self.problem, rooms_later=self.two_phase)
+
+    def _place_greedy(self, main_reqs, occupancy, unplaced=None):
+        """
+        Places `main_reqs` in order. A requirement with no valid start fails
+        the pass, or is added to `unplaced` and skipped when that list is given.
+        """
+
+        schedule = []
+        main_reqs = sorted(main_reqs, key=lambda x: x.duration, reverse=True)
+        # (day_idx, dept_id) -> start of that day's lab block; parallel batches
+        # must share it.
+        lab_start = {}
+        dept_course_day_count = {}
+        rooms = occupancy.room_index
+
+        stats = self.stats
+        for placed, req in enumerate(main_reqs, 1):
+            assigned = False
+            rejected = {}
+            duration = req.duration
+            is_practical = req.course_type == 'Practical'
+            
+            domain = []
+            if is_practical:
+                lab_slots = []
+                for day_idx in range(len(DAYS)):
+                    for idx in LAB_START_INDICES:
+                        lab_slots.append((day_idx, idx))
+                self.rng.shuffle(lab_slots)
+                domain = lab_slots
+            else:
+                p1_p6 = []
+                for day_idx in range(len(DAYS)):
+                    for idx in range(len(TIMESLOTS)-1):
+                        p1_p6.append((day_idx, idx))
+                self.rng.shuffle(p1_p6)
+                
+                p7_slots = [(day_idx, len(TIMESLOTS)-1) for day_idx in range(len(DAYS))]
+                self.rng.shuffle(p7_slots)
+                
+                domain = p1_p6 + p7_slots
+            
+            for day_idx, start_idx in domain:
+                if start_idx + duration > len(TIMESLOTS): continue
+                reason = None
+                mask = block_mask(day_idx, start_idx, duration)
+                if is_practical and lab_start.get((day_idx, req.dept_id), start_idx) != start_idx:
+                    reason = 'lab_block'
+                elif not is_practical and dept_course_day_count.get((day_idx, req.dept_id, req.course_id), 0) >= 2:
+                    reason = 'daily_cap'
+                elif not occupancy.teacher_free(req.teacher_id, mask):
+                    reason = 'teacher'
+                elif not occupancy.dept_free(req.dept_id, mask, parallel=is_practical):
+                    reason = 'department'
+                stats.tried += 1
+                if reason is not None:
+                    rejected[reason] = rejected.get(reason, 0) + 1
+                    continue
+
+                best_room = rooms.pick('lab' if is_practical else 'theory', mask, self.rng)
+                if best_room is None:
+                    rejected['room'] = rejected.get('room', 0) + 1
+                
+                if best_room is not None:
+                    for idx in range(start_idx, start_idx + duration):
+                        schedule.append((day_idx, idx, req.dept_id, req.course_id, req.teacher_id, best_room))
+                    occupancy.add(req.dept_id, req.teacher_id, best_room, mask)
+                    skey = (day_idx, req.dept_id, req.course_id)
+                    dept_course_day_count[skey] = dept_course_day_count.get(skey, 0) + duration
+                    
+                    if is_practical:
+                        lab_start.setdefault((day_idx, req.dept_id), start_idx)
+                    assigned = True
+                    self._report(placed)
+                    break
+            
+            for reason, count in rejected.items():
+                stats.reject(reason, count)
+            if not assigned:
+                if unplaced is not None:
+                    unplaced.append((req, 'main', 'No valid slot left', rejected))
+                    continue
+                print(f"Failed to assign {req.course_type} requirement for Course ID {req.course_id}")
+                stats.fail(req, 'main', 'No valid slot left', rejected)
+                return None
+        return schedule
+
+    def _place_backtracking(self, main_reqs, occupancy):
+        reserved = {}
+        for req in self.problem['requirements']:
+            if req.course_type == 'Activity Class':
+                reserved[req.dept_id] = reserved.get(req.dept_id, 0) + req.count
+        def progress(placed, backtracks):
+            self.backtracks = base + backtracks
+            self._report(placed)
+
+        base = self.backtracks
+        solver = BacktrackingSolver(main_reqs, self.problem['lab_room_ids'], self.problem['theory_room_ids'],
+                                    occupancy, reserved_last_periods=reserved, rng=self.rng,
+                                    on_progress=progress, stats=self.stats, deadline=self.deadline)
+        placements = solver.solve()
+        self.backtracks = base + solver.backtracks
+        self.stats.backtracks = self.backtracks
+        if placements is None:
+            print(f"Backtracking search failed after {solver.backtracks} backtracks")
+            if solver.failed is not None:
+                if solver.timed_out:
+                    reason = 'Time limit reached'
+                elif solver.backtracks > solver.max_backtracks:
+                    reason = 'Backtrack limit reached'
+                else:
+                    reason = 'No valid slot left'
+                self.stats.fail(main_reqs[solver.failed], 'main', reason, solver.explain(solver.failed))
+            return None
+        schedule = []
+        for req, day_idx, start_idx, room_id in placements:
+            for idx in range(start_idx, start_idx + req.duration):
+                schedule.append((day_idx, idx, req.dept_id, req.course_id, req.teacher_id, room_id))
+        return schedule
+
+    def _place_activities(self, activity_reqs, schedule, occupancy, unplaced=None):
+        rooms = occupancy.room_index
+        # (day_idx, slot_idx, dept_id) -> teacher of the first class placed there
+        occupant = {}
+        for day_idx, slot_idx, dept_id, _, teacher_id, _ in schedule:
+            occupant.setdefault((day_idx, slot_idx, dept_id), teacher_id)
+        main_count = len(self.sessions) - len(activity_reqs)
+        stats = self.stats
+        for placed, req in enumerate(activity_reqs, 1):
+            assigned = False
+            rejected = {}
+            days_shuffled = list(range(len(DAYS)))
+            self.rng.shuffle(days_shuffled)
+            
+            p6_index = 5
+            p7_index = 6
+            
+            for day_idx in days_shuffled:
+                stats.tried += 1
+                p7_mask = block_mask(day_idx, p7_index)
+                target_teacher_id = occupant.get((day_idx, p6_index, req.dept_id))
+                if not target_teacher_id:
+                    dept_teachers = list(self.problem['dept_teachers'].get(req.dept_id, []))
+                    self.rng.shuffle(dept_teachers)
+                    for teacher_id in dept_teachers:
+                        if occupancy.teacher_free(teacher_id, p7_mask):
+                            target_teacher_id = teacher_id
+                            break
+                
+                if not target_teacher_id or not occupancy.teacher_free(target_teacher_id, p7_mask):
+                    rejected['teacher'] = rejected.get('teacher', 0) + 1
+                    continue
+                if not occupancy.dept_free(req.dept_id, p7_mask):
+                    rejected['department'] = rejected.get('department', 0) + 1
+                    continue
+                
+                best_room = rooms.pick('theory', p7_mask, self.rng)
+                if best_room is None:
+                    rejected['room'] = rejected.get('room', 0) + 1
+                
+                if best_room is not None:
+                    schedule.append((day_idx, p7_index, req.dept_id, req.course_id, target_teacher_id, best_room))
+                    occupancy.add(req.dept_id, target_teacher_id, best_room, p7_mask)
+                    occupant.setdefault((day_idx, p7_index, req.dept_id), target_teacher_id)
+                    assigned = True
+                    self._report(main_count + placed)
+                    break
+            
+            for reason, count in rejected.items():
+                stats.reject(reason, count)
+            if not assigned:
+                if unplaced is not None:
+                    unplaced.append((req, 'activities', 'No free last period with a teacher', rejected))
+                    continue
+                print(f"FAILED: Could not assign Activity {req.course_id} - no suitable P6 class found or constraints too tight.")
+                stats.fail(req, 'activities', 'No free last period with a teacher', rejected)
+                return False
+        return True
+
+
+HEURISTIC_OPTIONS = ('two_phase', 'workers', 'time_limit', 'partial')
+register_backend('greedy', partial(TimetableSolver, solver='greedy'), options=HEURISTIC_OPTIONS)
+register_backend('backtracking', partial(TimetableSolver, solver='backtracking'), options=HEURISTIC_OPTIONS)
+register_backend('cpsat', CpSatSolver, options=('time_limit', 'workers'))
+SOLVERS = tuple(BACKENDS)
@@ -0,0 +1,89 @@
+"""
+Instrumentation for timetable generation.
+
+A `GenerationStats` travels with one `Scheduler` run. It collects wall time
+per phase, how many candidate placements the solvers tried and why they were
+rejected, and, when generation fails, the requirement that ran out of options
+or the bottlenecks found by the feasibility pre-check. A partial result lists
+the sessions it left out.
+Everything is plain data so it can be stored as JSON with the job or written
+by the benchmarks.
+"""
+import time
+from contextlib import contextmanager
+
+# Rejection reasons, in display order.
+REASONS = {
+    'teacher': 'Teacher busy',
+    'department': 'Department busy',
+    'room': 'No free room',
+    'lab_block': 'Lab block start rule',
+    'daily_cap': 'Daily course cap',
+    'last_period': 'Last periods reserved for activities',
+    'lookahead': 'Would leave another class without options',
+}
+
+
+class GenerationStats:
+    def __init__(self):
+        self.phases = {}
+        self.tried = 0
+        self.rejected = {}
+        self.backtracks = 0
+        self.failure = None
+        # Reasons the inputs were rejected before any search started.
+        self.bottlenecks = []
+        # Exact backends report 'optimal', 'feasible', 'infeasible' or 'unknown'.
+        self.outcome = None
+        # Sessions missing from a partial result, one entry per course and reason.
+        self.unplaced = []
+
+    @contextmanager
+    def phase(self, name):
+        """Adds the time spent inside the block to phase `name`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def reject(self, reason, count=1):
+        self.rejected[reason] = self.rejected.get(reason, 0) + count
+
+    def fail(self, req, phase, reason, rejected=None):
+        """Records the requirement that could not be placed."""
+        self.failure = _describe(req, phase, reason, rejected)
+
+    def unplace(self, req, phase, reason, rejected=None):
+        """Records a session left out of a partial timetable."""
+        for entry in self.unplaced:
+            if (entry['dept_id'], entry['course_id'], entry['reason']) == (req.dept_id, req.course_id, reason):
+                entry['sessions'] += 1
+                return
+        entry = _describe(req, phase, reason, rejected)
+        entry['sessions'] = 1
+        self.unplaced.append(entry)
+
+    def to_dict(self):
+        return {
+            'phases': {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            'tried': self.tried,
+            'rejected': dict(self.rejected),
+            'backtracks': self.backtracks,
+            'failure': self.failure,
+            'bottlenecks': list(self.bottlenecks),
+            'outcome': self.outcome,
+            'unplaced': [dict(entry) for entry in self.unplaced],
+        }
+
+
+def _describe(req, phase, reason, rejected):
+    return {
+        'phase': phase,
+        'reason': reason,
+        'dept_id': req.dept_id,
+        'course_id': req.course_id,
+        'teacher_id': req.teacher_id,
+        'course_type': req.course_type,
+        'rejected': dict(rejected or {}),
+    }
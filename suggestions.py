@@ -0,0 +1,54 @@
+"""
+Alternative slots for a timetable entry that cannot go where it was asked.
+
+The week comes from the in-memory `entry_index` as bitset occupancy (see
+occupancy.py): one mask per teacher and department and a `RoomIndex` over
+the classrooms. The cells the teacher and department can take are then a
+couple of mask operations, and each of those cells needs one AND per room
+type to find a free room, so the cost barely grows with the number of rooms.
+
+Alternatives are ranked by room type (the entry's own type first) and then
+by distance from the entry's current slot, so the nearest moves come first.
+"""
+from models import DAYS, TIMESLOTS
+from entry_index import index as entry_index
+from occupancy import RoomIndex, NUM_CELLS, SLOTS_PER_DAY, DAY_INDEX, SLOT_INDEX, entry_mask
+
+ALL_CELLS = (1 << NUM_CELLS) - 1
+
+
+def find_alternatives(entry, classrooms, limit=5):
+    """
+    Up to `limit` dicts with 'day', 'timeslot' and 'classroom' where `entry`
+    could move without a conflict. Runs no SQL once the index is loaded.
+    """
+    rooms = {room.id: room for room in classrooms}
+    occupancy = entry_index.occupancy(RoomIndex.by_type(classrooms), ignore_entry_id=entry.id)
+
+    # Practicals may share a cell with one other batch; anything else needs it empty.
+    parallel = entry.course.type == 'Practical'
+    dept_busy = (occupancy.dept_full if parallel else occupancy.dept).get(entry.dept_id, 0)
+    open_cells = ALL_CELLS & ~occupancy.teacher.get(entry.teacher_id, 0) & ~dept_busy
+    open_cells &= ~entry_mask(entry.day, entry.timeslot)
+
+    index = occupancy.room_index
+    preferred = entry.classroom.type if entry.classroom else None
+    groups = sorted(index.groups, key=lambda name: name != preferred)
+    day_idx = DAY_INDEX.get(entry.day, 0)
+    slot_idx = SLOT_INDEX.get(entry.timeslot, 0)
+
+    ranked = []
+    while open_cells:
+        low = open_cells & -open_cells
+        open_cells ^= low
+        cell = low.bit_length() - 1
+        for rank, group in enumerate(groups):
+            room_id = index.pick(group, low)
+            if room_id is not None:
+                day, slot = divmod(cell, SLOTS_PER_DAY)
+                distance = abs(day - day_idx) + abs(slot - slot_idx)
+                ranked.append(((rank, distance, abs(day - day_idx), cell), day, slot, room_id))
+                break
+    ranked.sort()
+    return [{'day': DAYS[day], 'timeslot': TIMESLOTS[slot], 'classroom': rooms[room_id]}
+            for _, day, slot, room_id in ranked[:limit]]
@@ -0,0 +1,36 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db, Department, Allocation
+from benchmarks.synthetic import generate_institution
+from benchmarks.run import compare, _make_app
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_synthetic_institution_is_deterministic(self):
+        def build():
+            app = _make_app()
+            with app.app_context():
+                db.create_all()
+                summary = generate_institution(departments=3, sections=2, shared_teachers=0.5, seed=4)
+                allocations = sorted((a.course_id, a.teacher_id) for a in Allocation.query.all())
+                self.assertEqual(Department.query.count(), 6)
+                db.session.remove()
+                db.drop_all()
+            return summary, allocations
+        self.assertEqual(build(), build())
+
+    def test_compare_flags_slower_and_less_successful_runs(self):
+        baseline = {'results': {'small/greedy': {'success_rate': 1.0, 'solve_seconds_median': 0.5,
+                                                 'save_seconds_median': 0.001, 'peak_memory_mb': 2.0}}}
+        current = {'results': {'small/greedy': {'success_rate': 0.5, 'solve_seconds_median': 1.0,
+                                                'save_seconds_median': 0.002, 'peak_memory_mb': 2.1}}}
+        regressions = compare(baseline, current, tolerance=0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('small/greedy: success rate'))
+
+
+if __name__ == '__main__':
+    unittest.main()
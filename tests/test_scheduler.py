@@ -0,0 +1,746 @@
+import unittest
+import pickle
+import importlib.util
+import random
+import re
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from flask_login import LoginManager
+from sqlalchemy import event
+from models import db, User, Department, Teacher, Course, Classroom, Allocation, TimetableEntry, CachedSchedule, GenerationJob, DAYS, TIMESLOTS
+from occupancy import Occupancy, RoomIndex, block_mask, entry_mask
+from scheduler import Scheduler
+from problem import Requirement, session_count
+from solver import TimetableSolver, create_solver
+from stats import GenerationStats
+from feasibility import find_bottlenecks
+from parallel import solve_multistart
+from decompose import find_clusters, reconcile_rooms
+from jobs import start_generation, job_to_dict, EMPTY_SCOPE_MESSAGE
+from snapshot import load_snapshot
+from matching import hopcroft_karp, match_rooms
+from benchmarks.synthetic import generate_institution
+from csp import LAST_PERIOD
+from repair import Repair, repair_timetable, removed_periods
+from entry_index import index as entry_index
+from suggestions import find_alternatives
+from grid_cache import grids
+from revisions import current_revision
+from timetable_api import encode_timetable
+from routes import main
+import change_tracking
+import result_cache
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def make_web_app():
+    """`make_app` plus the routes and a login manager, for client requests."""
+    app = make_app()
+    app.root_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    app.config['SECRET_KEY'] = 'test'
+    login_manager = LoginManager()
+    login_manager.init_app(app)
+    login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+    app.context_processor(lambda: {'unread_count': 0})
+    app.register_blueprint(main)
+    return app
+
+
+def seed_institution(num_depts=3, lab_rooms=2, theory_rooms=4):
+    for i in range(lab_rooms):
+        db.session.add(Classroom(name=f'Lab {i}', capacity=30, type='Lab'))
+    for i in range(theory_rooms):
+        db.session.add(Classroom(name=f'Room {i}', capacity=60, type='Classroom'))
+    for d in range(num_depts):
+        dept = Department(name=f'Dept {d}', code=f'D{d}')
+        db.session.add(dept)
+        db.session.flush()
+        teachers = [Teacher(name=f'T{d}-{k}', dept_id=dept.id) for k in range(3)]
+        db.session.add_all(teachers)
+        db.session.flush()
+        courses = [
+            Course(name='Theory A', code=f'D{d}A', dept_id=dept.id, type='Theory', hours_per_week=4),
+            Course(name='Theory B', code=f'D{d}B', dept_id=dept.id, type='Theory', hours_per_week=3),
+            Course(name='Lab', code=f'D{d}L', dept_id=dept.id, type='Practical', hours_per_week=2),
+            Course(name='Activity', code=f'D{d}X', dept_id=dept.id, type='Activity Class', hours_per_week=1),
+        ]
+        db.session.add_all(courses)
+        db.session.flush()
+        for course, teacher in zip(courses[:3], teachers):
+            db.session.add(Allocation(course_id=course.id, teacher_id=teacher.id))
+    db.session.commit()
+
+
+def assert_valid_timetable(test, entries):
+    teacher_cells = set()
+    room_cells = set()
+    dept_cells = {}
+    for e in entries:
+        key = (e.day, e.timeslot)
+        test.assertNotIn(key + (e.teacher_id,), teacher_cells)
+        test.assertNotIn(key + (e.classroom_id,), room_cells)
+        teacher_cells.add(key + (e.teacher_id,))
+        room_cells.add(key + (e.classroom_id,))
+        dept_cells[key + (e.dept_id,)] = dept_cells.get(key + (e.dept_id,), 0) + 1
+    for count in dept_cells.values():
+        test.assertLessEqual(count, 2)
+
+
+class TestOccupancy(unittest.TestCase):
+    def test_block_mask_covers_consecutive_cells(self):
+        self.assertEqual(block_mask(0, 0), 1)
+        self.assertEqual(block_mask(1, 1, 3), 0b111 << (len(TIMESLOTS) + 1))
+        self.assertEqual(entry_mask('Sunday', TIMESLOTS[0]), 0)
+
+    def test_department_allows_two_parallel_practicals(self):
+        occ = Occupancy()
+        lab = block_mask(2, 1, 3)
+        occ.add(1, 10, 100, lab)
+        self.assertFalse(occ.dept_free(1, block_mask(2, 2)))
+        self.assertTrue(occ.dept_free(1, lab, parallel=True))
+        occ.add(1, 11, 101, lab)
+        self.assertFalse(occ.dept_free(1, lab, parallel=True))
+        occ.remove(1, 11, 101, lab)
+        self.assertTrue(occ.dept_free(1, lab, parallel=True))
+        self.assertFalse(occ.dept_free(1, lab))
+        self.assertTrue(occ.teacher_free(11, lab))
+        self.assertEqual(occ.first_free_room([100, 101], lab), 101)
+
+
+    def test_room_index_tracks_free_rooms_per_block(self):
+        index = RoomIndex({'lab': [5, 6, 7]})
+        occ = Occupancy(index)
+        occ.add(1, 10, 5, block_mask(0, 1, 3))
+        occ.add(2, 11, 6, block_mask(0, 3))
+        self.assertEqual(index.free_rooms('lab', block_mask(0, 1, 3)), [7])
+        self.assertEqual(index.pick('lab', block_mask(0, 0)), 5)
+        occ.add(3, 12, 7, block_mask(0, 2))
+        self.assertIsNone(index.pick('lab', block_mask(0, 1, 3), random.Random(1)))
+        occ.remove(1, 10, 5, block_mask(0, 1, 3))
+        self.assertEqual(index.pick('lab', block_mask(0, 1, 3), random.Random(1)), 5)
+
+
+class TestMatching(unittest.TestCase):
+    def test_hopcroft_karp_reroutes_a_greedy_choice(self):
+        # Taking room 1 for session 'a' first would strand 'b'.
+        matching = hopcroft_karp({'a': [1, 2], 'b': [1], 'c': [2, 3]})
+        self.assertEqual(len(matching), 3)
+        self.assertEqual(matching['b'], 1)
+        self.assertEqual(len(set(matching.values())), 3)
+
+    def test_rooms_are_matched_around_fixed_entries(self):
+        problem = {'lab_room_ids': [5, 6], 'theory_room_ids': [7],
+                   # Lab 5 is taken for the first period of Monday's early block.
+                   'fixed': [(0, 1, 9, 90, 900, 5)]}
+        schedule = [(0, s, 1, 10, 100, 'lab') for s in (1, 2, 3)] + [(0, 0, 1, 11, 101, 'theory')]
+        self.assertEqual(sorted({p[5] for p in match_rooms(schedule, problem)}), [6, 7])
+        second = [(0, s, 2, 12, 102, 'lab') for s in (1, 2, 3)]
+        self.assertIsNone(match_rooms(schedule + second, problem))
+
+
+class TestProblem(unittest.TestCase):
+    def test_solver_runs_on_compact_records_without_a_database(self):
+        requirements = [
+            Requirement(1, 10, 100, 'Theory', count=4),
+            Requirement(1, 11, 101, 'Practical', duration=3, count=2),
+            Requirement(1, 12, None, 'Activity Class', count=1),
+        ]
+        self.assertEqual(session_count(requirements), 7)
+        problem = pickle.loads(pickle.dumps({
+            'requirements': requirements, 'lab_room_ids': [1], 'theory_room_ids': [2],
+            'dept_teachers': {1: [100, 101]}, 'fixed': [],
+        }))
+        schedule = TimetableSolver(problem, 'backtracking', seed=1).solve()
+        self.assertEqual(len(schedule), 4 + 2 * 3 + 1)
+
+
+    def test_activities_do_not_count_against_the_allocated_teacher(self):
+        requirements = [Requirement(1, 10, 100, 'Theory', count=38)]
+        requirements += [Requirement(d, 20 + d, 100, 'Activity Class', count=6) for d in (2, 3)]
+        problem = {'requirements': requirements, 'lab_room_ids': [], 'theory_room_ids': [1, 2, 3],
+                   'dept_teachers': {}, 'fixed': []}
+        self.assertEqual(find_bottlenecks(problem), [])
+        requirements.append(Requirement(4, 11, 100, 'Theory', count=5))
+        self.assertEqual(find_bottlenecks(problem),
+                         ['Teacher #100 is allocated 43 periods but only 42 are free.'])
+
+    def test_room_shortfall_is_reported_before_the_last_period(self):
+        requirements = [Requirement(d, 10 + d, 100 + d, 'Theory', count=30) for d in (1, 2)]
+        requirements += [Requirement(d, 20 + d, None, 'Activity Class', count=6) for d in (1, 2)]
+        problem = {'requirements': requirements, 'lab_room_ids': [], 'theory_room_ids': [1],
+                   'dept_teachers': {}, 'fixed': []}
+        self.assertEqual(find_bottlenecks(problem),
+                         ['Theory rooms: 72 single periods need rooms but 1 theory room(s) '
+                          'offer only 42 free room periods.'])
+        # With rooms to spare over the week, the last period is the one that overflows.
+        problem['requirements'] = [Requirement(d, 20 + d, None, 'Activity Class', count=6) for d in (1, 2)]
+        self.assertEqual(len(find_bottlenecks(problem)), 1)
+        self.assertTrue(find_bottlenecks(problem)[0].startswith('Last-period rooms: 12 activity periods'))
+
+class TestRepair(unittest.TestCase):
+    def test_lab_pair_moves_as_one_unit(self):
+        # Department 1 is full except a lab pair on Monday P2-P4 and Tuesday P5-P7,
+        # where teachers 1 and 2 teach department 2.
+        problem = {'lab_room_ids': [200, 201], 'theory_room_ids': [100, 101, 102], 'dept_teachers': {}}
+        entries, next_id = [], 1
+        for day_idx in range(len(DAYS)):
+            for slot_idx in range(len(TIMESLOTS)):
+                if day_idx == 0 and 1 <= slot_idx <= 3:
+                    for teacher_id, room_id in ((3, 200), (4, 201)):
+                        entries.append((next_id, day_idx, slot_idx, 1, 30 + teacher_id, teacher_id, room_id, 'Practical'))
+                        next_id += 1
+                elif day_idx == 1 and slot_idx >= 4:
+                    for teacher_id, room_id in ((1, 101), (2, 102)):
+                        entries.append((next_id, day_idx, slot_idx, 2, 20 + teacher_id, teacher_id, room_id, 'Theory'))
+                        next_id += 1
+                else:
+                    entries.append((next_id, day_idx, slot_idx, 1, 10, 1, 100, 'Theory'))
+                    next_id += 1
+        state = Repair(problem, entries)
+        req = Requirement(1, 11, 2, 'Theory')
+
+        self.assertIsNone(state.place(req))
+        rows, moved = state.place_with_moves(req)
+        self.assertEqual([(r[1], r[5]) for r in rows], [(0, 2)])
+        self.assertEqual(len(moved), 6)
+        self.assertEqual({old[0] for old, _ in moved}, {e[0] for e in entries if e[7] == 'Practical'})
+        self.assertEqual({(new[1], new[2]) for _, new in moved}, {(1, 4), (1, 5), (1, 6)})
+        self.assertEqual({new[6] for _, new in moved}, {200, 201})
+
+
+class TestTimetableRoutes(unittest.TestCase):
+    def setUp(self):
+        self.app = make_web_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        seed_institution(num_depts=6)
+        for dept in Department.query.all():
+            dept.semester = 'Semester 2' if dept.id % 2 == 0 else 'Semester 1'
+            dept.section = 'B' if dept.id > 4 else 'A'
+        user = User(username='admin', password='x', role='admin')
+        db.session.add(user)
+        db.session.commit()
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def shown(self, **params):
+        response = self.client.get('/timetable/departments', query_string=params)
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        return [int(dept_id) for dept_id in re.findall(r'id="dept-card-(\d+)"', html)], html
+
+    def test_exact_solver_is_offered_only_with_ortools(self):
+        response = self.client.get('/timetable')
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('value="backtracking"', html)
+        self.assertEqual('value="cpsat"' in html, importlib.util.find_spec('ortools') is not None)
+
+    def test_partial_mode_rejects_multistart_and_decompose(self):
+        for extra in ({'attempts': '2'}, {'decompose': 'on'}):
+            response = self.client.post('/generate', data=dict(solver='greedy', partial='on', **extra))
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(GenerationJob.query.count(), 0)
+        with self.assertRaises(ValueError):
+            Scheduler(attempts=2, partial=True)
+
+    def test_department_list_is_paginated(self):
+        first, html = self.shown()
+        self.assertEqual(first, [1, 2, 3, 4])
+        self.assertIn('data-next="/timetable/departments?page=2', html)
+        second, html = self.shown(page=2)
+        self.assertEqual(second, [5, 6])
+        self.assertNotIn('data-next', html)
+
+    def test_department_list_filters_by_semester_and_section(self):
+        shown, _ = self.shown(semester='Semester 2')
+        self.assertEqual(shown, [2, 4, 6])
+        shown, _ = self.shown(semester='Semester 2', section='B')
+        self.assertEqual(shown, [6])
+        shown, html = self.shown(semester='Semester 3')
+        self.assertEqual(shown, [])
+        self.assertIn('No other departments match this filter.', html)
+
+    def test_page_past_the_end_is_empty(self):
+        shown, html = self.shown(page=9)
+        self.assertEqual(shown, [])
+        self.assertNotIn('data-next', html)
+        self.assertNotIn('No other departments', html)
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.app = make_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        seed_institution()
+        random.seed(7)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_generates_conflict_free_timetable(self):
+        self.assertTrue(Scheduler().generate_timetable())
+        entries = TimetableEntry.query.all()
+        # 7 theory hours + 2 three-hour labs + 1 activity per department
+        self.assertEqual(len(entries), 3 * (7 + 6 + 1))
+        assert_valid_timetable(self, entries)
+
+    def test_backtracking_solver_generates_conflict_free_timetable(self):
+        self.assertTrue(Scheduler(solver='backtracking').generate_timetable())
+        entries = TimetableEntry.query.all()
+        self.assertEqual(len(entries), 3 * (7 + 6 + 1))
+        assert_valid_timetable(self, entries)
+
+    def test_backtracking_fails_fast_without_lab_rooms(self):
+        problem = Scheduler().export_problem()
+        problem['lab_room_ids'] = []
+        stats = GenerationStats()
+        solver = TimetableSolver(problem, solver='backtracking', seed=0, stats=stats)
+        self.assertIsNone(solver.solve())
+        self.assertEqual(stats.failure['course_type'], 'Practical')
+        self.assertEqual(set(stats.failure['rejected']), {'room'})
+
+    def test_precheck_names_the_bottleneck_without_searching(self):
+        self.assertEqual(find_bottlenecks(Scheduler().export_problem()), [])
+        Classroom.query.filter_by(type='Lab').delete()
+        db.session.commit()
+        scheduler = Scheduler(solver='backtracking')
+        self.assertFalse(scheduler.generate_timetable())
+        self.assertEqual(TimetableEntry.query.count(), 0)
+        self.assertEqual(scheduler.stats.tried, 0)
+        self.assertIsNone(scheduler.stats.failure)
+        self.assertTrue(any('lab room' in b for b in scheduler.stats.bottlenecks))
+
+        problem = Scheduler().export_problem()
+        teacher_id = problem['requirements'][0].teacher_id
+        problem['requirements'].append(Requirement(problem['requirements'][0].dept_id, 999, teacher_id,
+                                                   'Theory', count=40))
+        issues = find_bottlenecks(problem, {'teacher': {teacher_id: 'Overloaded'}})
+        self.assertTrue(any(issue.startswith('Overloaded is allocated') for issue in issues))
+
+    def test_stats_record_phases_and_rejections(self):
+        scheduler = Scheduler(seed=4)
+        self.assertTrue(scheduler.generate_timetable())
+        stats = scheduler.stats.to_dict()
+        self.assertTrue({'fetch', 'main', 'activities', 'save'} <= set(stats['phases']))
+        self.assertGreaterEqual(stats['tried'], session_count(scheduler.requirements))
+        self.assertIsNone(stats['failure'])
+        self.assertEqual(stats['bottlenecks'], [])
+
+        problem = scheduler.export_problem()
+        problem['lab_room_ids'] = []
+        failed = GenerationStats()
+        self.assertIsNone(TimetableSolver(problem, seed=4, stats=failed).solve())
+        self.assertEqual(failed.failure['phase'], 'main')
+        self.assertEqual(failed.failure['rejected'], {'room': 12})
+
+    def test_parallel_attempts_persist_the_winner(self):
+        scheduler = Scheduler(attempts=3, workers=2, seed=11)
+        self.assertTrue(scheduler.generate_timetable())
+        self.assertIn(scheduler.seed, (11, 12, 13))
+        assert_valid_timetable(self, TimetableEntry.query.all())
+
+    def test_multistart_reports_failure_without_a_database(self):
+        problem = Scheduler().export_problem()
+        problem['lab_room_ids'] = []
+        self.assertEqual(solve_multistart(problem, attempts=2, workers=2), (None, None))
+
+    def test_failed_multistart_keeps_the_requested_seed(self):
+        # 13 periods exceed the course's cap of two a day; the precheck lets it through.
+        Course.query.filter_by(name='Theory A').update({'hours_per_week': 13})
+        db.session.commit()
+        scheduler = Scheduler(seed=11, attempts=2, workers=2, use_cache=False)
+        self.assertFalse(scheduler.generate_timetable())
+        self.assertEqual(scheduler.seed, 11)
+
+    def test_departments_without_shared_teachers_form_separate_clusters(self):
+        problem = Scheduler().export_problem()
+        self.assertEqual(len(find_clusters(problem)), 3)
+        shared = Teacher.query.first()
+        other = Course.query.filter(Course.dept_id != shared.dept_id, Course.type == 'Theory').first()
+        db.session.add(Allocation(course_id=other.id, teacher_id=shared.id))
+        Allocation.query.filter_by(course_id=other.id).filter(Allocation.teacher_id != shared.id).delete()
+        db.session.commit()
+        self.assertEqual(len(find_clusters(Scheduler().export_problem())), 2)
+
+    def test_decomposed_generation_reconciles_shared_rooms(self):
+        self.assertTrue(Scheduler(decompose=True, workers=1).generate_timetable())
+        entries = TimetableEntry.query.all()
+        self.assertEqual(len(entries), 3 * (7 + 6 + 1))
+        assert_valid_timetable(self, entries)
+
+    def test_reconcile_rooms_reports_overflow(self):
+        problem = {'lab_room_ids': [], 'theory_room_ids': [1]}
+        schedule = [(0, 0, 1, 10, 100, 1), (0, 0, 2, 20, 200, 1), (0, 1, 2, 20, 200, 1)]
+        packed, overflow = reconcile_rooms(schedule, problem)
+        # The longer session claims the room first; the other one overflows.
+        self.assertEqual(len(packed), 2)
+        self.assertEqual([run[0][2] for run in overflow], [1])
+
+    def test_scoped_regeneration_keeps_other_departments(self):
+        self.assertTrue(Scheduler(seed=1).generate_timetable())
+        target = Department.query.first()
+        def snapshot():
+            return sorted((e.day, e.timeslot, e.dept_id, e.course_id, e.teacher_id, e.classroom_id)
+                          for e in TimetableEntry.query.filter(TimetableEntry.dept_id != target.id))
+        before = snapshot()
+
+        scheduler = Scheduler(solver='backtracking', seed=2, dept_ids=[target.id])
+        self.assertEqual({r.dept_id for r in scheduler.requirements}, {target.id})
+        self.assertTrue(scheduler.generate_timetable())
+        self.assertEqual(snapshot(), before)
+        entries = TimetableEntry.query.all()
+        self.assertEqual(len(entries), 3 * (7 + 6 + 1))
+        assert_valid_timetable(self, entries)
+
+    def test_scope_matching_no_department_is_reported(self):
+        job, _ = start_generation({'solver': 'greedy', 'semester': 'Semester 9'}, background=False)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.message, EMPTY_SCOPE_MESSAGE)
+        self.assertTrue(Scheduler(dept_ids=[999]).empty_scope)
+        self.assertFalse(Scheduler(semester='Semester 1').empty_scope)
+
+    def test_generation_job_records_progress(self):
+        job, created = start_generation({'solver': 'backtracking', 'seed': 3}, background=False)
+        self.assertTrue(created)
+        status = job_to_dict(job)
+        self.assertEqual(status['status'], 'succeeded')
+        self.assertEqual(status['placed'], status['total'])
+        self.assertEqual(status['total'], session_count(Scheduler().requirements))
+        self.assertEqual(TimetableEntry.query.count(), 3 * (7 + 6 + 1))
+
+    def test_unchanged_inputs_restore_cached_result(self):
+        def snapshot():
+            return sorted((e.day, e.timeslot, e.dept_id, e.course_id, e.teacher_id, e.classroom_id)
+                          for e in TimetableEntry.query.all())
+        first = Scheduler(solver='backtracking')
+        self.assertTrue(first.generate_timetable())
+        self.assertFalse(first.cache_hit)
+        before = snapshot()
+
+        again = Scheduler(solver='backtracking')
+        self.assertTrue(again.generate_timetable())
+        self.assertTrue(again.cache_hit)
+        self.assertEqual(again.seed, first.seed)
+        self.assertEqual(snapshot(), before)
+
+        # Any change to the inputs misses the cache.
+        db.session.add(Classroom(name='Room extra', capacity=40, type='Classroom'))
+        db.session.commit()
+        changed = Scheduler(solver='backtracking')
+        self.assertTrue(changed.generate_timetable())
+        self.assertFalse(changed.cache_hit)
+
+    def test_cache_evicts_least_recently_used(self):
+        for i in range(result_cache.CACHE_SIZE + 3):
+            result_cache.store(f'key-{i}', i, [(0, 0, 1, 1, 1, 1)])
+        self.assertEqual(CachedSchedule.query.count(), result_cache.CACHE_SIZE)
+        self.assertIsNone(result_cache.lookup('key-0'))
+        self.assertEqual(result_cache.lookup(f'key-{result_cache.CACHE_SIZE + 2}')[0], result_cache.CACHE_SIZE + 2)
+
+    def test_optimizer_keeps_timetable_valid_and_never_worse(self):
+        scheduler = Scheduler(solver='backtracking', seed=5, optimize_seconds=0.2)
+        self.assertTrue(scheduler.generate_timetable())
+        stats = scheduler.optimize_stats
+        self.assertGreater(stats['moves'], 0)
+        self.assertLessEqual(stats['final_score'], stats['initial_score'])
+        entries = TimetableEntry.query.all()
+        self.assertEqual(len(entries), 3 * (7 + 6 + 1))
+        assert_valid_timetable(self, entries)
+
+    def test_snapshot_loads_in_a_fixed_number_of_queries(self):
+        statements = []
+        def count(*args):
+            statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            load_snapshot(with_entries=True)
+            small = len(statements)
+            seed_institution(num_depts=5, lab_rooms=0, theory_rooms=0)
+            del statements[:]
+            snapshot = load_snapshot(with_entries=True)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(len(statements), small)
+        self.assertEqual(len(snapshot.courses), 32)
+        self.assertEqual(sum(c.teacher_id is not None for c in snapshot.courses), 24)
+        with self.assertRaises(AttributeError):
+            snapshot.courses = ()
+        self.assertEqual(Scheduler(semester='Semester 9').requirements, [])
+
+    @unittest.skipUnless(importlib.util.find_spec('ortools'), "OR-Tools is not installed")
+    def test_exact_backend_solves_and_proves_infeasibility(self):
+        scheduler = Scheduler(solver='cpsat', seed=1, time_limit=20, workers=2)
+        self.assertTrue(scheduler.generate_timetable())
+        self.assertEqual(scheduler.stats.outcome, 'optimal')
+        entries = TimetableEntry.query.all()
+        self.assertEqual(len(entries), 3 * (4 + 3 + 2 * 3 + 1))
+        assert_valid_timetable(self, entries)
+
+        # Seven activity periods for six last periods: the model must prove it.
+        problem = scheduler.export_problem()
+        dept_id = problem['requirements'][0].dept_id
+        problem['requirements'].append(Requirement(dept_id, 999, None, 'Activity Class', count=6))
+        stats = GenerationStats()
+        self.assertIsNone(create_solver(problem, 'cpsat', stats=stats, time_limit=20).solve())
+        self.assertEqual(stats.outcome, 'infeasible')
+
+    def test_two_phase_solve_matches_real_rooms(self):
+        for solver in ('greedy', 'backtracking'):
+            scheduler = Scheduler(solver=solver, seed=3, two_phase=True, use_cache=False)
+            self.assertTrue(scheduler.generate_timetable())
+            self.assertIn('rooms', scheduler.stats.phases)
+            entries = TimetableEntry.query.all()
+            rooms = {r.id: r.type for r in Classroom.query.all()}
+            course_types = {c.id: c.type for c in Course.query.all()}
+            for e in entries:
+                self.assertEqual(rooms[e.classroom_id] == 'Lab', course_types[e.course_id] == 'Practical')
+            assert_valid_timetable(self, entries)
+
+    def test_partial_mode_saves_what_fits_and_lists_the_rest(self):
+        Classroom.query.filter_by(type='Lab').delete()
+        db.session.commit()
+        job, _ = start_generation({'solver': 'backtracking', 'seed': 1, 'partial': True, 'time_limit': 5},
+                                  background=False)
+        self.assertEqual(job.status, 'partial')
+        unplaced = job_to_dict(job)['stats']['unplaced']
+        self.assertEqual(len(unplaced), 3)
+        self.assertTrue(all(e['course_type'] == 'Practical' and e['sessions'] == 2 for e in unplaced))
+        entries = TimetableEntry.query.all()
+        self.assertEqual(len(entries), 3 * (4 + 3 + 1))
+        assert_valid_timetable(self, entries)
+        self.assertEqual(CachedSchedule.query.count(), 0)
+
+    def test_repair_replaces_only_the_orphaned_sessions(self):
+        self.assertTrue(Scheduler(seed=5, use_cache=False).generate_timetable())
+        lab = Classroom.query.filter_by(type='Lab').first()
+        before = {e.id: (e.day, e.timeslot, e.classroom_id) for e in TimetableEntry.query.all()
+                  if e.classroom_id != lab.id}
+        removed = removed_periods(TimetableEntry.classroom_id == lab.id)
+        db.session.delete(lab)
+        db.session.commit()
+
+        summary = repair_timetable(removed)
+        self.assertEqual(summary['unplaced'], {})
+        self.assertGreater(summary['placed'], 0)
+        entries = TimetableEntry.query.all()
+        self.assertEqual(len(entries), 3 * (7 + 6 + 1))
+        assert_valid_timetable(self, entries)
+        kept = sum(1 for e in entries if before.get(e.id) == (e.day, e.timeslot, e.classroom_id))
+        self.assertEqual(kept, len(before) - summary['moved'])
+        self.assertLessEqual(summary['moved'], 3 * summary['placed'])
+
+    def test_repair_keeps_activities_with_the_p6_teacher(self):
+        db.drop_all()
+        db.create_all()
+        generate_institution(departments=4, sections=2, seed=3)
+        db.session.commit()
+        self.assertTrue(Scheduler(seed=3, use_cache=False).generate_timetable())
+        types = {c.id: c.type for c in Course.query.all()}
+        activity_days = {(e.day, e.dept_id) for e in TimetableEntry.query.all()
+                         if types[e.course_id] == 'Activity Class'}
+        # Its P6 classes feed activities; repair used to hand those P6s to other teachers.
+        room = Classroom.query.filter_by(type='Classroom').first()
+        self.assertTrue(any((e.day, e.dept_id) in activity_days for e in TimetableEntry.query.filter_by(
+            classroom_id=room.id, timeslot=TIMESLOTS[LAST_PERIOD - 1])))
+        removed = removed_periods(TimetableEntry.classroom_id == room.id)
+        db.session.delete(room)
+        db.session.commit()
+
+        repair_timetable(removed)
+        entries = TimetableEntry.query.all()
+        assert_valid_timetable(self, entries)
+        p6 = {}
+        for e in entries:
+            if e.timeslot == TIMESLOTS[LAST_PERIOD - 1]:
+                p6.setdefault((e.day, e.dept_id), set()).add(e.teacher_id)
+        for e in entries:
+            if types[e.course_id] == 'Activity Class' and (e.day, e.dept_id) in p6:
+                self.assertIn(e.teacher_id, p6[(e.day, e.dept_id)])
+
+    def test_repair_leaves_sessions_it_did_not_remove_unscheduled(self):
+        self.assertTrue(Scheduler(seed=5, use_cache=False).generate_timetable())
+        dept = Department.query.first()
+        teacher = Teacher.query.filter_by(dept_id=dept.id).first()
+        course = Course(name='Elective', code='EL1', dept_id=dept.id, type='Theory', hours_per_week=2)
+        db.session.add(course)
+        db.session.flush()
+        db.session.add(Allocation(course_id=course.id, teacher_id=teacher.id))
+        room = Classroom.query.filter_by(type='Classroom').first()
+        removed = removed_periods(TimetableEntry.classroom_id == room.id)
+        db.session.delete(room)
+        db.session.commit()
+
+        summary = repair_timetable(removed)
+        self.assertNotIn(course.id, removed)
+        self.assertEqual(summary['placed'], sum(len(cells) for cells in removed.values()))
+        self.assertEqual(TimetableEntry.query.filter_by(course_id=course.id).count(), 0)
+        assert_valid_timetable(self, TimetableEntry.query.all())
+
+    def test_entry_index_answers_without_sql_and_follows_commits(self):
+        self.assertTrue(Scheduler(seed=2, use_cache=False).generate_timetable())
+        entry = TimetableEntry.query.first()
+        busy = entry_index.busy(entry.day, entry.timeslot, entry.teacher_id, entry.classroom_id, entry.dept_id)
+        self.assertIn(entry.id, busy['teacher'])
+        loads = entry_index.loads
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            busy = entry_index.busy(entry.day, entry.timeslot, entry.teacher_id, entry.classroom_id,
+                                    entry.dept_id, ignore_entry_id=entry.id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(statements, [])
+        self.assertNotIn(entry.id, busy['teacher'] + busy['room'] + busy['dept'])
+
+        # An ORM edit is applied in place once committed; a rollback leaves no trace.
+        old_slot, entry.timeslot = entry.timeslot, 'off-grid'
+        db.session.commit()
+        self.assertEqual(entry_index.busy(entry.day, old_slot, entry.teacher_id)['teacher'], [])
+        self.assertEqual(entry_index.loads, loads)
+        entry.timeslot = old_slot
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(entry_index.busy(entry.day, old_slot, entry.teacher_id)['teacher'], [])
+
+        # Bulk writes, such as a regeneration, trigger one reload.
+        TimetableEntry.query.delete()
+        db.session.commit()
+        self.assertEqual(entry_index.busy(entry.day, old_slot, entry.teacher_id, dept_id=entry.dept_id),
+                         {'teacher': [], 'room': [], 'dept': []})
+        self.assertEqual(entry_index.loads, loads + 2)
+
+    def test_alternatives_are_free_and_nearest_first(self):
+        self.assertTrue(Scheduler(seed=4, use_cache=False).generate_timetable())
+        entry = TimetableEntry.query.join(Course).filter(Course.type == 'Theory').first()
+        alternatives = find_alternatives(entry, Classroom.query.all(), limit=5)
+        self.assertEqual(len(alternatives), 5)
+        others = [e for e in TimetableEntry.query.all() if e.id != entry.id]
+        distances = []
+        for alt in alternatives:
+            self.assertEqual(alt['classroom'].type, entry.classroom.type)
+            taken = [e for e in others if (e.day, e.timeslot) == (alt['day'], alt['timeslot'])]
+            self.assertFalse(any(e.teacher_id == entry.teacher_id or e.dept_id == entry.dept_id
+                                 or e.classroom_id == alt['classroom'].id for e in taken))
+            distances.append(abs(DAYS.index(alt['day']) - DAYS.index(entry.day))
+                             + abs(TIMESLOTS.index(alt['timeslot']) - TIMESLOTS.index(entry.timeslot)))
+        self.assertEqual(distances, sorted(distances))
+
+    def test_change_tracking_reports_entry_moves_and_rollbacks(self):
+        self.assertTrue(Scheduler(seed=2, use_cache=False).generate_timetable())
+        seen = []
+        change_tracking.subscribe(seen.append)
+        self.addCleanup(change_tracking.unsubscribe, seen.append)
+        entry = TimetableEntry.query.first()
+        before = (entry.day, entry.timeslot, entry.dept_id, entry.teacher_id, entry.classroom_id)
+        entry.timeslot = TIMESLOTS[-1] if entry.timeslot != TIMESLOTS[-1] else TIMESLOTS[0]
+        db.session.flush()
+        self.assertEqual(change_tracking.pending(db.session).entries[entry.id][0], before)
+        db.session.commit()
+        self.assertEqual(len(seen), 1)
+        self.assertFalse(seen[0].rolled_back)
+        self.assertEqual(seen[0].entries, {entry.id: (before, before[:1] + (entry.timeslot,) + before[2:])})
+
+        Department.query.first().name = 'Renamed'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(len(seen), 2)
+        self.assertTrue(seen[1].rolled_back)
+        self.assertEqual(seen[1].resources, {('dept', Department.query.first().id)})
+
+        TimetableEntry.query.delete()
+        db.session.commit()
+        self.assertEqual(seen[2].bulk, {TimetableEntry.__tablename__})
+
+    def test_grid_cache_rebuilds_only_what_a_write_touches(self):
+        self.assertTrue(Scheduler(seed=6, use_cache=False).generate_timetable())
+        dept_ids = [d.id for d in grids.departments()]
+        weeks = grids.department_grids(dept_ids)
+        lab_cells = [cell for week in weeks.values() for slots in week.values() for cell in slots
+                     if cell['colspan'] == 3]
+        self.assertEqual(len(lab_cells), 3 * 2)
+        self.assertEqual(lab_cells[0]['entries'][0].classroom.type, 'Lab')
+
+        entry = TimetableEntry.query.filter_by(dept_id=dept_ids[0]).first()
+        grids.teacher_grid(entry.teacher_id)
+        builds = grids.builds
+        entry.day = 'Saturday' if entry.day != 'Saturday' else 'Monday'
+        db.session.commit()
+        self.assertIs(grids.department_grids(dept_ids[1:])[dept_ids[1]], weeks[dept_ids[1]])
+        self.assertEqual(grids.builds, builds)
+        self.assertIsNot(grids.department_grids(dept_ids[:1])[dept_ids[0]], weeks[dept_ids[0]])
+        grids.teacher_grid(entry.teacher_id)
+        self.assertEqual(grids.builds, builds + 2)
+
+        # Renaming a room drops every grid that shows it.
+        room = Classroom.query.get(entry.classroom_id)
+        room.name = 'Renamed'
+        db.session.commit()
+        names = {e.classroom.name for week in grids.department_grids(dept_ids).values()
+                 for slots in week.values() for cell in slots for e in cell['entries']}
+        self.assertIn('Renamed', names)
+
+    def test_timetable_api_sends_deltas_since_a_revision(self):
+        self.assertTrue(Scheduler(seed=8, use_cache=False).generate_timetable())
+        dept = Department.query.first()
+        revision = current_revision()
+        full = encode_timetable('department', dept.id, revision)
+        self.assertTrue(full['full'])
+        self.assertEqual(len(full['entries']), 7 + 6 + 1)
+        entry_id, day, slot, dept_id, course_id, teacher_id, room_id = full['entries'][0]
+        self.assertEqual(full['courses'][str(course_id)]['code'], Course.query.get(course_id).code)
+
+        unchanged = encode_timetable('department', dept.id, revision, since=revision)
+        self.assertEqual((unchanged['full'], unchanged['entries'], unchanged['removed']), (False, [], []))
+
+        moved = TimetableEntry.query.get(entry_id)
+        moved.timeslot = TIMESLOTS[(slot + 1) % len(TIMESLOTS)]
+        db.session.delete(TimetableEntry.query.get(full['entries'][1][0]))
+        db.session.commit()
+        self.assertGreater(current_revision(), revision)
+        delta = encode_timetable('department', dept.id, current_revision(), since=revision)
+        self.assertFalse(delta['full'])
+        self.assertEqual([e[:3] for e in delta['entries']], [[entry_id, day, (slot + 1) % len(TIMESLOTS)]])
+        self.assertEqual(delta['removed'], [full['entries'][1][0]])
+
+        # Regenerating resets the history, so older clients get everything.
+        self.assertTrue(Scheduler(seed=9, use_cache=False).generate_timetable())
+        self.assertTrue(encode_timetable('department', dept.id, current_revision(), since=revision)['full'])
+
+    def test_backend_options_are_filtered_per_solver(self):
+        problem = Scheduler().export_problem()
+        self.assertIsInstance(create_solver(problem, 'greedy', 1, time_limit=5), TimetableSolver)
+        self.assertEqual(create_solver(problem, 'cpsat', time_limit=5, workers=None).time_limit, 5)
+        with self.assertRaises(ValueError):
+            create_solver(problem, 'magic')
+
+    def test_unknown_solver_is_rejected(self):
+        with self.assertRaises(ValueError):
+            Scheduler(solver='magic')
+
+
+if __name__ == '__main__':
+    unittest.main()
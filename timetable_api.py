@@ -0,0 +1,89 @@
+"""
+Compact JSON encoding of a department's, teacher's or room's timetable.
+
+Entries are rows of integers, ``[id, day, slot, dept, course, teacher, room]``,
+with day and slot indexing the ``days`` and ``timeslots`` lists and the other
+ids resolved through the ``departments``, ``courses``, ``teachers`` and
+``rooms`` dictionaries sent alongside (string keys, as JSON requires).
+
+Every payload carries the `revisions` counter it was read at. A client that
+sends it back as ``since`` gets only the entries changed after it plus the ids
+of ``removed`` ones, or the full timetable (``"full": true``) when a delta is
+not possible. Payloads may include changes committed after their revision was
+read; applying an entry twice is harmless, so clients can simply replay.
+"""
+from models import db, TimetableEntry, Course, Teacher, Classroom, Department, DAYS, TIMESLOTS
+from occupancy import DAY_INDEX, SLOT_INDEX
+from revisions import changes_since
+
+API_VERSION = 1
+SCOPES = {
+    'department': (Department, TimetableEntry.dept_id),
+    'teacher': (Teacher, TimetableEntry.teacher_id),
+    'room': (Classroom, TimetableEntry.classroom_id),
+}
+FIELDS = ['id', 'day', 'slot', 'dept', 'course', 'teacher', 'room']
+
+
+def etag(scope, scope_id, revision, since=None):
+    """Strong validator for one scope at one revision (and delta base)."""
+    delta = f'-since{since}' if since is not None else ''
+    return f'v{API_VERSION}-{scope}-{scope_id}-r{revision}{delta}'
+
+
+def encode_timetable(scope, scope_id, revision, since=None):
+    """The payload for `scope`/`scope_id` in one query, as a JSON-ready dict."""
+    column = SCOPES[scope][1]
+    changed = changes_since(since)
+    payload = {
+        'version': API_VERSION,
+        'revision': revision,
+        'scope': {'type': scope, 'id': scope_id},
+        'full': changed is None,
+        'days': list(DAYS),
+        'timeslots': list(TIMESLOTS),
+        'fields': FIELDS,
+        'entries': [],
+        'departments': {},
+        'courses': {},
+        'teachers': {},
+        'rooms': {},
+    }
+    if changed is not None:
+        payload['removed'] = []
+        if not changed:
+            return payload
+
+    query = db.session.query(
+        TimetableEntry.id, TimetableEntry.day, TimetableEntry.timeslot,
+        Department.id, Department.name, Department.code, Department.section, Department.semester,
+        Course.id, Course.code, Course.name, Course.type,
+        Teacher.id, Teacher.name, Classroom.id, Classroom.name,
+    ).join(Department, Department.id == TimetableEntry.dept_id) \
+     .join(Course, Course.id == TimetableEntry.course_id) \
+     .outerjoin(Teacher, Teacher.id == TimetableEntry.teacher_id) \
+     .outerjoin(Classroom, Classroom.id == TimetableEntry.classroom_id) \
+     .filter(column == scope_id)
+    if changed is not None:
+        query = query.filter(TimetableEntry.id.in_(changed))
+
+    found = set()
+    for (entry_id, day, timeslot, dept_id, dept_name, dept_code, section, semester,
+         course_id, course_code, course_name, course_type,
+         teacher_id, teacher_name, room_id, room_name) in query.order_by(TimetableEntry.id):
+        if day not in DAY_INDEX or timeslot not in SLOT_INDEX:
+            continue
+        found.add(entry_id)
+        payload['entries'].append([entry_id, DAY_INDEX[day], SLOT_INDEX[timeslot],
+                                   dept_id, course_id, teacher_id, room_id])
+        payload['departments'][str(dept_id)] = {'name': dept_name, 'code': dept_code,
+                                                'section': section, 'semester': semester}
+        payload['courses'][str(course_id)] = {'code': course_code, 'name': course_name, 'type': course_type}
+        if teacher_id is not None:
+            payload['teachers'][str(teacher_id)] = teacher_name
+        if room_id is not None:
+            payload['rooms'][str(room_id)] = room_name
+    if changed is not None:
+        # Deleted, moved out of this scope, or never part of it: all safe to drop.
+        payload['removed'] = sorted(changed - found)
+    return payload